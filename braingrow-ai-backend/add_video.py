@@ -1,21 +1,38 @@
-from models import db, Video
+from models import db, Video, bumpCatalogVersion, youtubeVideoId
+from classifier import resolve_board_topic
+from import_progress import checkpoint_job, load_checkpoint, save_checkpoint, clear_checkpoint, read_lines, Progress
 from main import app
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+import os
+import re
 import time
 import argparse
 
+DEFAULT_BATCH_SIZE = 1000
+# Columns a re-import refreshes; counters, duration and ids stay as they are
+UPSERT_COLUMNS = ('title', 'description', 'url', 'tags', 'imageUrl', 'board', 'topic', 'topic_confidence')
+_SECTION_SPLIT_RE = re.compile(r'\s+[-–—]\s+')
+
 def add_video(title: str, description: str, url: str, tags: str, image_url: str):
     """Add a new video to the database"""
+    board, topic, topic_confidence = resolve_board_topic(title, description, tags)
     new_video = Video(
         title=title,
         description=description,
         url=url,
         tags=tags,
-        imageUrl=image_url
+        imageUrl=image_url,
+        board=board,
+        topic=topic,
+        topic_confidence=topic_confidence,
+        youtube_id=youtubeVideoId(url)
     )
 
     try:
         db.session.add(new_video)
         db.session.commit()
+        bumpCatalogVersion()
         print(f"Added: {title}")
         return new_video
     except Exception as e:
@@ -23,56 +40,181 @@ def add_video(title: str, description: str, url: str, tags: str, image_url: str)
         print(f"Error adding {title}: {str(e)}")
         return None
 
-def parse_video_file(filename):
-    topics = {}
-    current_topic = None
+def split_section(section):
+    """'math – equations' -> ('math', 'equations'); a header without a separator is a topic only."""
+    parts = _SECTION_SPLIT_RE.split(section.strip().lower(), maxsplit=1)
+    if len(parts) == 2:
+        return parts[0], parts[1]
+    return None, parts[0] or None
+
+def iter_video_file(filename, byte_offset=0, line_number=0, section=None):
+    """Stream (section, video_data, resume_point) from the file without holding it in memory.
+
+    resume_point is the (byte offset, line number) to continue reading from once
+    this entry is stored; pass it back with the entry's section to resume there.
+    """
+    current_topic = section
     current_video = None
+    line_start = (byte_offset, line_number)
+
+    for line_num, line, end_offset in read_lines(filename, byte_offset, line_number):
+        line = line.strip()
+        if line.startswith('===') and line.endswith('==='):
+            # New topic section
+            if current_topic and current_video:
+                yield current_topic, current_video, line_start
+            current_topic = line.strip('= ')
+            current_video = None
+        elif line.startswith('Video '):
+            # New video entry
+            if current_topic and current_video:
+                yield current_topic, current_video, line_start
+            current_video = {}
+        elif ': ' in line and current_video is not None:
+            # Video attribute
+            key, value = line.split(': ', 1)
+            key_lower = key.lower().replace(' ', '_')
+            current_video[key_lower] = value
+        line_start = (end_offset, line_num)
+    # Add the last video
+    if current_topic and current_video:
+        yield current_topic, current_video, line_start
 
-    with open(filename, 'r', encoding='utf-8') as f:
-        for line in f:
-            line = line.strip()
-            if line.startswith('===') and line.endswith('==='):
-                # New topic section
-                if current_topic and current_video:
-                    topics[current_topic].append(current_video)
-                current_topic = line.strip('= ')
-                topics[current_topic] = []
-                current_video = None
-            elif line.startswith('Video '):
-                # New video entry
-                if current_video:
-                    topics[current_topic].append(current_video)
-                current_video = {}
-            elif ': ' in line and current_video is not None:
-                # Video attribute
-                key, value = line.split(': ', 1)
-                key_lower = key.lower().replace(' ', '_')
-                current_video[key_lower] = value
-        # Add the last video
-        if current_topic and current_video:
-            topics[current_topic].append(current_video)
+def parse_video_file(filename):
+    topics = {}
+    for topic, video, _ in iter_video_file(filename):
+        topics.setdefault(topic, []).append(video)
     return topics
 
-def import_topic_videos(filename):
-    # Parse video details from file
-    topics = parse_video_file(filename)
+def video_row(topic, video_data):
+    """Row dict for the videos table, or None when a required field is missing."""
+    try:
+        url = video_data["url"]
+        # The section header is only a hint: rows get catalog boards/topics or none, never the raw
+        # header. It stays in tags, so classify_videos.py can still use it later
+        section_board, section_topic = split_section(topic)
+        board, section_topic, topic_confidence = resolve_board_topic(
+            video_data["title"], video_data["description"], video_data["tags"], section_board, section_topic,
+            keep_unmatched=False,
+        )
+        return {
+            'title': video_data["title"],
+            'description': video_data["description"],
+            'url': url,
+            'tags': f"{topic.lower()}, {video_data['tags']}",
+            'imageUrl': video_data["image_url"],
+            'board': board,
+            'topic': section_topic,
+            'topic_confidence': topic_confidence,
+            'youtube_id': youtubeVideoId(url),
+        }
+    except KeyError:
+        return None
+
+def _upsert_batch(rows, checkpoint=None):
+    """Write one batch (and its checkpoint) in a single transaction. Returns (inserted, updated, skipped)."""
+    table = Video.__table__
+    # Last occurrence wins for ids or urls repeated within the batch
+    keyed = {}
+    unkeyed = {}
+    for row in rows:
+        if row['youtube_id']:
+            keyed[row['youtube_id']] = row
+        else:
+            unkeyed[row['url']] = row
+    defaults = {'likes': 0, 'dislikes': 0, 'comment_count': 0}
+
+    with db.engine.begin() as conn:
+        updated = 0
+        if keyed:
+            updated = len(conn.execute(
+                select(table.c.id).where(table.c.youtube_id.in_(list(keyed)))
+            ).all())
+            stmt = sqlite_insert(table)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['youtube_id'],
+                set_={col: stmt.excluded[col] for col in UPSERT_COLUMNS},
+            )
+            conn.execute(stmt, [{**defaults, **row} for row in keyed.values()])
+        skipped = 0
+        if unkeyed:
+            # Not a YouTube URL: there is no canonical key, so only urls not stored yet are added
+            known = set(conn.execute(select(table.c.url).where(table.c.url.in_(list(unkeyed)))).scalars())
+            fresh = [{**defaults, **row} for url, row in unkeyed.items() if url not in known]
+            if fresh:
+                conn.execute(table.insert(), fresh)
+            skipped = len(unkeyed) - len(fresh)
+        if checkpoint:
+            save_checkpoint(conn, **checkpoint)
+    return len(keyed) - updated + len(unkeyed) - skipped, updated, skipped
+
+def ingest_videos(filename, batch_size=DEFAULT_BATCH_SIZE, resume=False):
+    """Stream the file into batched upserts keyed on youtube_id. Returns (inserted, updated, skipped).
+
+    Every batch records a checkpoint; with resume=True reading starts after the
+    last committed batch of an interrupted run.
+    """
+    job = checkpoint_job('videos', filename)
+    file_size = os.path.getsize(filename)
+    checkpoint = load_checkpoint(job, filename) if resume else None
+    if checkpoint:
+        print(f"Resuming at line {checkpoint['line_number']} after batch {checkpoint['batch_number']} "
+              f"({checkpoint['rows_done']} videos done)")
+    else:
+        clear_checkpoint(job)
+        checkpoint = {'byte_offset': 0, 'line_number': 0, 'batch_number': 0, 'rows_done': 0, 'state': {}}
+    batch_number = checkpoint['batch_number']
+    rows_done = checkpoint['rows_done']
+    progress = Progress('videos', file_size, checkpoint['byte_offset'], rows_done)
+    inserted = updated = skipped = 0
+    batch = []
+    resume_point, section = (checkpoint['byte_offset'], checkpoint['line_number']), checkpoint['state'].get('section')
+
+    def flush():
+        nonlocal inserted, updated, skipped, batch_number, rows_done
+        batch_number += 1
+        added, changed, known = _upsert_batch(batch, {
+            'job': job, 'file_size': file_size, 'byte_offset': resume_point[0], 'line_number': resume_point[1],
+            'batch_number': batch_number, 'rows_done': rows_done + len(batch), 'state': {'section': section},
+        })
+        inserted += added
+        updated += changed
+        skipped += known
+        rows_done += len(batch)
+        progress.update(resume_point[0], rows_done)
+        batch.clear()
+
+    for section, video_data, resume_point in iter_video_file(
+            filename, checkpoint['byte_offset'], checkpoint['line_number'], checkpoint['state'].get('section')):
+        row = video_row(section, video_data)
+        if row is None:
+            skipped += 1
+            print(f"Skipping incomplete entry in '{section}': {video_data.get('title', '?')}")
+            continue
+        batch.append(row)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    progress.update(file_size, rows_done, force=True)
+    clear_checkpoint(job)
+    if inserted or updated:
+        bumpCatalogVersion()
+    return inserted, updated, skipped
 
-    # Add videos for each topic
+def import_topic_videos(filename, batch_size=DEFAULT_BATCH_SIZE, resume=False):
     with app.app_context():
-        for topic, videos in topics.items():
-            print(f"\nAdding videos for: {topic}")
-            for video_data in videos:
-                add_video(
-                    title=video_data["title"],
-                    description=video_data["description"],
-                    url=video_data["url"],
-                    tags=f"{topic.lower()}, {video_data['tags']}",
-                    image_url=video_data["image_url"]
-                )
-                time.sleep(1)  # Prevent overwhelming the database
+        start = time.perf_counter()
+        inserted, updated, skipped = ingest_videos(filename, batch_size, resume)
+        elapsed = time.perf_counter() - start
+        total = inserted + updated
+        print(f"\nImported {total} videos ({inserted} new, {updated} updated, {skipped} skipped) "
+              f"in {elapsed:.1f}s, {total / max(elapsed, 1e-9):.0f} videos/s")
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Import videos from a text file into the database')
     parser.add_argument('filename', help='Path to the text file containing video details')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Videos upserted per transaction')
+    parser.add_argument('--resume', action='store_true', help='Continue an interrupted import from its last committed batch')
     args = parser.parse_args()
-    import_topic_videos(args.filename)
\ No newline at end of file
+    import_topic_videos(args.filename, args.batch_size, args.resume)
@@ -0,0 +1,127 @@
+"""
+Verified-principal cache for bearer tokens and session logins.
+
+A Principal is the small immutable part of a user the auth paths need (id,
+username, photoUrl). bearer_principal() verifies a request's JWT once, loads
+the user once, and caches the principal under sha256(token) until the token's
+exp. Later requests with the same token skip both signature verification and
+the users lookup. session_principal() caches principals by user id for
+session logins.
+
+Both caches are per process and dropped whenever the 'users' version stamp
+changes, which updateUserProfile and clear_users.py bump. The result is also
+memoized on `g`, so code paths within one request (and /api/batch sub-requests)
+resolve auth once.
+
+Only a user that does not exist makes a principal None. Database errors
+propagate, so an outage is a 5xx rather than a 401 that logs clients out.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import jwt
+from flask import current_app, g, request
+
+from models import db, User, USERS_VERSION
+from versions import current_version
+
+Principal = namedtuple('Principal', ['id', 'username', 'photoUrl'])
+
+# Principals for tokens without an exp claim, and for session logins, are rechecked this often
+DEFAULT_TTL = 300
+
+try:
+    MAX_ENTRIES = int(os.getenv('AUTH_CACHE_SIZE', '10000'))
+except ValueError:
+    MAX_ENTRIES = 10000
+
+
+class PrincipalCache:
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._items = OrderedDict()  # key -> (principal, expires at)
+        self._version = None
+
+    def get(self, key):
+        version = current_version(USERS_VERSION)
+        with self._lock:
+            if version != self._version:
+                self._items.clear()
+                self._version = version
+                return None
+            entry = self._items.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, principal, expires_at):
+        with self._lock:
+            self._items[key] = (principal, expires_at)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+
+_token_cache = PrincipalCache()
+_user_cache = PrincipalCache()
+
+
+def _load_principal(user_id):
+    # Not userProfile(): it turns database errors into None, which would read as "no such user"
+    user = db.session.get(User, user_id)
+    if not user:
+        return None
+    return Principal(user.id, user.username or user.email, user.photoUrl)
+
+
+def _verify_token(token):
+    key = hashlib.sha256(token.encode('utf-8')).hexdigest()
+    principal = _token_cache.get(key)
+    if principal is not None:
+        return principal, None
+    try:
+        data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=["HS256"])
+    except jwt.ExpiredSignatureError:
+        return None, 'TOKEN_EXPIRED'
+    except jwt.InvalidTokenError:
+        return None, 'INVALID_TOKEN'
+    principal = _load_principal(data['user_id']) if data.get('user_id') is not None else None
+    if principal is None:
+        return None, 'INVALID_TOKEN'
+    _token_cache.put(key, principal, data.get('exp') or time.time() + DEFAULT_TTL)
+    return principal, None
+
+
+def bearer_principal():
+    """(principal, error) for the request's Bearer token; (None, None) without one.
+
+    error is 'TOKEN_EXPIRED' or 'INVALID_TOKEN'.
+    """
+    header = request.headers.get('Authorization')
+    if not header or not header.startswith('Bearer '):
+        return None, None
+    cached = getattr(g, '_bearer_principal', None)
+    if cached and cached[0] == header:
+        return cached[1]
+    result = _verify_token(header[7:])
+    g._bearer_principal = (header, result)
+    return result
+
+
+def session_principal(user_id):
+    """Principal for a session-authenticated user id, or None if the user no longer exists."""
+    principal = _user_cache.get(user_id)
+    if principal is None:
+        principal = _load_principal(user_id)
+        if principal is not None:
+            _user_cache.put(user_id, principal, time.time() + DEFAULT_TTL)
+    return principal
@@ -0,0 +1,81 @@
+"""
+Small helper for per-process background jobs (buffer flushes, sweeps).
+
+A PeriodicTask calls its function every `interval` seconds on a daemon thread,
+inside an app context. By default it runs once more at interpreter shutdown so
+buffered writes are not lost when a worker exits.
+
+exclusive_job(path) lets one process on a host run a shared job (snapshot
+rebuilds, thumbnail prefetch) while the others skip it. It uses flock on
+path, so the kernel releases the lock when its holder exits or crashes. There
+are no stale lock files to break, and no holder can remove another's lock.
+"""
+
+import atexit
+import os
+import threading
+import traceback
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # not POSIX: no cross-process lock, every process runs the job
+    fcntl = None
+
+
+class PeriodicTask:
+    def __init__(self, app, name, interval, fn, run_at_exit=True):
+        self.app = app
+        self.name = name
+        self.interval = interval
+        self.fn = fn
+        self.run_at_exit = run_at_exit
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+        return self
+
+    def run_once(self):
+        try:
+            with self.app.app_context():
+                self.fn()
+        except Exception as e:
+            print(f"Error in background task {self.name}: {e}")
+            traceback.print_exc()
+
+    def stop(self):
+        if self._thread is None or self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join(self.interval + 5)
+        if self.run_at_exit:
+            self.run_once()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+
+@contextmanager
+def exclusive_job(path):
+    """Yield True while holding the host-wide lock on path, or False when another process holds it."""
+    if fcntl is None:
+        yield True
+        return
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    fd = os.open(path, os.O_CREAT | os.O_RDWR, 0o644)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        yield True
+    finally:
+        # Closing the descriptor releases the lock; the file itself stays for the next run
+        os.close(fd)
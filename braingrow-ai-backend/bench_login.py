@@ -0,0 +1,112 @@
+"""
+Login throughput benchmark for the password hashing pool.
+
+Runs the same workload once with hashing inline on the request threads
+(PASSWORD_WORKERS=0) and once on the process pool. Each run uses a scratch
+database in a fresh process: several threads post /api/login through the Flask
+test client while a probe thread measures /api/hello latency, which shows how
+much a login burst slows unrelated endpoints. Logins rejected with 503
+(pool queue full) are counted separately.
+
+    python bench_login.py --threads 16 --seconds 10 --pool-workers 2
+"""
+
+import argparse
+import multiprocessing
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+USERS = 20
+PASSWORD = 'bench-password'
+
+
+def _run(mode_workers, args, results):
+    with tempfile.TemporaryDirectory() as tmp:
+        # Configure before importing main so the app and the pool pick these up
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        os.environ['PASSWORD_WORKERS'] = str(mode_workers)
+        os.environ['PASSWORD_MAX_PENDING'] = str(args.max_pending)
+        os.environ['VERSION_DIR'] = os.path.join(tmp, 'versions')
+        os.environ['AUTO_MIGRATE'] = '1'
+        os.environ['CATALOG_SNAPSHOT_SECONDS'] = '0'
+        from main import app
+        from models import db, User
+        from password_service import hash_password, password_service
+
+        with app.app_context():
+            hashed = hash_password(PASSWORD)
+            db.session.add_all([User(username=f'bench{i}', email=f'bench{i}@example.com', password=hashed)
+                                for i in range(USERS)])
+            db.session.commit()
+
+        counts = {'ok': 0, 'busy': 0, 'failed': 0}
+        latencies = []
+        lock = threading.Lock()
+        stop = threading.Event()
+
+        def login_loop(n):
+            client = app.test_client()
+            local = {'ok': 0, 'busy': 0, 'failed': 0}
+            i = n
+            while not stop.is_set():
+                status = client.post('/api/login', json={'email': f'bench{i % USERS}@example.com',
+                                                         'password': PASSWORD}).status_code
+                local['ok' if status == 200 else 'busy' if status == 503 else 'failed'] += 1
+                i += 1
+            with lock:
+                for k, v in local.items():
+                    counts[k] += v
+
+        def probe_loop():
+            client = app.test_client()
+            while not stop.is_set():
+                start = time.perf_counter()
+                client.get('/api/hello')
+                latencies.append((time.perf_counter() - start) * 1000)
+                time.sleep(0.01)
+
+        # Warm the pool so process start-up is not timed
+        password_service.verify_password(hashed, PASSWORD)
+        threads = [threading.Thread(target=login_loop, args=(n,)) for n in range(args.threads)]
+        threads.append(threading.Thread(target=probe_loop))
+        for t in threads:
+            t.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for t in threads:
+            t.join()
+        password_service.shutdown()
+
+    latencies.sort()
+    counts['p50'] = statistics.median(latencies) if latencies else 0.0
+    counts['p99'] = latencies[int(len(latencies) * 0.99)] if latencies else 0.0
+    results.put(counts)
+
+
+def run_mode(workers, args):
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    proc = ctx.Process(target=_run, args=(workers, args, results))
+    proc.start()
+    counts = results.get()
+    proc.join()
+    return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark concurrent logins with inline vs pooled password hashing')
+    parser.add_argument('--threads', type=int, default=16, help='Concurrent login clients')
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--pool-workers', type=int, default=2, help='PASSWORD_WORKERS for the pooled run')
+    parser.add_argument('--max-pending', type=int, default=32, help='PASSWORD_MAX_PENDING for the pooled run')
+    args = parser.parse_args()
+
+    print(f"{args.threads} login threads, {args.seconds:.0f}s")
+    print(f"{'mode':<10}{'logins/s':>10}{'503s':>8}{'failed':>8}{'hello p50 ms':>14}{'hello p99 ms':>14}")
+    for label, workers in (('inline', 0), ('pool', args.pool_workers)):
+        c = run_mode(workers, args)
+        print(f"{label:<10}{c['ok'] / args.seconds:>10.1f}{c['busy']:>8}{c['failed']:>8}"
+              f"{c['p50']:>14.1f}{c['p99']:>14.1f}")
@@ -0,0 +1,134 @@
+"""
+Mixed read/write throughput benchmark for the SQLite storage profile.
+
+Runs the same workload twice against a scratch database: once with SQLite's
+defaults (rollback journal, synchronous=FULL, default pool) and once with the
+production profile from storage.py. Several processes (like gunicorn workers),
+each with several threads, issue a mix of reads (video lookup + watch-history
+scan) and writes (watch-history insert + commit).
+
+    python bench_sqlite.py --workers 4 --threads 4 --seconds 10 --write-ratio 0.2
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from models import db
+import storage
+
+READ_VIDEO = text('SELECT id, title, url, imageUrl, board, topic FROM videos WHERE id = :id')
+READ_HISTORY = text('SELECT id, video_id, watched_at, progress FROM watch_histories '
+                    'WHERE user_id = :uid ORDER BY watched_at DESC LIMIT 50')
+WRITE_HISTORY = text('INSERT INTO watch_histories (user_id, video_id, watched_at, progress, focus_sample) '
+                     'VALUES (:uid, :vid, :ts, :p, :f)')
+
+
+def make_engine(uri, profile):
+    os.environ['SQLITE_PROFILE'] = profile
+    engine = create_engine(uri, **storage.engine_options(uri))
+    storage.install_sqlite_pragmas(engine)
+    return engine
+
+
+def seed(uri, videos, users):
+    engine = create_engine(uri)
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text('INSERT INTO users (username, password) VALUES (:u, :p)'),
+                     [{'u': f'user{i}', 'p': 'x'} for i in range(users)])
+        conn.execute(text('INSERT INTO videos (title, description, url, tags, imageUrl, likes, dislikes, comment_count) '
+                          'VALUES (:t, :d, :u, :g, :i, 0, 0, 0)'),
+                     [{'t': f'Video {i}', 'd': 'd' * 500, 'u': f'https://youtu.be/{i}', 'g': 'math', 'i': 'img'}
+                      for i in range(videos)])
+        conn.execute(WRITE_HISTORY, [{'uid': random.randint(1, users), 'vid': random.randint(1, videos),
+                                      'ts': datetime.utcnow(), 'p': random.random(), 'f': None}
+                                     for _ in range(videos * 5)])
+    engine.dispose()
+
+
+def _worker(uri, profile, threads, seconds, write_ratio, videos, users, start_event, results):
+    engine = make_engine(uri, profile)
+    counts = {'reads': 0, 'writes': 0, 'locked': 0}
+    lock = threading.Lock()
+
+    def run():
+        rng = random.Random()
+        local = {'reads': 0, 'writes': 0, 'locked': 0}
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            try:
+                if rng.random() < write_ratio:
+                    with engine.begin() as conn:
+                        conn.execute(WRITE_HISTORY, {'uid': rng.randint(1, users), 'vid': rng.randint(1, videos),
+                                                     'ts': datetime.utcnow(), 'p': rng.random(), 'f': rng.random()})
+                    local['writes'] += 1
+                else:
+                    with engine.connect() as conn:
+                        conn.execute(READ_VIDEO, {'id': rng.randint(1, videos)}).fetchall()
+                        conn.execute(READ_HISTORY, {'uid': rng.randint(1, users)}).fetchall()
+                    local['reads'] += 1
+            except OperationalError as e:
+                if 'locked' not in str(e):
+                    raise
+                local['locked'] += 1
+        with lock:
+            for k, v in local.items():
+                counts[k] += v
+
+    start_event.wait()
+    pool = [threading.Thread(target=run) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    engine.dispose()
+    results.put(counts)
+
+
+def run_profile(profile, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        uri = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        seed(uri, args.videos, args.users)
+        ctx = multiprocessing.get_context('spawn')
+        start_event = ctx.Event()
+        results = ctx.Queue()
+        procs = [ctx.Process(target=_worker, args=(uri, profile, args.threads, args.seconds, args.write_ratio,
+                                                   args.videos, args.users, start_event, results))
+                 for _ in range(args.workers)]
+        for p in procs:
+            p.start()
+        time.sleep(1.0)  # let workers import and connect before the clock starts
+        start_event.set()
+        totals = {'reads': 0, 'writes': 0, 'locked': 0}
+        for _ in procs:
+            for k, v in results.get().items():
+                totals[k] += v
+        for p in procs:
+            p.join()
+    return totals
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark mixed SQLite read/write throughput before/after the storage profile')
+    parser.add_argument('--workers', type=int, default=4, help='Processes, like gunicorn workers')
+    parser.add_argument('--threads', type=int, default=4, help='Threads per worker')
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--videos', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{args.workers} workers x {args.threads} threads, {args.seconds:.0f}s, {args.write_ratio:.0%} writes")
+    print(f"{'profile':<12}{'reads/s':>10}{'writes/s':>10}{'locked':>8}")
+    for profile in ('default', 'production'):
+        t = run_profile(profile, args)
+        print(f"{profile:<12}{t['reads'] / args.seconds:>10.0f}{t['writes'] / args.seconds:>10.0f}{t['locked']:>8}")
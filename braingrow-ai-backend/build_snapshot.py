@@ -0,0 +1,18 @@
+import argparse
+import time
+from main import app
+from catalog_snapshot import build_snapshot, snapshot_path, snapshot_interval
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the shared memory-mapped video catalog snapshot')
+    parser.add_argument('--out', default=None, help='Snapshot file (default: the path the app serves from)')
+    args = parser.parse_args()
+
+    if not args.out and snapshot_interval() <= 0:
+        raise SystemExit('Catalog snapshot is disabled (CATALOG_SNAPSHOT_SECONDS=0); pass --out')
+    # main configures the default path at import, the same one the app serves from
+    path = args.out or snapshot_path()
+    with app.app_context():
+        start = time.perf_counter()
+        count = build_snapshot(path)
+        print(f"Wrote {count} videos to {path} in {time.perf_counter() - start:.2f}s")
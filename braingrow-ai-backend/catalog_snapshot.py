@@ -0,0 +1,244 @@
+"""
+Memory-mapped snapshot of the video catalog shared by all workers on a host.
+
+build_snapshot() serializes the videos table into one fixed-layout file
+(little-endian):
+
+    header    magic, format, record count, code count, catalog version, section offsets
+    ids       int64 per video, sorted; binary-searched for lookups
+    records   per video: (offset, length) into the string pool for title,
+              description, url, tags and imageUrl, board and topic codes, duration
+    codes     (offset, length) per distinct board/topic string
+    pool      UTF-8 strings, each distinct value stored once
+
+Workers open the file with mmap, so every process reads the same page-cache
+pages: memory stays flat as workers are added and a new worker is warm as soon
+as it opens the file. A snapshot carries the catalog version (versions.py) it
+was built from and is only used while that version is current; writers bump
+the version, a background task rebuilds the file and swaps it in with
+os.replace, and readers reopen it when they see the new version. Until then
+lookups fall back to the per-process video cache.
+
+Settings: CATALOG_SNAPSHOT_PATH, CATALOG_SNAPSHOT_SECONDS (rebuild check
+interval, default 10; 0 disables the snapshot).
+"""
+
+import bisect
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+from background import PeriodicTask, exclusive_job
+from versions import current_version, CHECK_INTERVAL
+from video_cache import VideoRecord, CATALOG_VERSION
+
+MAGIC = b'BGCS'
+FORMAT = 1
+HEADER = struct.Struct('<4sHHII32sQQQQ')
+RECORD = struct.Struct('<10IHHi')
+CODE = struct.Struct('<II')
+ID = struct.Struct('<q')
+NO_CODE = 0xFFFF
+# Offset marker for NULL strings (an empty string is offset 0, length 0)
+NO_STRING = 0xFFFFFFFF
+STRING_FIELDS = ('title', 'description', 'url', 'tags', 'imageUrl')
+
+_path = None
+_snapshot = None
+_last_open_check = 0.0
+_open_lock = threading.Lock()
+
+
+class CatalogSnapshot:
+    """Read-only view of a snapshot file; records are decoded on access."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, fmt, _, self.count, n_codes, version,
+         self._ids_off, self._records_off, codes_off, self._pool_off) = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or fmt != FORMAT:
+            raise ValueError(f'{path} is not a catalog snapshot (format {FORMAT})')
+        self.catalog_version = version.rstrip(b'\0').decode('ascii')
+        if sys.byteorder == 'little':
+            # Zero-copy view of the sorted id column
+            self._ids = memoryview(self._mm)[self._ids_off:self._ids_off + 8 * self.count].cast('q')
+        else:
+            self._ids = [ID.unpack_from(self._mm, self._ids_off + 8 * i)[0] for i in range(self.count)]
+        self._codes = [self._string(*CODE.unpack_from(self._mm, codes_off + CODE.size * i)) for i in range(n_codes)]
+
+    def _string(self, offset, length):
+        start = self._pool_off + offset
+        return self._mm[start:start + length].decode('utf-8')
+
+    def _record(self, index):
+        fields = RECORD.unpack_from(self._mm, self._records_off + RECORD.size * index)
+        strings = [None if fields[i] == NO_STRING else self._string(fields[i], fields[i + 1])
+                   for i in range(0, 10, 2)]
+        board, topic, duration = fields[10:]
+        return VideoRecord(
+            self._ids[index], *strings,
+            self._codes[board] if board != NO_CODE else None,
+            self._codes[topic] if topic != NO_CODE else None,
+            duration if duration >= 0 else None,
+        )
+
+    def get(self, video_id):
+        index = bisect.bisect_left(self._ids, video_id)
+        if index < self.count and self._ids[index] == video_id:
+            return self._record(index)
+        return None
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self._record(index)
+
+
+def build_snapshot(path, chunk_size=5000):
+    """Write the current videos table to path atomically. Returns the number of videos."""
+    from models import db, Video
+
+    # Read the version before the rows: a write racing the build leaves the
+    # snapshot tagged with the older version, so it is rebuilt on the next check.
+    version = current_version(CATALOG_VERSION, fresh=True)
+    table = Video.__table__
+    pool = bytearray()
+    pooled = {}
+    codes = []
+    code_index = {}
+
+    def string_ref(value):
+        if value is None:
+            return NO_STRING, 0
+        ref = pooled.get(value)
+        if ref is None:
+            data = value.encode('utf-8')
+            ref = pooled[value] = (len(pool), len(data))
+            pool.extend(data)
+        return ref
+
+    def code(value):
+        if value is None:
+            return NO_CODE
+        if value not in code_index:
+            code_index[value] = len(codes)
+            codes.append(string_ref(value))
+        return code_index[value]
+
+    ids = bytearray()
+    records = bytearray()
+    result = db.session.execute(
+        db.select(table.c.id, *[table.c[f] for f in STRING_FIELDS], table.c.board, table.c.topic, table.c.duration)
+        .order_by(table.c.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    count = 0
+    for row in result:
+        refs = [part for f in STRING_FIELDS for part in string_ref(getattr(row, f))]
+        ids += ID.pack(row.id)
+        records += RECORD.pack(*refs, code(row.board), code(row.topic),
+                               row.duration if row.duration is not None else -1)
+        count += 1
+    result.close()
+    if len(codes) >= NO_CODE:
+        raise ValueError('Too many distinct boards/topics for a catalog snapshot')
+
+    codes_blob = b''.join(CODE.pack(*ref) for ref in codes)
+    ids_off = HEADER.size
+    records_off = ids_off + len(ids)
+    codes_off = records_off + len(records)
+    pool_off = codes_off + len(codes_blob)
+    header = HEADER.pack(MAGIC, FORMAT, 0, count, len(codes), version.encode('ascii'),
+                         ids_off, records_off, codes_off, pool_off)
+
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(header)
+        f.write(ids)
+        f.write(records)
+        f.write(codes_blob)
+        f.write(pool)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return count
+
+
+def _read_version(path):
+    try:
+        with open(path, 'rb') as f:
+            magic, fmt, _, _, _, version = HEADER.unpack(f.read(HEADER.size))[:6]
+    except (OSError, struct.error):
+        return None
+    if magic != MAGIC or fmt != FORMAT:
+        return None
+    return version.rstrip(b'\0').decode('ascii')
+
+
+def refresh_snapshot(path=None):
+    """Rebuild the snapshot if it is missing or older than the catalog. Returns the video count, or None if skipped."""
+    path = path or _path
+    if _read_version(path) == current_version(CATALOG_VERSION, fresh=True):
+        return None
+    # One worker rebuilds at a time; the others keep using their fallback until it lands
+    with exclusive_job(path + '.lock') as acquired:
+        if not acquired:
+            return None
+        # Another worker's rebuild may have landed between the check above and taking the lock
+        if _read_version(path) == current_version(CATALOG_VERSION, fresh=True):
+            return None
+        return build_snapshot(path)
+
+
+def snapshot_path():
+    return _path
+
+
+def current_snapshot():
+    """The open snapshot if it matches the current catalog version, else None (callers fall back)."""
+    global _snapshot, _last_open_check
+    if _path is None:
+        return None
+    version = current_version(CATALOG_VERSION)
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.catalog_version == version:
+        return snapshot
+    now = time.monotonic()
+    with _open_lock:
+        if now - _last_open_check < CHECK_INTERVAL:
+            return None
+        _last_open_check = now
+        try:
+            snapshot = CatalogSnapshot(_path)
+        except (OSError, ValueError):
+            return None
+        # Old mappings are released once no reader holds them
+        _snapshot = snapshot
+    return snapshot if snapshot.catalog_version == version else None
+
+
+def snapshot_interval():
+    try:
+        return float(os.getenv('CATALOG_SNAPSHOT_SECONDS', '10'))
+    except ValueError:
+        return 10.0
+
+
+def configure_snapshot(path):
+    """Serve the snapshot from CATALOG_SNAPSHOT_PATH (or path); None if CATALOG_SNAPSHOT_SECONDS=0 disables it."""
+    global _path
+    _path = (os.getenv('CATALOG_SNAPSHOT_PATH') or path) if snapshot_interval() > 0 else None
+    return _path
+
+
+def start_catalog_snapshot(app):
+    """Keep rebuilding the configured snapshot in the background; None if it is disabled."""
+    if _path is None:
+        return None
+    return PeriodicTask(app, 'catalog-snapshot', snapshot_interval(), refresh_snapshot, run_at_exit=False).start()
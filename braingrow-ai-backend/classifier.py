@@ -0,0 +1,131 @@
+"""
+Board/topic classification against VIDEO_TAG_CATALOG.
+
+Every board name, topic name and keyword in the catalog is compiled once into a
+single case-insensitive regex. classify_video() runs that matcher over a
+video's tags, title and description, with the fields weighted in that order.
+Each hit adds to the scores of the catalog topics the term belongs to. A topic
+name counts TOPIC_WEIGHT, a keyword KEYWORD_WEIGHT, and a board name
+BOARD_WEIGHT for every topic on that board. The best topic wins. Its confidence
+is its share of all points scored, so a video that mentions several subjects
+gets a low confidence.
+
+addVideo/addVideoDetailed and add_video.py classify on insert.
+classify_videos.py backfills existing rows in parallel with classify_chunk().
+This module imports only the tag catalog, so the backfill's worker processes
+stay light.
+"""
+
+import re
+from collections import namedtuple
+
+from tags import VIDEO_TAG_CATALOG
+
+Classification = namedtuple('Classification', ['board', 'topic', 'confidence'])
+UNCLASSIFIED = Classification(None, None, 0.0)
+
+TOPIC_WEIGHT = 3.0
+KEYWORD_WEIGHT = 1.0
+BOARD_WEIGHT = 0.5
+FIELD_WEIGHTS = (('tags', 2.0), ('title', 2.0), ('description', 1.0))
+# Below this many points a video is left unclassified rather than guessed
+MIN_SCORE = 2.0
+
+BOARDS = frozenset(VIDEO_TAG_CATALOG)
+# Topic names are unique across boards in the catalog
+TOPIC_BOARDS = {topic: board for board, topics in VIDEO_TAG_CATALOG.items() for topic in topics}
+
+
+def _build_terms(catalog):
+    terms = {}
+
+    def add(term, key, weight):
+        terms.setdefault(term.lower(), []).append((key, weight))
+
+    for board, topics in catalog.items():
+        for topic, keywords in topics.items():
+            key = (board, topic)
+            add(topic, key, TOPIC_WEIGHT)
+            add(board, key, BOARD_WEIGHT)
+            for keyword in keywords:
+                add(keyword, key, KEYWORD_WEIGHT)
+    return terms
+
+
+_TERMS = _build_terms(VIDEO_TAG_CATALOG)
+# Longest terms first so "differential equations" wins over "equations";
+# the lookarounds stand in for \b, which fails next to symbols as in "c++"
+_MATCHER = re.compile(
+    r'(?<![\w])(' + '|'.join(re.escape(term) for term in sorted(_TERMS, key=len, reverse=True)) + r')(?![\w])',
+    re.IGNORECASE,
+)
+
+
+def classify_text(weighted_texts):
+    """Classify [(text, weight), ...] and return a Classification."""
+    scores = {}
+    for text, weight in weighted_texts:
+        if not text:
+            continue
+        for match in _MATCHER.finditer(text):
+            for key, term_weight in _TERMS[match.group(1).lower()]:
+                scores[key] = scores.get(key, 0.0) + term_weight * weight
+    if not scores:
+        return UNCLASSIFIED
+    (board, topic), best = max(scores.items(), key=lambda item: item[1])
+    if best < MIN_SCORE:
+        return UNCLASSIFIED
+    return Classification(board, topic, round(best / sum(scores.values()), 3))
+
+
+def _weighted_fields(title, description, tags):
+    fields = {'title': title, 'description': description, 'tags': tags}
+    return [(fields[name], weight) for name, weight in FIELD_WEIGHTS]
+
+
+def classify_video(title=None, description=None, tags=None):
+    return classify_text(_weighted_fields(title, description, tags))
+
+
+def catalog_classification(board, topic):
+    """A Classification for an explicit board/topic that names a catalog topic, else None."""
+    topic = (topic or '').strip().lower()
+    expected_board = TOPIC_BOARDS.get(topic)
+    if expected_board is None or (board and board.strip().lower() != expected_board):
+        return None
+    return Classification(expected_board, topic, 1.0)
+
+
+def resolve_board_topic(title=None, description=None, tags=None, board=None, topic=None, keep_unmatched=True):
+    """Board, topic and confidence for a new video.
+
+    An explicit catalog topic is kept with confidence 1.0. Otherwise the text is
+    classified, and explicit values that are not catalog topics count as extra
+    evidence. If nothing matches, the explicit values are kept with confidence 0,
+    or dropped with keep_unmatched=False so only catalog values are stored.
+    """
+    explicit = catalog_classification(board, topic)
+    if explicit:
+        return explicit
+    hint = ' '.join(part for part in (board, topic) if part)
+    result = classify_text([(hint, TOPIC_WEIGHT)] + _weighted_fields(title, description, tags))
+    if result.topic is None and (board or topic) and keep_unmatched:
+        return Classification(board, topic, 0.0)
+    return result
+
+
+def classify_chunk(rows):
+    """[(id, title, description, tags, board, topic, confidence)] -> update params. Runs in backfill workers."""
+    results = []
+    for video_id, title, description, tags, board, topic, confidence in rows:
+        hint_board, hint_topic = board, topic
+        if confidence:
+            # Earlier classifier output: reclassify from the text alone. Confidence 0
+            # rows hold the importer's own board/topic, which stay as hints.
+            hint_board = hint_topic = None
+        new_board, new_topic, new_confidence = resolve_board_topic(title, description, tags, hint_board, hint_topic)
+        if new_topic is None and (board or topic):
+            # Nothing matched: never replace stored values with NULL
+            new_board, new_topic, new_confidence = board, topic, confidence if confidence is not None else 0.0
+        results.append({'b_id': video_id, 'b_board': new_board, 'b_topic': new_topic, 'b_confidence': new_confidence})
+    return results
@@ -0,0 +1,94 @@
+"""
+Backfill board/topic/topic_confidence for existing videos with the catalog classifier.
+
+Rows are read in id order in --chunk-size pages and classified on --workers
+processes. Each chunk's results are written back in one executemany
+transaction. By default only rows that were never classified
+(topic_confidence IS NULL) are processed, and their existing board/topic count
+as hints. --all also reclassifies earlier classifier output (confidence < 1).
+Rows at confidence 0 hold the importer's own non-catalog board/topic, which
+stay as hints. A row the classifier cannot place keeps its stored values.
+Topics set explicitly to a catalog topic (confidence 1.0) are never touched.
+
+    python classify_videos.py --workers 4 --chunk-size 2000
+"""
+
+import argparse
+import multiprocessing
+import os
+import time
+from collections import deque
+
+from sqlalchemy import or_, select, update, bindparam
+
+from models import db, Video, bumpCatalogVersion
+from classifier import classify_chunk
+
+DEFAULT_CHUNK_SIZE = 2000
+
+
+def _read_chunks(engine, reclassify, chunk_size):
+    table = Video.__table__
+    pending = table.c.topic_confidence.is_(None)
+    if reclassify:
+        pending = or_(pending, table.c.topic_confidence < 1.0)
+    last_id = 0
+    while True:
+        with engine.connect() as conn:
+            rows = conn.execute(
+                select(table.c.id, table.c.title, table.c.description, table.c.tags,
+                       table.c.board, table.c.topic, table.c.topic_confidence)
+                .where(pending, table.c.id > last_id).order_by(table.c.id).limit(chunk_size)
+            ).all()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield [tuple(row) for row in rows]
+
+
+def backfill(reclassify=False, workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Classify pending videos in parallel. Returns (videos updated, videos now with a topic)."""
+    table = Video.__table__
+    stmt = (update(table).where(table.c.id == bindparam('b_id'))
+            .values(board=bindparam('b_board'), topic=bindparam('b_topic'),
+                    topic_confidence=bindparam('b_confidence')))
+    engine = db.engine
+    updated = classified = 0
+    start = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+
+    def write(results):
+        nonlocal updated, classified
+        with engine.begin() as conn:
+            conn.execute(stmt, results)
+        updated += len(results)
+        classified += sum(1 for r in results if r['b_topic'])
+        print(f"{updated} videos classified ({updated / max(time.perf_counter() - start, 1e-9):.0f}/s)")
+
+    with multiprocessing.get_context('spawn').Pool(workers) as pool:
+        # Keep a couple of chunks per worker in flight so reads stay bounded
+        in_flight = deque()
+        for chunk in _read_chunks(engine, reclassify, chunk_size):
+            in_flight.append(pool.apply_async(classify_chunk, (chunk,)))
+            if len(in_flight) >= workers * 2:
+                write(in_flight.popleft().get())
+        while in_flight:
+            write(in_flight.popleft().get())
+    if updated:
+        bumpCatalogVersion()
+    return updated, classified
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Assign board/topic to existing videos from the tag catalog')
+    parser.add_argument('--all', action='store_true', help='Also reclassify rows the classifier labelled before')
+    parser.add_argument('--workers', type=int, default=None, help='Classifier processes (default: CPU count)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Videos per read/classify/write chunk')
+    args = parser.parse_args()
+
+    # Imported here so spawned classifier workers, which re-import this script, skip the app setup
+    from main import app
+    with app.app_context():
+        start = time.perf_counter()
+        updated, classified = backfill(args.all, args.workers, args.chunk_size)
+        print(f"Updated {updated} videos ({classified} with a topic) in {time.perf_counter() - start:.1f}s")
@@ -1,6 +1,6 @@
 import argparse
 from main import app
-from models import db, User
+from models import db, User, bumpUsersVersion
 from flask import Flask
 
 def clear_users(username=None, email=None, delete_all=False):
@@ -28,6 +28,9 @@ def clear_users(username=None, email=None, delete_all=False):
         try:
             count = query.delete()
             db.session.commit()
+            if count:
+                # Running app processes drop cached principals of the deleted users
+                bumpUsersVersion()
             print(f"Successfully deleted {count} user(s)")
         except Exception as e:
             db.session.rollback()
@@ -1,5 +1,5 @@
 from flask import Flask
-from models import db, Video
+from models import db, Video, bumpCatalogVersion
 
 # Create a minimal Flask app to access the database
 app = Flask(__name__)
@@ -28,6 +28,7 @@ def clear_all_videos():
             # Delete all videos
             Video.query.delete()
             db.session.commit()
+            bumpCatalogVersion()
             print(f"Successfully deleted {video_count} videos.")
 
         except Exception as e:
@@ -0,0 +1,15 @@
+import argparse
+import time
+from main import app
+from watch_rollup import compact_watch_history, DEFAULT_RETENTION_DAYS, DEFAULT_CHUNK_SIZE
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Roll old watch-history events into daily per-video aggregates')
+    parser.add_argument('--days', type=int, default=DEFAULT_RETENTION_DAYS, help='Compact raw events older than this many days')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Raw rows deleted per transaction')
+    args = parser.parse_args()
+
+    with app.app_context():
+        start = time.perf_counter()
+        events, groups = compact_watch_history(args.days, args.chunk_size)
+        print(f"Compacted {events} watch events into {groups} daily rollup rows in {time.perf_counter() - start:.1f}s")
@@ -1,5 +1,14 @@
 import argparse
-from main import app, db, User
+import os
+import time
+from sqlalchemy import or_, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from models import db, User
+from password_service import PasswordService, hash_password, HASH_METHOD
+from import_progress import checkpoint_job, load_checkpoint, save_checkpoint, clear_checkpoint, read_lines, Progress
+
+DEFAULT_BATCH_SIZE = 1000
 
 def create_user_from_data(username, password, email=None, tendency=None, photoUrl=None):
     # Check if user already exists
@@ -14,7 +23,7 @@ def create_user_from_data(username, password, email=None, tendency=None, photoUr
     
     new_user = User(
         username=username,
-        password=password,
+        password=hash_password(password),
         email=email,
         tendency=tendency,
         photoUrl=photoUrl
@@ -28,6 +37,152 @@ def create_user_from_data(username, password, email=None, tendency=None, photoUr
         db.session.rollback()
         return False, f"Database error: {str(e)}"
 
+def parse_user_line(line):
+    """Split 'username,email,password[,tendency,photoUrl]' into a row dict, or return an error message."""
+    fields = line.split(',')
+    if len(fields) < 3:
+        return None, "Invalid format - expected at least 'username,email,password'"
+    row = {
+        'username': fields[0].strip(),
+        'email': fields[1].strip(),
+        'password': fields[2].strip(),
+        'tendency': fields[3].strip() if len(fields) > 3 else None,
+        'photoUrl': fields[4].strip() if len(fields) > 4 else None,
+    }
+    if not all([row['username'], row['email'], row['password']]):
+        return None, "Missing required fields"
+    return row, None
+
+def _read_batches(filename, batch_size, errors, byte_offset=0, line_number=0):
+    """Stream (batch, resume_point) from the file; malformed lines go to errors as (line_num, message).
+
+    batch is a list of (line_num, row); resume_point is the (byte offset, line
+    number) just after the batch's last line.
+    """
+    batch = []
+    resume_point = (byte_offset, line_number)
+    for line_num, line, end_offset in read_lines(filename, byte_offset, line_number):
+        resume_point = (end_offset, line_num)
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        row, error = parse_user_line(line)
+        if error:
+            errors.append((line_num, error))
+            continue
+        batch.append((line_num, row))
+        if len(batch) >= batch_size:
+            yield batch, resume_point
+            batch = []
+    if batch:
+        yield batch, resume_point
+
+def _drop_conflicts(batch, errors):
+    """Split a batch into new rows and rows already imported; conflicting rows go to errors.
+
+    One query finds taken usernames/emails. A row whose exact username/email pair
+    exists was imported by an earlier run; any other clash is an error.
+    """
+    usernames = {row['username'] for _, row in batch}
+    emails = {row['email'] for _, row in batch}
+    existing = db.session.execute(
+        select(User.username, User.email).where(or_(User.username.in_(usernames), User.email.in_(emails)))
+    ).all()
+    imported = {(r.username, r.email) for r in existing}
+    taken_usernames = {r.username for r in existing}
+    taken_emails = {r.email for r in existing}
+    kept = []
+    already = 0
+    for line_num, row in batch:
+        if (row['username'], row['email']) in imported:
+            already += 1
+        elif row['username'] in taken_usernames:
+            errors.append((line_num, "Username already exists"))
+        elif row['email'] in taken_emails:
+            errors.append((line_num, "Email already registered"))
+        else:
+            taken_usernames.add(row['username'])
+            taken_emails.add(row['email'])
+            imported.add((row['username'], row['email']))
+            kept.append((line_num, row))
+    return kept, already
+
+def _insert_rows(rows, errors, checkpoint):
+    """executemany insert plus checkpoint in one transaction. Returns rows inserted.
+
+    If a concurrent writer took a name meanwhile, the batch is redone row by row
+    with ON CONFLICT DO NOTHING, still in one transaction with the checkpoint;
+    rows that hit a conflict go to errors.
+    """
+    table = User.__table__
+    try:
+        with db.engine.begin() as conn:
+            if rows:
+                conn.execute(table.insert(), [row for _, row in rows])
+            save_checkpoint(conn, **checkpoint)
+        return len(rows)
+    except IntegrityError:
+        inserted = 0
+        stmt = sqlite_insert(table).on_conflict_do_nothing()
+        with db.engine.begin() as conn:
+            for line_num, row in rows:
+                if conn.execute(stmt, row).rowcount:
+                    inserted += 1
+                else:
+                    errors.append((line_num, "Username or email already exists"))
+            save_checkpoint(conn, **checkpoint)
+        return inserted
+
+def bulk_import_users(filename, batch_size=DEFAULT_BATCH_SIZE, workers=None, hash_method=HASH_METHOD, resume=False):
+    """Import users in batches: one existence query, one parallel hashing pass and one executemany per batch.
+
+    Each batch commits a checkpoint; with resume=True the import continues after
+    the last committed batch. Rows already present are skipped, so reruns are
+    idempotent. Returns (success_count, error_count, errors) like
+    import_users_from_file; errors cover only the lines read in this run.
+    """
+    job = checkpoint_job('users', filename)
+    file_size = os.path.getsize(filename)
+    checkpoint = load_checkpoint(job, filename) if resume else None
+    if checkpoint:
+        print(f"Resuming at line {checkpoint['line_number']} after batch {checkpoint['batch_number']} "
+              f"({checkpoint['rows_done']} users done)")
+    else:
+        clear_checkpoint(job)
+        checkpoint = {'byte_offset': 0, 'line_number': 0, 'batch_number': 0, 'rows_done': 0}
+    batch_number = checkpoint['batch_number']
+    rows_done = checkpoint['rows_done']
+    progress = Progress('users', file_size, checkpoint['byte_offset'], rows_done)
+
+    hasher = PasswordService(workers=workers if workers is not None else (os.cpu_count() or 1),
+                             method=hash_method)
+    success_count = already_count = 0
+    errors = []
+    try:
+        for batch, (byte_offset, line_number) in _read_batches(
+                filename, batch_size, errors, checkpoint['byte_offset'], checkpoint['line_number']):
+            rows, already = _drop_conflicts(batch, errors)
+            hashes = hasher.hash_many([row['password'] for _, row in rows]) if rows else []
+            for (_, row), hashed in zip(rows, hashes):
+                row['password'] = hashed
+            batch_number += 1
+            inserted = _insert_rows(rows, errors, {
+                'job': job, 'file_size': file_size, 'byte_offset': byte_offset, 'line_number': line_number,
+                'batch_number': batch_number, 'rows_done': rows_done + len(rows) + already,
+            })
+            success_count += inserted
+            already_count += already
+            rows_done += len(rows) + already
+            progress.update(byte_offset, rows_done)
+    finally:
+        hasher.shutdown()
+    progress.update(file_size, rows_done, force=True)
+    clear_checkpoint(job)
+    if already_count:
+        print(f"{already_count} users were already imported")
+    errors.sort(key=lambda e: e[0])
+    return success_count, len(errors), [f"Line {line_num}: {message}" for line_num, message in errors]
+
 def import_users_from_file(filename):
     success_count = 0
     error_count = 0
@@ -40,34 +195,15 @@ def import_users_from_file(filename):
             if not line or line.startswith('#'):
                 continue
 
-            # Split line into fields (format: username,email,password[,tendency,photoUrl])
-            fields = line.split(',')
-            if len(fields) < 3:
-                error_count += 1
-                errors.append(f"Line {line_num}: Invalid format - expected at least 'username,email,password'")
-                continue
-
-            # Unpack fields, fill missing with None
-            username = fields[0].strip()
-            email = fields[1].strip()
-            password = fields[2].strip()
-            tendency = fields[3].strip() if len(fields) > 3 else None
-            photoUrl = fields[4].strip() if len(fields) > 4 else None
-
-            # Validate required fields
-            if not all([username, email, password]):
+            # Format: username,email,password[,tendency,photoUrl]
+            row, error = parse_user_line(line)
+            if error:
                 error_count += 1
-                errors.append(f"Line {line_num}: Missing required fields")
+                errors.append(f"Line {line_num}: {error}")
                 continue
 
             # Create the user
-            success, message = create_user_from_data(
-                username=username,
-                email=email,
-                password=password,
-                tendency=tendency,
-                photoUrl=photoUrl
-            )
+            success, message = create_user_from_data(**row)
             if success:
                 success_count += 1
                 print(f"Line {line_num}: {message}")
@@ -80,15 +216,31 @@ def import_users_from_file(filename):
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Import users from a text file')
     parser.add_argument('filename', help='Path to text file containing user data (format: username,email,password[,tendency,photoUrl])')
+    parser.add_argument('--bulk', action='store_true', help='Import in batches with parallel password hashing (for large files)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Rows checked and inserted per batch with --bulk')
+    parser.add_argument('--workers', type=int, default=None, help='Hashing processes with --bulk (default: CPU count)')
+    parser.add_argument('--hash-method', default=HASH_METHOD,
+                        help='Werkzeug hash method for --bulk, e.g. a cheaper pbkdf2 for one-off onboarding; '
+                             'hashes differing from the server default are upgraded at first login')
+    parser.add_argument('--resume', action='store_true', help='With --bulk, continue an interrupted import from its last committed batch')
     args = parser.parse_args()
+    if args.resume and not args.bulk:
+        parser.error('--resume requires --bulk')
 
+    # Imported here so --bulk hashing workers, which re-import this script, skip the app setup
+    from main import app
     with app.app_context():
         print(f"Importing users from {args.filename}...")
-        success, errors, error_details = import_users_from_file(args.filename)
+        start = time.perf_counter()
+        if args.bulk:
+            success, errors, error_details = bulk_import_users(args.filename, args.batch_size, args.workers, args.hash_method, args.resume)
+        else:
+            success, errors, error_details = import_users_from_file(args.filename)
 
         print("\nImport Summary:")
         print(f"Successfully created: {success}")
         print(f"Failed: {errors}")
+        print(f"Elapsed: {time.perf_counter() - start:.1f}s")
 
         if error_details:
             print("\nError details:")
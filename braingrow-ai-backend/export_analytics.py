@@ -0,0 +1,142 @@
+"""
+Export watch history, the video catalog and comments to columnar files for offline analytics.
+
+Rows are streamed from the database in id order with yield_per, so memory stays
+bounded by --chunk-size. Each chunk is written as Parquet (default) or Arrow IPC
+files partitioned by date:
+
+    <out>/watch_histories/date=2026-10-18/part-000000001-000050000.parquet
+    <out>/comments/date=2026-10-18/...
+    <out>/videos/date=2026-10-18/...      (partitioned by export date)
+
+<out>/_export_state.json records the last exported id per table, and the next
+run only exports newer rows. Analysts read these memory-mappable files (e.g.
+pyarrow.dataset / DuckDB) instead of querying the serving database.
+
+Incremental exports are append-only: rows updated in place after they were
+exported (watch-session upserts, catalog edits) are not re-exported; use --full
+for a fresh snapshot into an empty directory.
+
+    python export_analytics.py exports/ --format parquet --chunk-size 50000
+"""
+
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+    import pyarrow.parquet as pq
+except ImportError:  # optional: only needed for analytics exports
+    pa = None
+
+from main import app
+from models import db, Video, Comment, WatchHistory
+
+STATE_FILE = '_export_state.json'
+
+# table name -> (model, exported columns, column used for the date partition)
+EXPORTS = {
+    'watch_histories': (WatchHistory, ['id', 'user_id', 'video_id', 'watched_at', 'progress', 'focus_sample', 'session_id'], 'watched_at'),
+    'videos': (Video, ['id', 'title', 'description', 'url', 'tags', 'imageUrl', 'likes', 'dislikes', 'board', 'topic', 'duration'], None),
+    'comments': (Comment, ['id', 'user_id', 'video_id', 'text', 'created_at'], 'created_at'),
+}
+
+
+def load_state(out_dir):
+    path = os.path.join(out_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_state(out_dir, state):
+    # Write-then-rename so an interrupted export never leaves a torn state file
+    path = os.path.join(out_dir, STATE_FILE)
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _arrow_schema(model, columns):
+    types = {
+        'INTEGER': pa.int64(), 'FLOAT': pa.float64(), 'DATETIME': pa.timestamp('us'),
+        'DATE': pa.date32(),
+    }
+    fields = []
+    for name in columns:
+        sql_type = type(model.__table__.c[name].type).__name__.upper()
+        fields.append(pa.field(name, types.get(sql_type, pa.string())))
+    return pa.schema(fields)
+
+
+def _write_partition(path, table, fmt):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    if fmt == 'parquet':
+        pq.write_table(table, tmp, compression='zstd')
+    else:
+        with pa.OSFile(tmp, 'wb') as sink, pa_ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp, path)
+
+
+def export_table(name, out_dir, state, fmt='parquet', chunk_size=50000):
+    """Stream rows newer than the recorded id into date-partitioned files. Returns rows written."""
+    model, columns, date_column = EXPORTS[name]
+    schema = _arrow_schema(model, columns)
+    table = model.__table__
+    last_id = int(state.get(name, 0))
+    export_day = datetime.utcnow().date().isoformat()
+    ext = 'parquet' if fmt == 'parquet' else 'arrow'
+    written = 0
+
+    result = db.session.execute(
+        db.select(*[table.c[c] for c in columns])
+        .where(table.c.id > last_id)
+        .order_by(table.c.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    for rows in result.partitions():
+        by_day = {}
+        for row in rows:
+            stamp = getattr(row, date_column) if date_column else None
+            day = stamp.date().isoformat() if stamp else export_day
+            by_day.setdefault(day, []).append(row)
+        first_id, chunk_last_id = rows[0].id, rows[-1].id
+        for day, day_rows in by_day.items():
+            arrays = [pa.array([getattr(r, c) for r in day_rows], type=schema.field(c).type) for c in columns]
+            path = os.path.join(out_dir, name, f'date={day}', f'part-{first_id:09d}-{chunk_last_id:09d}.{ext}')
+            _write_partition(path, pa.Table.from_arrays(arrays, schema=schema), fmt)
+        # Checkpoint after every chunk so an interrupted run resumes where it stopped
+        state[name] = chunk_last_id
+        save_state(out_dir, state)
+        written += len(rows)
+    result.close()
+    return written
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export watch history, videos and comments to Parquet/Arrow files')
+    parser.add_argument('out_dir', help='Output directory (holds the partitioned files and export state)')
+    parser.add_argument('--format', choices=['parquet', 'arrow'], default='parquet')
+    parser.add_argument('--tables', nargs='+', choices=list(EXPORTS), default=list(EXPORTS))
+    parser.add_argument('--chunk-size', type=int, default=50000, help='Rows fetched and written per chunk')
+    parser.add_argument('--full', action='store_true', help='Ignore saved state and export every row')
+    args = parser.parse_args()
+
+    if pa is None:
+        raise SystemExit('pyarrow is required for exports: pip install pyarrow')
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    state = {} if args.full else load_state(args.out_dir)
+    with app.app_context():
+        for name in args.tables:
+            start = time.perf_counter()
+            count = export_table(name, args.out_dir, state, fmt=args.format, chunk_size=args.chunk_size)
+            print(f"{name}: exported {count} rows (last id {state.get(name, 0)}) in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,118 @@
+"""
+Conditional GET and response compression.
+
+etag_cached(key_fn) wraps a read endpoint: key_fn() builds a cheap key from
+the request and the version stamps the payload depends on, and a request whose
+If-None-Match matches the resulting ETag gets a 304 before the view (and any
+database work) runs.
+
+install_compression(app) gzips (or, with the optional brotli package, brotli
+compresses) JSON and text responses above COMPRESS_MIN_BYTES for clients that
+accept it. StaticPayload holds a fixed body together with its precompressed
+variants, for payloads such as the tag catalog that never change at runtime.
+"""
+
+import gzip
+import hashlib
+from functools import wraps
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:  # optional: gzip is used when brotli is not installed
+    brotli = None
+
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+COMPRESSIBLE_TYPES = ('application/json', 'text/html', 'text/plain', 'text/css', 'application/javascript')
+
+
+def make_etag(key):
+    return hashlib.sha1(str(key).encode('utf-8')).hexdigest()[:20]
+
+
+def _matches(etag):
+    return request.if_none_match.contains_weak(etag) or request.if_none_match.contains(etag)
+
+
+def _not_modified(etag, cache_control):
+    response = Response(status=304)
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+
+def etag_cached(key_fn, cache_control='no-cache'):
+    """Answer If-None-Match with 304 using the ETag of key_fn(**view_args); tag 200 responses with it."""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            etag = make_etag(key_fn(**kwargs))
+            if _matches(etag):
+                return _not_modified(etag, cache_control)
+            response = f(*args, **kwargs)
+            if isinstance(response, Response) and response.status_code == 200:
+                response.set_etag(etag, weak=True)
+                response.headers['Cache-Control'] = cache_control
+            return response
+        return decorated_function
+    return decorator
+
+
+def _preferred_encoding(available):
+    accepted = request.accept_encodings
+    for encoding in ('br', 'gzip'):
+        if encoding in available and accepted[encoding]:
+            return encoding
+    return None
+
+
+def _compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, GZIP_LEVEL)
+
+
+class StaticPayload:
+    """A fixed response body with its ETag and precompressed variants."""
+
+    def __init__(self, body, mimetype='application/json', cache_control='public, max-age=300'):
+        self.mimetype = mimetype
+        self.cache_control = cache_control
+        self.etag = make_etag(hashlib.sha256(body).hexdigest())
+        self.variants = {None: body, 'gzip': _compress(body, 'gzip')}
+        if brotli is not None:
+            self.variants['br'] = _compress(body, 'br')
+
+    def response(self):
+        if _matches(self.etag):
+            return _not_modified(self.etag, self.cache_control)
+        encoding = _preferred_encoding(self.variants)
+        response = Response(self.variants[encoding], mimetype=self.mimetype)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = self.cache_control
+        response.set_etag(self.etag, weak=True)
+        return response
+
+
+def _compress_response(response):
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    encoding = _preferred_encoding(('br', 'gzip') if brotli is not None else ('gzip',))
+    response.vary.add('Accept-Encoding')
+    if encoding:
+        response.set_data(_compress(data, encoding))
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def install_compression(app):
+    app.after_request(_compress_response)
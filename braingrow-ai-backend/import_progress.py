@@ -0,0 +1,102 @@
+"""
+Checkpoints and progress reporting for the bulk import scripts.
+
+add_video.py and create_user.py read their input as bytes through read_lines(),
+which tracks the byte offset after every line. Each batch writes its
+checkpoint (byte offset, line number, batch number, rows done, and optional
+parser state) to the import_checkpoints table in the same transaction as the
+batch's rows. That way a crash can never record work that was not committed.
+On --resume the reader seeks straight to the recorded offset. Without --resume
+an old checkpoint is discarded and the file is read from the top. Either way
+reruns are idempotent, because both importers upsert or skip rows that are
+already present. A job's checkpoint is deleted when the import finishes.
+
+Progress prints throughput and an ETA based on bytes read, at most every
+PROGRESS_INTERVAL seconds.
+"""
+
+import json
+import os
+import time
+from datetime import datetime
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, ImportCheckpoint
+
+PROGRESS_INTERVAL = 2.0
+
+
+def checkpoint_job(kind, filename):
+    return f"{kind}:{os.path.abspath(filename)}"[:300]
+
+
+def load_checkpoint(job, filename):
+    """The saved checkpoint for job as a dict, or None. Exits if the file changed size since it was written."""
+    table = ImportCheckpoint.__table__
+    with db.engine.connect() as conn:
+        row = conn.execute(select(table).where(table.c.job == job)).mappings().first()
+    if row is None:
+        return None
+    if row['file_size'] != os.path.getsize(filename):
+        raise SystemExit(f"{filename} changed since the checkpoint was written; rerun without --resume")
+    checkpoint = dict(row)
+    checkpoint['state'] = json.loads(row['state']) if row['state'] else {}
+    return checkpoint
+
+
+def save_checkpoint(conn, job, file_size, byte_offset, line_number, batch_number, rows_done, state=None):
+    """Record progress on conn, inside the transaction that commits the batch."""
+    values = {
+        'job': job, 'file_size': file_size, 'byte_offset': byte_offset, 'line_number': line_number,
+        'batch_number': batch_number, 'rows_done': rows_done,
+        'state': json.dumps(state) if state else None, 'updated_at': datetime.utcnow(),
+    }
+    stmt = sqlite_insert(ImportCheckpoint.__table__).values(**values)
+    conn.execute(stmt.on_conflict_do_update(
+        index_elements=['job'], set_={k: stmt.excluded[k] for k in values if k != 'job'},
+    ))
+
+
+def clear_checkpoint(job):
+    table = ImportCheckpoint.__table__
+    with db.engine.begin() as conn:
+        conn.execute(delete(table).where(table.c.job == job))
+
+
+def read_lines(filename, byte_offset=0, line_number=0):
+    """Yield (line_number, text, offset after the line), starting at byte_offset."""
+    with open(filename, 'rb') as f:
+        f.seek(byte_offset)
+        offset = byte_offset
+        for raw in f:
+            offset += len(raw)
+            line_number += 1
+            yield line_number, raw.decode('utf-8'), offset
+
+
+class Progress:
+    """Prints rows written, throughput and ETA (from bytes read) at most every interval seconds."""
+
+    def __init__(self, label, total_bytes, start_offset=0, rows_done=0, interval=PROGRESS_INTERVAL):
+        self.label = label
+        self.total_bytes = total_bytes
+        self.start_offset = start_offset
+        self.start_rows = rows_done
+        self.interval = interval
+        self.started = time.perf_counter()
+        self.last_report = 0.0
+
+    def update(self, byte_offset, rows_done, force=False):
+        now = time.perf_counter()
+        if not force and now - self.last_report < self.interval:
+            return
+        self.last_report = now
+        elapsed = max(now - self.started, 1e-9)
+        rate = (rows_done - self.start_rows) / elapsed
+        read = byte_offset - self.start_offset
+        remaining = self.total_bytes - byte_offset
+        eta = f"{elapsed * remaining / read:.0f}s" if read > 0 else '?'
+        percent = 100.0 * byte_offset / self.total_bytes if self.total_bytes else 100.0
+        print(f"{rows_done} {self.label} ({percent:.1f}%), {rate:.0f}/s, ETA {eta}")
@@ -1,6 +1,5 @@
-from main import app, db, ensure_reaction_columns
+from main import app, db
+from migrations import run_migrations
 
 with app.app_context():
-    db.create_all()
-    ensure_reaction_columns()
-
+    run_migrations(db.engine)
@@ -1,62 +1,128 @@
-from flask import Flask, session, jsonify, request
-from flask_session import Session
+from flask import Flask, session, jsonify, request, Response, stream_with_context, send_file, redirect
 from flask_cors import CORS
 import jwt
+import json
+import base64
 import datetime
 import traceback
 from functools import wraps
 from video_handler import (
     ask_AI,
+    ask_AI_batch,
     VertexAICredentialsError,
+    parse_timestamp,
+    probe_video_duration,
+    remember_video_duration,
 )
-from sqlalchemy import inspect, text
 import os
 from werkzeug.utils import secure_filename
 import urllib.request
 import urllib.parse
+import io
 import mimetypes
 import random
+import threading
 
 # Import everything from the consolidated models file
 from models import (
     db, Video, User, Comment,
-    searchVideo, getVideoById, addVideo,
+    searchVideo, getVideoById, getVideosByIds, addVideo, getVideosByTopic, getVideosMatchingKeyword,
     userLogin, userRegister, userProfile, getRecommendedVideos,
-    addComment, getCommentsByVideo, updateUserTendency, updateUserProfile,
+    addComment, getCommentsWithAuthors, updateUserTendency, updateUserProfile, updateVideoDuration,
     # new imports for personalization
-    getRecommendedVideosForUser, updateUserFocusLevel, recordWatchHistory, getUserWatchHistory,
+    getRecommendedVideosForUser, updateUserFocusLevel, recordWatchHistory, getUserWatchHistory, WATCH_HISTORY_LIMIT,
+    setVideoReaction, getVideoReactionCounts, getVideoCounters, bumpCatalogVersion, ENGAGEMENT_VERSION,
 )
+from migrations import check_schema_version, run_migrations
+from session_store import init_session_store, start_session_sweeper
+from auth import bearer_principal, session_principal
+from password_service import password_service, PasswordServiceBusy
+from storage import configure_storage, install_sqlite_pragmas
+from write_queue import start_write_executor
+from watch_buffer import start_watch_buffer, get_watch_buffer
+from watch_rollup import start_watch_rollup
+from reaction_counters import start_reaction_counters, pending_deltas, record_reaction_change
 from tags import VIDEO_TAG_CATALOG
+from versions import configure_versions
+from catalog_snapshot import configure_snapshot, start_catalog_snapshot, refresh_snapshot
+from http_cache import StaticPayload, etag_cached, install_compression
+from micro_cache import micro_cache, micro_cached
+from versions import current_version
+from video_cache import CATALOG_VERSION
+from thumbnails import configure_thumbnails, start_thumbnail_tasks, thumbnail_store, ThumbnailUnavailable
+from serializers import dumps, json_response, parse_fields, shape_columns, video_json, video_list_json
 
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///site.db'
+# DATABASE_URL override, WAL/pragmas and connection pooling for threaded workers
+configure_storage(app)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config["SESSION_PERMANENT"] = False
-app.config["SESSION_TYPE"] = "filesystem"
 app.config['SECRET_KEY'] = "your-secret-key-here"
 
-# Ensure session storage is writable in cloud environments (e.g., Cloud Run)
-# Cloud runtimes often mount the app filesystem read-only; only /tmp is writable.
-try:
-    import os as _os
-    _cloud_env = bool(_os.environ.get("K_SERVICE") or _os.environ.get("GAE_ENV"))
-    _session_dir = _os.environ.get("SESSION_FILE_DIR") or ("/tmp/flask_session" if _cloud_env else _os.path.join(app.instance_path, "flask_session"))
-    _os.makedirs(_session_dir, exist_ok=True)
-    app.config["SESSION_FILE_DIR"] = _session_dir
-except Exception:
-    # Non-fatal: fallback to default; errors will surface if session tries to write
-    pass
+# Cloud runtimes (e.g., Cloud Run) often mount the app filesystem read-only; only /tmp is writable.
+_cloud_env = bool(os.environ.get("K_SERVICE") or os.environ.get("GAE_ENV"))
+
+# Version stamps shared by all workers; writers bump them to invalidate per-process caches
+configure_versions(os.environ.get("VERSION_DIR") or (
+    "/tmp/braingrow-versions" if _cloud_env else os.path.join(app.instance_path, "versions")))
 
 # Initialize extensions
 db.init_app(app)
-Session(app)
+# Server-side sessions in the sessions table
+init_session_store(app)
+with app.app_context():
+    install_sqlite_pragmas(db.engine)
+# Local thumbnail cache behind /api/thumb (THUMB_DIR, THUMB_FETCHER)
+configure_thumbnails("/tmp/braingrow-thumbs" if _cloud_env else os.path.join(app.instance_path, "thumbs"))
+# Shared mmap catalog snapshot (CATALOG_SNAPSHOT_PATH; CATALOG_SNAPSHOT_SECONDS=0 disables)
+configure_snapshot(os.path.join("/tmp" if _cloud_env else app.instance_path, "catalog.snap"))
+
+_background_lock = threading.Lock()
+_background_started = False
+
+def start_background_tasks():
+    """Start this process's background threads (flushes, sweeps, snapshot, prefetch), once.
+
+    Called before the first request a process serves, so gunicorn workers start
+    them after forking. CLI scripts and pool workers that only import main
+    never start them.
+    """
+    global _background_started
+    with _background_lock:
+        if _background_started:
+            return
+        _background_started = True
+        # Expired session rows are swept every SESSION_SWEEP_SECONDS
+        start_session_sweeper(app)
+        # Optional single-writer thread that batches commits (DB_WRITE_EXECUTOR=1)
+        start_write_executor(app)
+        # Coalesce watch-progress heartbeats into batched per-session upserts
+        start_watch_buffer(app)
+        # Optional periodic compaction of old watch events (WATCH_ROLLUP_INTERVAL_HOURS)
+        start_watch_rollup(app)
+        # Like/dislike counter deltas, applied to videos in one batched UPDATE per interval
+        start_reaction_counters(app)
+        # Rebuild the catalog snapshot when the catalog version changes
+        snapshot_task = start_catalog_snapshot(app)
+        # Thumbnail cache eviction (THUMB_MAX_MB); THUMB_PREFETCH_SECONDS enables background warming
+        start_thumbnail_tasks(app)
+        if snapshot_task:
+            # Make sure a current snapshot exists before the first request (cheap header check if it does)
+            with app.app_context():
+                try:
+                    refresh_snapshot()
+                except Exception as e:
+                    print(f"Catalog snapshot not built at startup: {e}")
 
 # Allow frontend origins with credentials support
 CORS(app, origins=[
     "http://localhost:5174", 
     "http://localhost:5173",
     "https://jacobxxi.github.io"
-], supports_credentials=True)
+], supports_credentials=True, expose_headers=['X-Next-Cursor', 'X-Total-Count', 'ETag'])
+
+# gzip (brotli if installed) for JSON/text bodies above 1 KiB
+install_compression(app)
 
 # Ensure CORS preflights never trigger route logic
 @app.before_request
@@ -65,59 +131,32 @@ def _short_circuit_options_preflight():
         # Let Flask-CORS add the appropriate headers in after_request
         return ('', 204)
 
-# Create database tables and ensure reaction columns exist
-def ensure_reaction_columns():
-    """Ensure legacy databases have likes/dislikes columns and new personalization columns.
-
-    This function performs lightweight schema evolution for existing SQLite DBs without Alembic.
-    """
-    inspector = inspect(db.engine)
-    columns = {col['name'] for col in inspector.get_columns('videos')}
-    added = False
-    if 'likes' not in columns:
-        db.session.execute(text('ALTER TABLE videos ADD COLUMN likes INTEGER DEFAULT 0'))
-        added = True
-    if 'dislikes' not in columns:
-        db.session.execute(text('ALTER TABLE videos ADD COLUMN dislikes INTEGER DEFAULT 0'))
-        added = True
-    # New video categorization columns
-    if 'board' not in columns:
-        db.session.execute(text("ALTER TABLE videos ADD COLUMN board VARCHAR(50)"))
-        added = True
-    if 'topic' not in columns:
-        db.session.execute(text("ALTER TABLE videos ADD COLUMN topic VARCHAR(100)"))
-        added = True
-    # Users: focus_level
-    user_columns = {col['name'] for col in inspector.get_columns('users')}
-    if 'focus_level' not in user_columns:
-        db.session.execute(text('ALTER TABLE users ADD COLUMN focus_level FLOAT'))
-        added = True
-    if added:
-        db.session.commit()
-    # Ensure watch_histories table exists
-    if 'watch_histories' not in inspector.get_table_names():
-        db.create_all()
-
+# Schema changes are applied at deploy time by `python migrate.py`; startup only
+# compares the recorded schema version with the one this code expects.
 with app.app_context():
-    db.create_all()
-    ensure_reaction_columns()
+    if os.getenv('AUTO_MIGRATE') == '1':
+        run_migrations(db.engine)
+    check_schema_version(db.engine)
+
+# Background threads start in the process that serves, not in every importer
+@app.before_request
+def _start_background_tasks():
+    if not _background_started:
+        start_background_tasks()
 
 # Decorator to check if user is logged in
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         # Check for JWT token in Authorization header
-        token = request.headers.get('Authorization')
-        if token and token.startswith('Bearer '):
-            token = token[7:]
-            try:
-                data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
-                request.current_user_id = data['user_id']
-                return f(*args, **kwargs)
-            except jwt.ExpiredSignatureError:
-                return jsonify({'error': 'Token has expired', 'code': 'TOKEN_EXPIRED'}), 401
-            except jwt.InvalidTokenError:
-                return jsonify({'error': 'Invalid token', 'code': 'INVALID_TOKEN'}), 401
+        principal, error = bearer_principal()
+        if principal is not None:
+            request.current_user_id = principal.id
+            return f(*args, **kwargs)
+        if error == 'TOKEN_EXPIRED':
+            return jsonify({'error': 'Token has expired', 'code': 'TOKEN_EXPIRED'}), 401
+        if error:
+            return jsonify({'error': 'Invalid token', 'code': 'INVALID_TOKEN'}), 401
         
         # Check for session-based login (fallback)
         if 'user_id' in session:
@@ -136,16 +175,21 @@ def home():
     return "Hello, BrainGrow AI!"
 
 # Expose the tag catalog for frontends to build tendency selection
+TAGS_PAYLOAD = StaticPayload(dumps(VIDEO_TAG_CATALOG))
+
 @app.route('/api/tags', methods=['GET'])
 def get_tags_catalog():
-    try:
-        return jsonify(VIDEO_TAG_CATALOG)
-    except Exception as e:
-        print(f"Error in get_tags_catalog: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+    # Encoded and compressed once at startup; ETag is the catalog's content hash
+    return TAGS_PAYLOAD.response()
+
+def _catalog_etag_key(*parts):
+    """ETag key for payloads built from the catalog and the per-video counters."""
+    return (*parts, current_version(CATALOG_VERSION), current_version(ENGAGEMENT_VERSION))
 
 # Updated search endpoint to match frontend expectations
 @app.route('/api/search')
+@etag_cached(lambda: _catalog_etag_key('search', request.query_string))
+@micro_cached(lambda: _catalog_etag_key())
 def search():
     try:
         searchQuery = request.args.get('query')
@@ -154,47 +198,45 @@ def search():
         
         if not searchQuery:
             return jsonify({'error': 'Query parameter is required'}), 400
+        try:
+            fields = parse_fields(request.args.get('fields'), 'search')
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        videos = searchVideo(searchQuery, limit)
+        videos = searchVideo(searchQuery, limit, columns=shape_columns('search', fields))
         print(f"Found {len(videos) if videos else 0} videos")
         
         if not videos:
             return jsonify([])
             
-        result = []
-        for v in videos:
-            video_data = {
-                'id': v.id,
-                'title': v.title,
-                'description': v.description,
-                'creator': getattr(v, 'author', 'Unknown'),  # Frontend expects 'creator'
-                'publishedAt': getattr(v, 'date', datetime.datetime.now()).isoformat(),
-                'category': getattr(v, 'category', 'General'),
-                'viewCount': getattr(v, 'views', 0),
-                'videoUrl': v.url,  # Frontend expects 'videoUrl'
-                'imageUrl': v.imageUrl
-            }
-            result.append(video_data)
-        return jsonify(result)
+        return json_response(video_list_json(videos, 'search', fields))
             
     except Exception as e:
         print(f"Error in search route: {str(e)}")
         print(f"Traceback: {traceback.format_exc()}")
         return jsonify({'error': str(e)}), 500
 
+ANONYMOUS_POOL_SIZE = 200
+
+def _anonymous_recommendations(limit, columns):
+    """A random sample from a shared, briefly cached pool of random videos."""
+    key = ('anonymous-recommendations', tuple(sorted(columns)), current_version(CATALOG_VERSION))
+    pool = micro_cache.get_or_compute(
+        key, lambda: (getRecommendedVideos(max(ANONYMOUS_POOL_SIZE, limit), columns=columns), True))
+    return random.sample(pool, min(limit, len(pool)))
+
 @app.route('/api/recommendations')
 def get_recommendations():
     # Default to 10 recommendations if not specified
     limit = request.args.get('maxVideo', 10, type=int)
-    user_id = None
-    token = request.headers.get('Authorization')
-    if token and token.startswith('Bearer '):
-        token = token[7:]
-        try:
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
-            user_id = data.get('user_id')
-        except Exception:
-            user_id = None
+    try:
+        fields = parse_fields(request.args.get('fields'), 'list')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    # Only the columns the response needs, plus the ones candidate scoring reads
+    columns = shape_columns('list', fields) | {'tags', 'board', 'topic'}
+    principal, _ = bearer_principal()
+    user_id = principal.id if principal else None
     if not user_id and 'user_id' in session and session.get('logged_in'):
         user_id = session['user_id']
 
@@ -237,27 +279,13 @@ def get_recommendations():
 
         # From top topic, if any
         if top_topic:
-            topic_videos = Video.query.filter(
-                Video.topic == top_topic,
-                ~Video.id.in_(watched_video_ids)
-            ).limit(limit * 3).all()
+            topic_videos = getVideosByTopic(top_topic, watched_video_ids, limit * 3, columns=columns)
             add_candidates(topic_videos, base_score=5)
 
         # From tendency keywords
         if tendency_keywords:
-            from sqlalchemy import or_
             for kw in tendency_keywords:
-                like = f"%{kw}%"
-                kw_videos = Video.query.filter(
-                    or_(
-                        Video.tags.like(like),
-                        Video.title.like(like),
-                        Video.description.like(like),
-                        Video.board == kw,
-                        Video.topic == kw,
-                    ),
-                    ~Video.id.in_(watched_video_ids)
-                ).limit(10).all()
+                kw_videos = getVideosMatchingKeyword(kw, watched_video_ids, 10, columns=columns)
                 add_candidates(kw_videos, base_score=3)
                 kw_to_vids[kw] = kw_videos
 
@@ -332,7 +360,7 @@ def get_recommendations():
 
         random_picks = []
         if random_needed > 0:
-            pool = getRecommendedVideos(random_needed * 3)
+            pool = getRecommendedVideos(random_needed * 3, columns=columns)
             for v in pool:
                 if v.id in selected_ids:
                     continue
@@ -349,53 +377,158 @@ def get_recommendations():
             remaining_personalized = [vid for _, vid in scored[base_target:base_target + remaining_needed] if vid.id not in {v.id for v in videos} and vid.id not in watched_video_ids]
             videos += remaining_personalized
         if len(videos) < limit:
-            extra = getRecommendedVideos(limit - len(videos))
+            extra = getRecommendedVideos(limit - len(videos), columns=columns)
             videos += [v for v in extra if v.id not in {x.id for x in videos} and v.id not in watched_video_ids]
     else:
-        videos = getRecommendedVideos(limit)
+        videos = _anonymous_recommendations(limit, columns)
 
     # Mix final order to interleave personalized and random picks
     try:
         random.shuffle(videos)
     except Exception:
         pass
-    return jsonify([{
-        'id': v.id,
-        'title': v.title,
-        'description': v.description,
-        'url': v.url,
-        'tags': v.tags,
-        'board': getattr(v, 'board', None),
-        'topic': getattr(v, 'topic', None),
-        'imageUrl': v.imageUrl
-    } for v in videos])
+    return json_response(video_list_json(videos, 'list', fields))
         
+def _video_etag_key(video_id):
+    # Unflushed reaction clicks in this process change the counters too
+    pending = pending_deltas(int(video_id)) if str(video_id).isdigit() else None
+    return _catalog_etag_key('video', video_id, pending)
+
 @app.route('/api/video/<video_id>')
+@etag_cached(_video_etag_key)
+@micro_cached(_video_etag_key)
 def get_video(video_id):
     try:
         video = getVideoById(video_id)
         if video:
-            return jsonify({
-                'id': video.id,
-                'title': video.title,
-                'description': video.description,
-                'creator': getattr(video, 'author', 'Unknown'),
-                'publishedAt': getattr(video, 'date', datetime.datetime.now()).isoformat(),
-                'category': getattr(video, 'category', 'General'),
-                'viewCount': getattr(video, 'views', 0),
-                # Return the canonical YouTube URL instead of a direct stream URL
-                'url': video.url,
-                'coverUrl': video.imageUrl,
-                # Include tags and structured classification if present
-                'tags': getattr(video, 'tags', ''),
-                'board': getattr(video, 'board', None),
-                'topic': getattr(video, 'topic', None),
-            })
+            likes, dislikes, comment_count = getVideoCounters(video.id)
+            return json_response(video_json(
+                video, 'detail', commentCount=comment_count, **_reaction_counts(video.id, (likes, dislikes))))
         return jsonify({'error': 'Video not found'}), 404
     except Exception as e:
         print(f"Error in get_video: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+MAX_BULK_VIDEOS = 100
+
+@app.route('/api/videos')
+def get_videos_bulk():
+    """Several videos in one call: ?ids=1,2,3 (optional ?fields= as for recommendations)."""
+    try:
+        try:
+            ids = list(dict.fromkeys(int(i) for i in request.args.get('ids', '').split(',') if i.strip()))
+        except ValueError:
+            return jsonify({'error': 'ids must be a comma-separated list of integers'}), 400
+        if not ids:
+            return jsonify({'error': 'ids parameter is required'}), 400
+        if len(ids) > MAX_BULK_VIDEOS:
+            return jsonify({'error': f'At most {MAX_BULK_VIDEOS} ids per request'}), 400
+        try:
+            fields = parse_fields(request.args.get('fields'), 'list')
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        videos = getVideosByIds(ids, columns=shape_columns('list', fields))
+        return json_response(video_list_json(videos, 'list', fields))
+    except Exception as e:
+        print(f"Error in get_videos_bulk: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+THUMB_IMMUTABLE = 'public, max-age=31536000, immutable'
+THUMB_REVALIDATE = 'public, max-age=3600'
+
+@app.route('/api/thumb/<int:video_id>')
+def get_thumbnail(video_id):
+    """The video's cover at a standard width (?w= is rounded up to one of THUMB_WIDTHS)."""
+    try:
+        video = getVideoById(video_id)
+        if not video or not video.imageUrl:
+            return jsonify({'error': 'Video not found'}), 404
+        try:
+            thumb = thumbnail_store().thumbnail(video.imageUrl, request.args.get('w', type=int))
+            response = send_file(thumb.path, mimetype=thumb.mimetype, etag=thumb.etag, conditional=True)
+        except (ThumbnailUnavailable, FileNotFoundError) as e:
+            # FileNotFoundError: evicted between lookup and open
+            print(f"Thumbnail unavailable for video {video_id}: {e}")
+            # Better the full-size source than a broken image
+            return redirect(video.imageUrl)
+        # ?v= names the stored content, so a response for the matching v can never change
+        versioned = request.args.get('v') == thumb.version
+        response.headers['Cache-Control'] = THUMB_IMMUTABLE if versioned else THUMB_REVALIDATE
+        return response
+    except Exception as e:
+        print(f"Error in get_thumbnail: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+MAX_BATCH_REQUESTS = 20
+BATCH_FORWARDED_HEADERS = ('X-Next-Cursor', 'X-Total-Count')
+
+def _run_sub_request(path):
+    """Dispatch an internal GET for path in this app context; returns the encoded result object.
+
+    Sub-requests reuse the caller's environ (cookies, Authorization), its session
+    object, and the app context, hence one DB session and one token decode.
+    """
+    route, _, query = path.partition('?')
+    environ = dict(request.environ)
+    environ.update({
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': urllib.parse.unquote(route),
+        'QUERY_STRING': query,
+        'CONTENT_LENGTH': '0',
+        'wsgi.input': io.BytesIO(b''),
+    })
+    # Sub-responses are inlined uncompressed and in full
+    for key in ('CONTENT_TYPE', 'HTTP_ACCEPT_ENCODING', 'HTTP_IF_NONE_MATCH'):
+        environ.pop(key, None)
+    ctx = app.request_context(environ)
+    ctx.session = session._get_current_object()
+    with ctx:
+        response = app.full_dispatch_request()
+        if response.is_json:
+            body = response.get_data()
+        elif response.mimetype.startswith('text/'):
+            body = dumps(response.get_data(as_text=True))
+        else:
+            # Binary payloads (images, downloads) are not inlined
+            body = dumps(None)
+        headers = {h: response.headers[h] for h in BATCH_FORWARDED_HEADERS if h in response.headers}
+        response.close()
+    head = dumps({'path': path, 'status': response.status_code, 'headers': headers})
+    return head[:-1] + b',"body":' + body + b'}'
+
+@app.route('/api/batch', methods=['POST'])
+def batch_requests():
+    """Run several GET requests in one call.
+
+    Body: { requests: ["/api/video/5", "/api/videos/5/comments?limit=20", "/api/check-auth"] }
+    (items may also be { path }). Returns { responses: [{ path, status, headers, body }] } in order.
+    """
+    try:
+        data = request.json or {}
+        items = data.get('requests')
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'requests must be a non-empty list'}), 400
+        if len(items) > MAX_BATCH_REQUESTS:
+            return jsonify({'error': f'At most {MAX_BATCH_REQUESTS} requests per batch'}), 400
+        paths = [item.get('path') if isinstance(item, dict) else item for item in items]
+        for path in paths:
+            if not isinstance(path, str) or not path.startswith('/api/') or path.partition('?')[0].rstrip('/') == '/api/batch':
+                return jsonify({'error': f'Invalid batch path: {path!r}'}), 400
+        parts = [_run_sub_request(path) for path in paths]
+        return json_response(b'{"responses":[' + b','.join(parts) + b']}')
+    except Exception as e:
+        print(f"Error in batch_requests: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+PASSWORD_RETRY_AFTER = 2
+
+def _password_busy():
+    """503 for auth endpoints while the password hashing queue is full."""
+    response = jsonify({'error': 'Server busy, please retry shortly'})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(PASSWORD_RETRY_AFTER)
+    return response
+
 # Updated login endpoint to handle email/password from frontend
 @app.route('/api/login', methods=['POST'])
 def login():
@@ -454,6 +587,8 @@ def login():
             print(f"Failed login attempt for email: {email}")
             return jsonify({'error': 'Invalid credentials'}), 401
             
+    except PasswordServiceBusy:
+        return _password_busy()
     except Exception as e:
         print(f"Error in login: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -519,29 +654,62 @@ def signup():
                 'username': user.username
             }), 201
         return jsonify({'error': 'User creation failed - email may already exist'}), 400
+    except PasswordServiceBusy:
+        return _password_busy()
     except Exception as e:
         print(f"Error in signup: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+MAX_COMMENT_PAGE = 200
+
+def _encode_comment_cursor(before):
+    created_at, comment_id = before
+    raw = f"{created_at.isoformat()}|{comment_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def _decode_comment_cursor(cursor):
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    created_at, comment_id = raw.rsplit('|', 1)
+    return datetime.datetime.fromisoformat(created_at), int(comment_id)
+
 @app.route('/api/videos/<int:video_id>/comments', methods=['GET'])
 def get_comments(video_id):
-    """Get comments for a specific video."""
+    """Get comments for a specific video, newest first, with author username and photo.
+
+    Paginated by ?limit= (default 50) and ?cursor=; the cursor for the next page is in
+    the X-Next-Cursor header (absent on the last page) and X-Total-Count has the total.
+    """
     try:
         video = getVideoById(video_id)
         if not video:
             return jsonify({'error': 'Video not found'}), 404
 
-        comments = getCommentsByVideo(video_id)
-        return jsonify([
+        limit = max(1, min(request.args.get('limit', 50, type=int), MAX_COMMENT_PAGE))
+        before = None
+        cursor = request.args.get('cursor')
+        if cursor:
+            try:
+                before = _decode_comment_cursor(cursor)
+            except Exception:
+                return jsonify({'error': 'Invalid cursor'}), 400
+
+        comments, next_before = getCommentsWithAuthors(video_id, limit=limit, before=before)
+        response = jsonify([
             {
                 'id': c.id,
                 'text': c.text,
                 'user_id': c.user_id,
                 'video_id': c.video_id,
-                'created_at': c.created_at.isoformat()
+                'created_at': c.created_at.isoformat(),
+                'username': c.username,
+                'photoUrl': c.photoUrl
             }
             for c in comments
         ])
+        response.headers['X-Total-Count'] = str(getVideoCounters(video_id)[2])
+        if next_before:
+            response.headers['X-Next-Cursor'] = _encode_comment_cursor(next_before)
+        return response
     except Exception as e:
         print(f"Error in get_comments: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -578,6 +746,114 @@ def add_comment(video_id):
         print(f"Error in add_comment: {str(e)}")
         return jsonify({'error': str(e)}), 500
     
+# Conversation history kept per user and video: last ~20 turns to bound session size
+MAX_CONVERSATION_TURNS = 40
+MAX_BATCH_QUESTIONS = 10
+
+def _parse_clip_request(data):
+    """Read an optional clip from { start, end } or { clip: { start, end } } (seconds or "mm:ss").
+
+    Returns (clip, error). Without a clip, ask_AI infers a window from timestamps in the question.
+    """
+    clip_spec = data.get('clip') if isinstance(data.get('clip'), dict) else data
+    if clip_spec.get('start') is None and clip_spec.get('end') is None:
+        return None, None
+    clip_start = parse_timestamp(clip_spec.get('start')) or 0
+    clip_end = parse_timestamp(clip_spec.get('end'))
+    if clip_end is not None and clip_end <= clip_start:
+        return None, 'Clip end must be after start'
+    return (clip_start, clip_end), None
+
+def _store_probed_duration(video_id, seconds):
+    with app.app_context():
+        updateVideoDuration(video_id, seconds)
+
+def _resolve_video_duration(video):
+    """Duration drives clip clamping and long-video down-sampling; the stored value comes first.
+
+    A missing duration is probed in the background and saved for later asks;
+    this ask goes out without it.
+    """
+    duration = getattr(video, 'duration', None)
+    if duration:
+        remember_video_duration(video.url, duration)
+        return duration
+    video_id = video.id
+    probe_video_duration(video.url, on_result=lambda seconds: _store_probed_duration(video_id, seconds))
+    return None
+
+def _conversation_key(video_id):
+    # Identify user from session or bearer token; fallback to 'anon'
+    user_part = session.get('user_id')
+    if not user_part:
+        principal, _ = bearer_principal()
+        user_part = principal.id if principal else None
+    return f"{user_part if user_part is not None else 'anon'}-{video_id}"
+
+def _append_conversation(key, turns):
+    """Append (question, answer) pairs to the stored conversation, in order."""
+    conversations = session.get('ai_conversations', {})
+    history = conversations.get(key, [])
+    for question, answer in turns:
+        history.append({'role': 'user', 'text': question})
+        history.append({'role': 'model', 'text': answer})
+    if len(history) > MAX_CONVERSATION_TURNS:
+        history = history[-MAX_CONVERSATION_TURNS:]
+    conversations[key] = history
+    session['ai_conversations'] = conversations
+    session.modified = True
+
+def _ai_error_response(e):
+    if isinstance(e, VertexAICredentialsError):
+        print(f"Vertex AI credentials error: {str(e)}")
+        # Print full traceback for cloud logs to aid diagnostics
+        traceback.print_exc()
+        return jsonify({'error': str(e), 'code': 'NO_CREDENTIALS'}), 500
+    print(f"Error in asking video question: {str(e)}")
+    traceback.print_exc()
+    # Provide clearer client messages for common content issues
+    msg = str(e)
+    try:
+        from video_handler import TranscriptUnavailableError
+        if isinstance(e, TranscriptUnavailableError):
+            return jsonify({'error': 'YouTube transcript is unavailable for this video. Try a different video or upload a direct video file.'}), 400
+    except Exception:
+        pass
+    return jsonify({'error': msg}), 500
+
+REACTION_VALUES = {'like': 1, 'dislike': -1, 'none': 0}
+
+def _reaction_counts(video_id, stored=None):
+    """Stored counters (or the given (likes, dislikes)) plus this process's unflushed clicks."""
+    likes, dislikes = stored if stored is not None else getVideoReactionCounts(video_id)
+    pending_likes, pending_dislikes = pending_deltas(video_id)
+    return {'likes': max(0, likes + pending_likes), 'dislikes': max(0, dislikes + pending_dislikes)}
+
+@app.route('/api/videos/<int:video_id>/reaction', methods=['POST'])
+@login_required
+def set_reaction(video_id):
+    """Set the current user's reaction: { reaction: "like" | "dislike" | "none" }. Repeat clicks are no-ops."""
+    try:
+        data = request.json or {}
+        reaction = str(data.get('reaction') or '').lower()
+        if reaction not in REACTION_VALUES:
+            return jsonify({'error': 'reaction must be one of: like, dislike, none'}), 400
+
+        video = getVideoById(video_id)
+        if not video:
+            return jsonify({'error': 'Video not found'}), 404
+
+        result = setVideoReaction(request.current_user_id, video_id, REACTION_VALUES[reaction])
+        if result is None:
+            return jsonify({'error': 'Failed to save reaction'}), 500
+        previous, current = result
+        if previous != current:
+            record_reaction_change(video_id, previous, current)
+        return jsonify({'reaction': reaction, **_reaction_counts(video_id)})
+    except Exception as e:
+        print(f"Error in set_reaction: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/videos/<video_id>/ask', methods=['POST'])
 def ask_video_question(video_id):
     try:
@@ -590,88 +866,118 @@ def ask_video_question(video_id):
             return jsonify({'error': 'Video not found'}), 404
 
         question = data['question']
+        clip, clip_error = _parse_clip_request(data)
+        if clip_error:
+            return jsonify({'error': clip_error}), 400
+        duration = _resolve_video_duration(video)
 
         # Resume conversation per user and video
-        conversations = session.get('ai_conversations', {})
-        # Identify user from session or bearer token; fallback to 'anon'
-        user_part = session.get('user_id')
-        if not user_part:
-            auth = request.headers.get('Authorization')
-            if auth and auth.startswith('Bearer '):
-                token = auth[7:]
-                try:
-                    data_token = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
-                    user_part = data_token.get('user_id')
-                except Exception:
-                    user_part = None
-        key = f"{user_part if user_part is not None else 'anon'}-{video_id}"
-        history = conversations.get(key, [])
+        key = _conversation_key(video_id)
+        history = session.get('ai_conversations', {}).get(key, [])
 
-        answer = ask_AI(video.url, question, history=history)
-
-        # Update history: keep last ~20 turns to bound session size
-        history.append({'role': 'user', 'text': question})
-        history.append({'role': 'model', 'text': answer})
-        if len(history) > 40:
-            history = history[-40:]
-
-        conversations[key] = history
-        session['ai_conversations'] = conversations
-        session.modified = True
+        answer = ask_AI(video.url, question, history=history, clip=clip, duration=duration)
+        _append_conversation(key, [(question, answer)])
 
         return jsonify({
             'question': question,
             'answer': answer
         })
-    except VertexAICredentialsError as e:
-        print(f"Vertex AI credentials error: {str(e)}")
-        # Print full traceback for cloud logs to aid diagnostics
-        traceback.print_exc()
-        return jsonify({'error': str(e), 'code': 'NO_CREDENTIALS'}), 500
     except Exception as e:
-        print(f"Error in asking video question: {str(e)}")
-        traceback.print_exc()
-        # Provide clearer client messages for common content issues
-        msg = str(e)
-        try:
-            from video_handler import TranscriptUnavailableError
-            if isinstance(e, TranscriptUnavailableError):
-                return jsonify({'error': 'YouTube transcript is unavailable for this video. Try a different video or upload a direct video file.'}), 400
-        except Exception:
-            pass
-        return jsonify({'error': msg}), 500
+        return _ai_error_response(e)
+
+@app.route('/api/videos/<video_id>/ask-batch', methods=['POST'])
+def ask_video_questions_batch(video_id):
+    """Answer several questions about one video in a single model request.
+
+    Body: { questions: [..], stream?: bool, start?, end?, clip? }. By default the response
+    is NDJSON: one {index, question, answer} line per answer as it completes, then {done: true}.
+    With stream=false a single JSON object with all answers is returned.
+    """
+    try:
+        data = request.json or {}
+        questions = data.get('questions')
+        if not isinstance(questions, list):
+            return jsonify({'error': 'questions must be a list'}), 400
+        questions = [str(q).strip() for q in questions if q and str(q).strip()]
+        if not questions:
+            return jsonify({'error': 'At least one question required'}), 400
+        if len(questions) > MAX_BATCH_QUESTIONS:
+            return jsonify({'error': f'At most {MAX_BATCH_QUESTIONS} questions per batch'}), 400
+
+        video = getVideoById(video_id)
+        if not video:
+            return jsonify({'error': 'Video not found'}), 404
+
+        clip, clip_error = _parse_clip_request(data)
+        if clip_error:
+            return jsonify({'error': clip_error}), 400
+        duration = _resolve_video_duration(video)
+
+        key = _conversation_key(video_id)
+        history = session.get('ai_conversations', {}).get(key, [])
+        answers_iter = ask_AI_batch(video.url, questions, history=history, clip=clip, duration=duration)
+
+        if not data.get('stream', True):
+            answers = dict(answers_iter)
+            _append_conversation(key, [(q, answers[i]) for i, q in enumerate(questions) if i in answers])
+            return jsonify({'answers': [
+                {'index': i, 'question': q, 'answer': answers.get(i)} for i, q in enumerate(questions)
+            ]})
+
+        # The session cookie goes out with the response headers, before any answer exists,
+        # so store the (possibly empty) conversation now and save again once the stream has finished.
+        _append_conversation(key, [])
+
+        @stream_with_context
+        def generate():
+            answers = {}
+            try:
+                for index, answer in answers_iter:
+                    answers[index] = answer
+                    yield json.dumps({'index': index, 'question': questions[index], 'answer': answer}) + '\n'
+                for i, q in enumerate(questions):
+                    if i not in answers:
+                        yield json.dumps({'index': i, 'question': q, 'error': 'No answer returned'}) + '\n'
+                yield json.dumps({'done': True}) + '\n'
+            except Exception as e:
+                print(f"Error in batch video question stream: {str(e)}")
+                traceback.print_exc()
+                yield json.dumps({'error': str(e)}) + '\n'
+            finally:
+                if answers:
+                    _append_conversation(key, [(q, answers[i]) for i, q in enumerate(questions) if i in answers])
+                    app.session_interface.save_session(app, session, app.response_class())
+
+        return Response(generate(), mimetype='application/x-ndjson')
+    except Exception as e:
+        return _ai_error_response(e)
 
 @app.route('/api/check-auth')
 def check_auth():
     """Check if user is currently authenticated"""
     try:
         # Check JWT token first
-        token = request.headers.get('Authorization')
-        if token and token.startswith('Bearer '):
-            token = token[7:]
-            try:
-                data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
-                user = userProfile(data['user_id'])
-                if user:
-                    return jsonify({
-                        'authenticated': True,
-                        'user_id': user.id,
-                        'username': getattr(user, 'username', user.email),
-                        'login_method': 'token'
-                    })
-            except jwt.ExpiredSignatureError:
-                return jsonify({'authenticated': False, 'error': 'Token expired'})
-            except jwt.InvalidTokenError:
-                return jsonify({'authenticated': False, 'error': 'Invalid token'})
+        principal, error = bearer_principal()
+        if principal is not None:
+            return jsonify({
+                'authenticated': True,
+                'user_id': principal.id,
+                'username': principal.username,
+                'login_method': 'token'
+            })
+        elif error == 'TOKEN_EXPIRED':
+            return jsonify({'authenticated': False, 'error': 'Token expired'})
+        elif error:
+            return jsonify({'authenticated': False, 'error': 'Invalid token'})
         
         # Check session-based auth
         if 'user_id' in session and session.get('logged_in'):
-            user = userProfile(session['user_id'])
-            if user:
+            principal = session_principal(session['user_id'])
+            if principal:
                 return jsonify({
                     'authenticated': True,
-                    'user_id': user.id,
-                    'username': getattr(user, 'username', user.email),
+                    'user_id': principal.id,
+                    'username': principal.username,
                     'login_time': session.get('login_time'),
                     'login_method': 'session'
                 })
@@ -680,7 +986,7 @@ def check_auth():
         
     except Exception as e:
         print(f"Error in check_auth: {str(e)}")
-        return jsonify({'authenticated': False, 'error': str(e)})
+        return jsonify({'authenticated': False, 'error': str(e)}), 500
 
 @app.route('/api/register', methods=['POST'])
 def register():
@@ -702,6 +1008,8 @@ def register():
                 'username': user.username
             }), 201
         return jsonify({'error': 'User creation failed - username may already exist'}), 400
+    except PasswordServiceBusy:
+        return _password_busy()
     except Exception as e:
         print(f"Error in register: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -888,23 +1196,10 @@ def protected_search():
         
         # You can access the current user ID via request.current_user_id
         user = userProfile(request.current_user_id)
-        videos = searchVideo(searchQuery)
+        videos = searchVideo(searchQuery, request.args.get('maxVideo', 5, type=int), columns=shape_columns('search'))
         
-        return jsonify({
-            'user': getattr(user, 'username', user.email),
-            'query': searchQuery,
-            'results': [{
-                'id': v.id,
-                'title': v.title,
-                'description': v.description,
-                'creator': getattr(v, 'author', 'Unknown'),
-                'publishedAt': getattr(v, 'date', datetime.datetime.now()).isoformat(),
-                'category': getattr(v, 'category', 'General'),
-                'viewCount': getattr(v, 'views', 0),
-                'videoUrl': v.url,
-                'imageUrl': v.imageUrl
-            } for v in videos] if videos else []
-        })
+        head = dumps({'user': getattr(user, 'username', user.email), 'query': searchQuery})
+        return json_response(head[:-1] + b',"results":' + video_list_json(videos or [], 'search') + b'}')
     except Exception as e:
         print(f"Error in protected_search: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -929,18 +1224,36 @@ def update_focus_level():
 @app.route('/api/watch-history', methods=['POST'])
 @login_required
 def add_watch_history():
-    """Record a watch event: expects video_id, optional progress [0..1], optional focus_sample [0..1]."""
+    """Record a watch event: expects video_id, optional progress [0..1], optional focus_sample [0..1].
+
+    Heartbeats carrying the same session_id (one per viewing) update a single row; without
+    one, the session defaults to the current UTC day. Writes are buffered and flushed in
+    batches unless WATCH_BUFFER=0.
+    """
     try:
         data = request.json or {}
         vid = data.get('video_id') or data.get('videoId')
         if not vid:
             return jsonify({'error': 'video_id required'}), 400
-        progress = data.get('progress')
-        focus_sample = data.get('focus_sample') or data.get('focusSample')
-        wh = recordWatchHistory(request.current_user_id, int(vid), progress, focus_sample)
+        try:
+            progress = data.get('progress')
+            progress = None if progress is None else float(progress)
+            focus_sample = data.get('focus_sample') or data.get('focusSample')
+            focus_sample = None if focus_sample is None else float(focus_sample)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'progress and focus_sample must be numbers'}), 400
+        session_id = str(data.get('session_id') or data.get('sessionId') or '')[:64]
+        if not session_id:
+            session_id = datetime.datetime.now(datetime.timezone.utc).strftime('day-%Y%m%d')
+
+        buffer = get_watch_buffer()
+        if buffer is not None:
+            buffer.record(request.current_user_id, int(vid), session_id, progress, focus_sample)
+            return jsonify({'message': 'Watch progress buffered', 'session_id': session_id}), 202
+        wh = recordWatchHistory(request.current_user_id, int(vid), progress, focus_sample, session_id=session_id)
         if not wh:
             return jsonify({'error': 'Failed to record watch history'}), 500
-        return jsonify({'message': 'Watch history recorded', 'id': wh.id})
+        return jsonify({'message': 'Watch history recorded', 'id': wh.id, 'session_id': session_id})
     except Exception as e:
         print(f"Error in add_watch_history: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -949,14 +1262,19 @@ def add_watch_history():
 @login_required
 def list_watch_history():
     try:
-        items = getUserWatchHistory(request.current_user_id)
+        limit = max(1, min(request.args.get('limit', WATCH_HISTORY_LIMIT, type=int), WATCH_HISTORY_LIMIT))
+        items = getUserWatchHistory(request.current_user_id, limit)
         return jsonify([
             {
                 'id': i.id,
                 'video_id': i.video_id,
                 'watched_at': i.watched_at.isoformat(),
                 'progress': i.progress,
-                'focus_sample': i.focus_sample
+                'focus_sample': i.focus_sample,
+                'session_id': i.session_id,
+                # Entries older than the retention window are daily aggregates of several events
+                'rolled_up': i.rolled_up,
+                'event_count': i.event_count
             } for i in items
         ])
     except Exception as e:
@@ -985,6 +1303,7 @@ def add_sample_data():
                 created.board = v.get("board")
                 created.topic = v.get("topic")
         db.session.commit()
+        bumpCatalogVersion()
         
         return jsonify({'message': 'Sample data added successfully', 'count': len(sample_videos)})
     except Exception as e:
@@ -1000,4 +1319,9 @@ def debug_session():
     })
 
 if __name__ == '__main__':
+    # Local development server: bring the schema up to date before serving
+    with app.app_context():
+        run_migrations(db.engine)
+    # Hash inline: spawned pool processes would re-import this script, and with it the app setup
+    password_service.workers = 0
     app.run(port=8080, debug=True)
@@ -0,0 +1,134 @@
+"""
+Short-lived response cache for anonymous traffic.
+
+Anonymous requests to the same route with the same arguments get the same
+payload, so during a spike one computation can serve everyone for a couple of
+seconds. MicroCache keeps values for MICRO_CACHE_TTL seconds (default 2) and
+collapses concurrent misses for a key into one computation. After the TTL a
+value stays usable for MICRO_CACHE_STALE seconds more (default 5): the first
+caller recomputes it while concurrent callers keep getting the stale value
+(stale-while-revalidate).
+
+micro_cached(key_fn) applies the cache to a view only when the request carries
+no Authorization header and no logged-in session. key_fn(**view_args) supplies
+the version stamps the payload depends on, so a catalog or counter change
+starts a new entry instead of waiting for the TTL.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from functools import wraps
+
+from flask import Response, request, session
+
+EXCLUDED_HEADERS = ('Set-Cookie', 'Content-Length')
+CachedResponse = namedtuple('CachedResponse', ['body', 'headers'])
+
+
+def _env_float(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+class MicroCache:
+    def __init__(self, ttl=2.0, stale_ttl=5.0, max_entries=1024):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (value, fresh until, stale until)
+        self._key_locks = {}  # key -> [lock, callers holding or waiting on it]
+        self._lock = threading.Lock()
+
+    def _hold_key_lock(self, key):
+        with self._lock:
+            slot = self._key_locks.get(key)
+            if slot is None:
+                slot = self._key_locks[key] = [threading.Lock(), 0]
+            slot[1] += 1
+            return slot
+
+    def _drop_key_lock(self, key, slot):
+        # The last caller out removes the lock, so keys that never get stored do not accumulate
+        with self._lock:
+            slot[1] -= 1
+            if slot[1] == 0 and self._key_locks.get(key) is slot:
+                del self._key_locks[key]
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value for key, or compute() -> (value, cacheable) once for all waiting callers."""
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry and now < entry[1]:
+            return entry[0]
+        slot = self._hold_key_lock(key)
+        lock = slot[0]
+        try:
+            if entry and now < entry[2]:
+                # Stale: one caller refreshes, everyone else is served the old value meanwhile
+                if not lock.acquire(blocking=False):
+                    return entry[0]
+            else:
+                lock.acquire()
+                entry = self._entries.get(key)
+                if entry and time.monotonic() < entry[1]:
+                    lock.release()
+                    return entry[0]
+            try:
+                value, cacheable = compute()
+                if cacheable:
+                    self._store(key, value)
+                return value
+            finally:
+                lock.release()
+        finally:
+            self._drop_key_lock(key, slot)
+
+    def _store(self, key, value):
+        now = time.monotonic()
+        with self._lock:
+            self._entries[key] = (value, now + self.ttl, now + self.ttl + self.stale_ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+micro_cache = MicroCache(
+    ttl=_env_float('MICRO_CACHE_TTL', 2.0),
+    stale_ttl=_env_float('MICRO_CACHE_STALE', 5.0),
+)
+
+
+def is_anonymous_request():
+    return not request.headers.get('Authorization') and not session.get('user_id')
+
+
+def micro_cached(key_fn):
+    """Serve anonymous requests for a view from micro_cache; 200 responses are cached."""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if micro_cache.ttl <= 0 or not is_anonymous_request():
+                return f(*args, **kwargs)
+            key = (request.endpoint, tuple(sorted(request.args.items(multi=True))), key_fn(**kwargs))
+
+            def compute():
+                response = f(*args, **kwargs)
+                if not isinstance(response, Response) or response.status_code != 200 or response.is_streamed:
+                    return response, False
+                headers = [(k, v) for k, v in response.headers.items() if k not in EXCLUDED_HEADERS]
+                return CachedResponse(response.get_data(), headers), True
+
+            cached = micro_cache.get_or_compute(key, compute)
+            if isinstance(cached, CachedResponse):
+                return Response(cached.body, status=200, headers=cached.headers)
+            return cached
+        return decorated_function
+    return decorator
@@ -0,0 +1,23 @@
+import argparse
+from main import app
+from models import db
+from migrations import MIGRATIONS, LATEST_VERSION, get_schema_version, run_migrations
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Apply pending database schema migrations')
+    parser.add_argument('--status', action='store_true', help='Show the current schema version and pending migrations, without applying them')
+    parser.add_argument('--to', type=int, default=None, help=f'Migrate up to this version (default: latest, {LATEST_VERSION})')
+    args = parser.parse_args()
+
+    with app.app_context():
+        current = get_schema_version(db.engine)
+        pending = [(v, d) for v, d, _ in MIGRATIONS if v > current and (args.to is None or v <= args.to)]
+        print(f"Schema version: {current} (latest {LATEST_VERSION})")
+        if args.status:
+            for version, description in pending:
+                print(f"  pending {version}: {description}")
+        elif not pending:
+            print("Nothing to migrate.")
+        else:
+            run_migrations(db.engine, target=args.to)
+            print(f"Schema version: {get_schema_version(db.engine)}")
@@ -0,0 +1,174 @@
+"""
+Versioned schema migrations for the SQLite database.
+
+Each migration is a (version, description, function) entry in MIGRATIONS, applied
+in order inside its own transaction; the applied versions are recorded in the
+schema_version table. Migrations run once per deploy via `python migrate.py`.
+App processes only compare the recorded version with LATEST_VERSION at startup.
+
+Steps must be idempotent: databases created before this runner existed already
+have some of the tables and columns a step adds.
+"""
+
+import datetime
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError
+from werkzeug.security import generate_password_hash
+
+from models import User, Video, Comment, WatchHistory, WatchHistoryRollup, VideoReaction, UserSession, ImportCheckpoint, youtubeVideoId
+from password_service import HASH_METHOD, is_password_hash
+
+SCHEMA_VERSION_TABLE = 'schema_version'
+
+
+def _column_names(conn, table):
+    return {col['name'] for col in inspect(conn).get_columns(table)}
+
+
+def _add_column(conn, table, column, ddl):
+    if column not in _column_names(conn, table):
+        conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+
+
+def _create_tables(conn, *models):
+    for model in models:
+        model.__table__.create(conn, checkfirst=True)
+
+
+def _m001_baseline(conn):
+    """Core tables plus the columns ensure_reaction_columns used to add at import time."""
+    _create_tables(conn, User, Video, Comment, WatchHistory)
+    _add_column(conn, 'videos', 'likes', 'INTEGER DEFAULT 0')
+    _add_column(conn, 'videos', 'dislikes', 'INTEGER DEFAULT 0')
+    _add_column(conn, 'videos', 'board', 'VARCHAR(50)')
+    _add_column(conn, 'videos', 'topic', 'VARCHAR(100)')
+    _add_column(conn, 'videos', 'duration', 'INTEGER')
+    _add_column(conn, 'users', 'focus_level', 'FLOAT')
+
+
+def _m002_read_path_indexes(conn):
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_comments_video_created ON comments (video_id, created_at)'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_watch_histories_user_watched ON watch_histories (user_id, watched_at)'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_videos_topic ON videos (topic)'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_videos_board ON videos (board)'))
+
+
+def _m003_watch_sessions(conn):
+    _add_column(conn, 'watch_histories', 'session_id', 'VARCHAR(64)')
+    conn.execute(text('CREATE UNIQUE INDEX IF NOT EXISTS uq_watch_histories_session '
+                      'ON watch_histories (user_id, video_id, session_id)'))
+
+
+def _m004_watch_history_rollups(conn):
+    _create_tables(conn, WatchHistoryRollup)
+
+
+def _m005_video_reactions(conn):
+    _create_tables(conn, VideoReaction)
+
+
+def _m006_comment_counts(conn):
+    _add_column(conn, 'videos', 'comment_count', 'INTEGER NOT NULL DEFAULT 0')
+    conn.execute(text('UPDATE videos SET comment_count = '
+                      '(SELECT COUNT(*) FROM comments WHERE comments.video_id = videos.id)'))
+
+
+def _m007_sessions(conn):
+    _create_tables(conn, UserSession)
+
+
+def _m008_youtube_ids(conn):
+    """Backfill youtube_id from url and make it unique; duplicate rows after the first keep NULL."""
+    _add_column(conn, 'videos', 'youtube_id', 'VARCHAR(16)')
+    seen = set()
+    updates = []
+    for video_id, url in conn.execute(text('SELECT id, url FROM videos WHERE youtube_id IS NULL ORDER BY id')):
+        youtube_id = youtubeVideoId(url)
+        if youtube_id and youtube_id not in seen:
+            seen.add(youtube_id)
+            updates.append({'id': video_id, 'youtube_id': youtube_id})
+    if updates:
+        conn.execute(text('UPDATE videos SET youtube_id = :youtube_id WHERE id = :id'), updates)
+    conn.execute(text('CREATE UNIQUE INDEX IF NOT EXISTS uq_videos_youtube_id ON videos (youtube_id)'))
+
+
+def _m009_topic_confidence(conn):
+    _add_column(conn, 'videos', 'topic_confidence', 'FLOAT')
+
+
+def _m010_import_checkpoints(conn):
+    _create_tables(conn, ImportCheckpoint)
+
+
+def _m011_hash_plaintext_passwords(conn):
+    """Hash passwords older imports stored as plain text; login accepts hashes only."""
+    updates = [
+        {'id': user_id, 'password': generate_password_hash(password, method=HASH_METHOD)}
+        for user_id, password in conn.execute(text('SELECT id, password FROM users'))
+        if password and not is_password_hash(password)
+    ]
+    if updates:
+        conn.execute(text('UPDATE users SET password = :password WHERE id = :id'), updates)
+
+
+MIGRATIONS = [
+    (1, 'baseline tables and legacy columns', _m001_baseline),
+    (2, 'indexes for comment, watch history and board/topic reads', _m002_read_path_indexes),
+    (3, 'watch history session_id with one row per viewing session', _m003_watch_sessions),
+    (4, 'daily watch history rollups', _m004_watch_history_rollups),
+    (5, 'per-user video reactions', _m005_video_reactions),
+    (6, 'cached per-video comment counts', _m006_comment_counts),
+    (7, 'server-side session store', _m007_sessions),
+    (8, 'canonical YouTube ids with a unique index', _m008_youtube_ids),
+    (9, 'classifier confidence for video board/topic', _m009_topic_confidence),
+    (10, 'checkpoints for resumable imports', _m010_import_checkpoints),
+    (11, 'hash legacy plaintext passwords', _m011_hash_plaintext_passwords),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(engine):
+    """Return the highest applied migration version, or 0 for an unversioned database."""
+    try:
+        with engine.connect() as conn:
+            return conn.execute(text(f'SELECT MAX(version) FROM {SCHEMA_VERSION_TABLE}')).scalar() or 0
+    except OperationalError:
+        return 0
+
+
+def run_migrations(engine, target=None):
+    """Apply pending migrations up to target (default: latest). Returns the applied versions."""
+    target = LATEST_VERSION if target is None else target
+    with engine.begin() as conn:
+        conn.execute(text(
+            f'CREATE TABLE IF NOT EXISTS {SCHEMA_VERSION_TABLE} ('
+            'version INTEGER PRIMARY KEY, description VARCHAR(200) NOT NULL, applied_at DATETIME NOT NULL)'
+        ))
+    current = get_schema_version(engine)
+    applied = []
+    for version, description, step in MIGRATIONS:
+        if version <= current or version > target:
+            continue
+        with engine.begin() as conn:
+            step(conn)
+            conn.execute(
+                text(f'INSERT INTO {SCHEMA_VERSION_TABLE} (version, description, applied_at) VALUES (:v, :d, :t)'),
+                {'v': version, 'd': description, 't': datetime.datetime.utcnow()},
+            )
+        print(f"Applied migration {version}: {description}")
+        applied.append(version)
+    return applied
+
+
+def check_schema_version(engine):
+    """Startup check: one query, no introspection. Returns True when the schema is current."""
+    current = get_schema_version(engine)
+    if current < LATEST_VERSION:
+        print(f"WARNING: database schema is at version {current}, code expects {LATEST_VERSION}. "
+              f"Run `python migrate.py` to upgrade.")
+        return False
+    if current > LATEST_VERSION:
+        print(f"WARNING: database schema version {current} is newer than this code ({LATEST_VERSION}).")
+    return True
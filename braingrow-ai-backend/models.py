@@ -1,7 +1,15 @@
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+import re
+from collections import namedtuple
+from datetime import datetime, timedelta
 from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from versions import bump_version
+from video_cache import video_cache, VideoRecord, CATALOG_VERSION
+from catalog_snapshot import current_snapshot
+from classifier import resolve_board_topic, BOARDS, TOPIC_BOARDS
+from password_service import hash_password, verify_password, PasswordServiceBusy
 
 db = SQLAlchemy()
 
@@ -25,6 +33,11 @@ class User(db.Model):
 # Video Model
 class Video(db.Model):
     __tablename__ = 'videos'
+    __table_args__ = (
+        db.Index('ix_videos_topic', 'topic'),
+        db.Index('ix_videos_board', 'board'),
+        db.Index('uq_videos_youtube_id', 'youtube_id', unique=True),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
@@ -37,6 +50,14 @@ class Video(db.Model):
     # New structured categorization
     board = db.Column(db.String(50), nullable=True)  # e.g., math, science, English
     topic = db.Column(db.String(100), nullable=True)  # e.g., algebra, AI, grammar
+    # Length in seconds, cached from the source the first time the AI tutor needs it
+    duration = db.Column(db.Integer, nullable=True)
+    # Maintained by addComment so list endpoints can show counts without COUNT(*) scans
+    comment_count = db.Column(db.Integer, default=0, server_default=db.text('0'), nullable=False)
+    # Canonical 11-character YouTube id parsed from url; unique so re-imports update instead of duplicating
+    youtube_id = db.Column(db.String(16), nullable=True)
+    # How sure the catalog classifier was about board/topic (1.0 = set explicitly to a catalog topic)
+    topic_confidence = db.Column(db.Float, nullable=True)
     
     def __repr__(self):
         return f"Video('{self.title}', '{self.description}', '{self.url}', '{self.tags}', '{self.imageUrl}')"
@@ -45,6 +66,9 @@ class Video(db.Model):
 # Comment Model
 class Comment(db.Model):
     __tablename__ = 'comments'
+    __table_args__ = (
+        db.Index('ix_comments_video_created', 'video_id', 'created_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     text = db.Column(db.Text, nullable=False)
@@ -62,6 +86,11 @@ class Comment(db.Model):
 # Watch History Model
 class WatchHistory(db.Model):
     __tablename__ = 'watch_histories'
+    __table_args__ = (
+        db.Index('ix_watch_histories_user_watched', 'user_id', 'watched_at'),
+        # One upsertable row per viewing session; legacy rows have no session_id
+        db.Index('uq_watch_histories_session', 'user_id', 'video_id', 'session_id', unique=True),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -69,21 +98,146 @@ class WatchHistory(db.Model):
     watched_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     progress = db.Column(db.Float, nullable=True)  # 0..1 watched ratio
     focus_sample = db.Column(db.Float, nullable=True)  # optional 0..1 focus measure per session
+    session_id = db.Column(db.String(64), nullable=True)  # client viewing session
+
+    rolled_up = False
+    event_count = 1
 
     user = db.relationship('User', backref=db.backref('watch_histories', lazy=True))
     video = db.relationship('Video', backref=db.backref('watch_histories', lazy=True))
 
+# One row per user and video; the likes/dislikes counters on videos are derived from these
+class VideoReaction(db.Model):
+    __tablename__ = 'video_reactions'
+    __table_args__ = (
+        db.Index('uq_video_reactions_user_video', 'user_id', 'video_id', unique=True),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    video_id = db.Column(db.Integer, db.ForeignKey('videos.id'), nullable=False)
+    value = db.Column(db.SmallInteger, nullable=False)  # 1 = like, -1 = dislike, 0 = cleared (row kept)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# Daily per-(user, video) aggregate of watch events older than the retention window
+class WatchHistoryRollup(db.Model):
+    __tablename__ = 'watch_history_rollups'
+    __table_args__ = (
+        db.Index('uq_watch_history_rollups_day', 'user_id', 'video_id', 'day', unique=True),
+        db.Index('ix_watch_history_rollups_user_day', 'user_id', 'day'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    video_id = db.Column(db.Integer, db.ForeignKey('videos.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    max_progress = db.Column(db.Float, nullable=True)
+    # Sum and count rather than a mean so repeated compactions merge exactly
+    focus_sum = db.Column(db.Float, default=0.0, nullable=False)
+    focus_count = db.Column(db.Integer, default=0, nullable=False)
+    event_count = db.Column(db.Integer, default=0, nullable=False)
+
+    # Read-side compatibility with WatchHistory rows
+    rolled_up = True
+    session_id = None
+
+    @property
+    def watched_at(self):
+        return datetime.combine(self.day, datetime.min.time())
+
+    @property
+    def progress(self):
+        return self.max_progress
+
+    @property
+    def focus_sample(self):
+        return self.focus_sum / self.focus_count if self.focus_count else None
+
+# Server-side Flask sessions (session_store.py); the cookie only carries the sid
+class UserSession(db.Model):
+    __tablename__ = 'sessions'
+
+    sid = db.Column(db.String(64), primary_key=True)
+    data = db.Column(db.Text, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+# Progress of resumable bulk imports (import_progress.py); one row per job, written with each batch
+class ImportCheckpoint(db.Model):
+    __tablename__ = 'import_checkpoints'
+
+    job = db.Column(db.String(300), primary_key=True)  # e.g. "videos:/data/catalog.txt"
+    file_size = db.Column(db.Integer, nullable=False)
+    byte_offset = db.Column(db.Integer, nullable=False)  # where the next batch starts reading
+    line_number = db.Column(db.Integer, nullable=False)
+    batch_number = db.Column(db.Integer, nullable=False)
+    rows_done = db.Column(db.Integer, nullable=False)
+    state = db.Column(db.Text, nullable=True)  # parser context as JSON, e.g. the current section header
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
 # Video Database Functions
-def searchVideo(searchQuery: str, maxVideo: int):
-    return Video.query.filter(
+
+# Lightweight rows for list endpoints: plain tuples, not tracked by the session
+VIDEO_ROW_COLUMNS = ('id', 'title', 'description', 'url', 'tags', 'imageUrl', 'board', 'topic', 'comment_count')
+VideoRow = namedtuple('VideoRow', VIDEO_ROW_COLUMNS)
+
+def _videoRowSelect(columns=None):
+    """SELECT of the VideoRow columns; columns not in `columns` come back as NULL without being read."""
+    table = Video.__table__
+    return db.select(*[
+        table.c[name] if columns is None or name in columns or name == 'id' else db.null().label(name)
+        for name in VIDEO_ROW_COLUMNS
+    ])
+
+def _videoRows(stmt):
+    return [VideoRow._make(row) for row in db.session.execute(stmt)]
+
+def searchVideo(searchQuery: str, maxVideo: int = 5, columns=None):
+    return _videoRows(_videoRowSelect(columns).where(
         db.or_(
             Video.title.like('%' + searchQuery + '%'),
             Video.tags.like('%' + searchQuery + '%')
         )
-    ).limit(maxVideo).all()
+    ).limit(maxVideo))
+
+def getRecommendedVideos(limit: int = 5, columns=None):
+    return _videoRows(_videoRowSelect(columns).order_by(func.random()).limit(limit))
+
+def getVideosByIds(ids, columns=None):
+    """Rows for the given ids in one IN query, in the order requested (unknown ids are skipped)."""
+    rows = {row.id: row for row in _videoRows(_videoRowSelect(columns).where(Video.id.in_(ids)))}
+    return [rows[i] for i in ids if i in rows]
+
+def getVideosByTopic(topic, exclude_ids=(), limit: int = 10, columns=None):
+    return _videoRows(_videoRowSelect(columns).where(
+        Video.topic == topic, ~Video.id.in_(exclude_ids)
+    ).limit(limit))
 
-def getRecommendedVideos(limit: int = 5):
-    return Video.query.order_by(func.random()).limit(limit).all()
+def getVideosMatchingKeyword(keyword, exclude_ids=(), limit: int = 10, columns=None):
+    """Videos whose tags/title/description contain keyword, or whose board/topic equals it.
+
+    Catalog board and topic names are answered from the board/topic indexes first;
+    the LIKE scan only runs when those do not fill the limit.
+    """
+    rows = []
+    if keyword in TOPIC_BOARDS or keyword in BOARDS:
+        column = Video.topic if keyword in TOPIC_BOARDS else Video.board
+        rows = _videoRows(_videoRowSelect(columns).where(
+            column == keyword, ~Video.id.in_(exclude_ids)
+        ).limit(limit))
+        if len(rows) >= limit:
+            return rows
+        exclude_ids = set(exclude_ids) | {row.id for row in rows}
+    like = f"%{keyword}%"
+    return rows + _videoRows(_videoRowSelect(columns).where(
+        db.or_(
+            Video.tags.like(like),
+            Video.title.like(like),
+            Video.description.like(like),
+            Video.board == keyword,
+            Video.topic == keyword,
+        ),
+        ~Video.id.in_(exclude_ids)
+    ).limit(limit - len(rows)))
 
 def getRecommendedVideosForUser(user_id: int, limit: int = 10):
     """Personalized recommendation using user's tendency, focus level, and watch history.
@@ -110,12 +264,12 @@ def getRecommendedVideosForUser(user_id: int, limit: int = 10):
     focus_level = user.focus_level if user.focus_level is not None else 0.5
 
     # Build history statistics per board/topic and watched videos set
-    histories = WatchHistory.query.filter_by(user_id=user.id).all()
+    histories = getUserWatchHistory(user.id)
     watched_video_ids = {h.video_id for h in histories}
     board_stats = {}
     topic_stats = {}
     for h in histories:
-        v = h.video or Video.query.get(h.video_id)
+        v = getVideoById(h.video_id)
         if not v:
             continue
         prog = h.progress if h.progress is not None else 0.0
@@ -141,7 +295,7 @@ def getRecommendedVideosForUser(user_id: int, limit: int = 10):
         return 0.0
 
     # Score all videos
-    videos = Video.query.all()
+    videos = _videoRows(_videoRowSelect({'title', 'url', 'tags', 'imageUrl', 'board', 'topic', 'comment_count'}))
     scored = []
     for v in videos:
         # Base match with tendency keywords
@@ -170,23 +324,109 @@ def getRecommendedVideosForUser(user_id: int, limit: int = 10):
     scored.sort(key=lambda sv: sv[0], reverse=True)
     return [v for _, v in scored[:limit]]
 
+def _runWrite(apply):
+    """Run apply (session changes, no commit) and commit it.
+
+    With the write executor enabled (DB_WRITE_EXECUTOR=1) apply runs on the
+    per-process writer thread and is committed together with other queued writes.
+    """
+    from write_queue import get_write_executor
+    executor = get_write_executor()
+    if executor is None:
+        result = apply()
+        db.session.commit()
+        return result
+    result = executor.run(apply)
+    # The writer committed through its own session; drop rows this session has cached
+    db.session.expire_all()
+    return result
+
+def _loadVideoRecord(video_id):
+    video = db.session.get(Video, video_id)
+    if not video:
+        return None
+    return VideoRecord(video.id, video.title, video.description, video.url, video.tags,
+                       video.imageUrl, video.board, video.topic, video.duration)
+
 def getVideoById(video_id):
-    return Video.query.filter_by(id=video_id).first()
+    """Return the video's immutable VideoRecord (from the catalog snapshot or the per-process cache), or None.
+
+    Counters (likes, dislikes, comment_count) are not part of the record; read them
+    with getVideoCounters.
+    """
+    try:
+        video_id = int(video_id)
+    except (TypeError, ValueError):
+        return None
+    # The shared mmap snapshot is authoritative while it matches the catalog version
+    snapshot = current_snapshot()
+    if snapshot is not None:
+        return snapshot.get(video_id)
+    return video_cache.get(video_id, _loadVideoRecord)
+
+def bumpCatalogVersion():
+    """Invalidate cached video records in every worker; call after committing catalog changes."""
+    try:
+        bump_version(CATALOG_VERSION)
+    except OSError as e:
+        print(f"Error bumping catalog version: {e}")
+        video_cache.clear()
+
+# Bumped when per-video counters (comments, likes/dislikes) change; part of HTTP ETags
+ENGAGEMENT_VERSION = 'engagement'
+
+def bumpEngagementVersion():
+    try:
+        bump_version(ENGAGEMENT_VERSION)
+    except OSError as e:
+        print(f"Error bumping engagement version: {e}")
+
+def updateVideoDuration(video_id, duration):
+    def apply():
+        video = Video.query.get(video_id)
+        if not video:
+            return False
+        video.duration = int(duration)
+        return True
+    try:
+        updated = _runWrite(apply)
+        if updated:
+            bumpCatalogVersion()
+        return updated
+    except Exception as e:
+        print(f"Error in updateVideoDuration: {e}")
+        db.session.rollback()
+        return False
 
 def getAllVideos():
     return Video.query.all()
 
+_YOUTUBE_ID_RE = re.compile(
+    r'(?:youtube(?:-nocookie)?\.com/(?:watch\?(?:.*&)?v=|embed/|shorts/|live/|v/)|youtu\.be/)([A-Za-z0-9_-]{11})(?![A-Za-z0-9_-])'
+)
+
+def youtubeVideoId(url):
+    """Canonical YouTube video id for any watch/short/embed/youtu.be URL, or None."""
+    match = _YOUTUBE_ID_RE.search(url or '')
+    return match.group(1) if match else None
+
 def addVideo(title, description, url, tags, imageUrl):
     try:
+        board, topic, confidence = resolve_board_topic(title, description, tags)
         video = Video(
             title=title,
             description=description,
             url=url,
             tags=tags,
-            imageUrl=imageUrl
+            imageUrl=imageUrl,
+            board=board,
+            topic=topic,
+            topic_confidence=confidence,
+            youtube_id=youtubeVideoId(url)
         )
         db.session.add(video)
         db.session.commit()
+        bumpCatalogVersion()
         return video
     except Exception as e:
         print(f"Error adding video: {e}")
@@ -195,6 +435,7 @@ def addVideo(title, description, url, tags, imageUrl):
 
 def addVideoDetailed(title, description, url, imageUrl, board=None, topic=None, tags=None):
     try:
+        board, topic, confidence = resolve_board_topic(title, description, tags, board, topic)
         video = Video(
             title=title,
             description=description,
@@ -202,10 +443,13 @@ def addVideoDetailed(title, description, url, imageUrl, board=None, topic=None,
             tags=tags or '',
             imageUrl=imageUrl,
             board=board,
-            topic=topic
+            topic=topic,
+            topic_confidence=confidence,
+            youtube_id=youtubeVideoId(url)
         )
         db.session.add(video)
         db.session.commit()
+        bumpCatalogVersion()
         return video
     except Exception as e:
         print(f"Error adding detailed video: {e}")
@@ -213,12 +457,135 @@ def addVideoDetailed(title, description, url, imageUrl, board=None, topic=None,
         return None
 
 
+# Reaction Database Functions
+def setVideoReaction(user_id, video_id, value):
+    """Set a user's reaction (1 like, -1 dislike, 0 none). Returns (previous, current) or None on error.
+
+    Only the per-user record is written here; callers apply the counter change
+    (previous -> current) to videos.likes/dislikes, normally through the batched
+    counter buffer in reaction_counters.py. The row is upserted first, which
+    takes the write lock, so the value read next is the latest one even when the
+    same user reacts from two requests at once. Clearing keeps the row at 0.
+    """
+    table = VideoReaction.__table__
+    def apply():
+        now = datetime.utcnow()
+        stmt = sqlite_insert(table).values(user_id=user_id, video_id=video_id, value=0, updated_at=now)
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=['user_id', 'video_id'], set_={'updated_at': stmt.excluded.updated_at},
+        ))
+        previous = db.session.execute(
+            db.select(table.c.value).where(table.c.user_id == user_id, table.c.video_id == video_id)
+        ).scalar() or 0
+        if previous != value:
+            db.session.execute(
+                table.update().where(table.c.user_id == user_id, table.c.video_id == video_id).values(value=value)
+            )
+        return previous, value
+    try:
+        return _runWrite(apply)
+    except Exception as e:
+        print(f"Error in setVideoReaction: {e}")
+        db.session.rollback()
+        return None
+
+def applyReactionCounterDeltas(deltas):
+    """Apply {video_id: (likes_delta, dislikes_delta)} as one batched UPDATE ... SET likes = likes + ?."""
+    rows = [{'vid': vid, 'dl': dl, 'dd': dd} for vid, (dl, dd) in deltas.items() if dl or dd]
+    if not rows:
+        return 0
+    def apply():
+        db.session.execute(
+            db.text('UPDATE videos SET likes = COALESCE(likes, 0) + :dl, dislikes = COALESCE(dislikes, 0) + :dd WHERE id = :vid'),
+            rows,
+        )
+        return len(rows)
+    try:
+        applied = _runWrite(apply)
+        bumpEngagementVersion()
+        return applied
+    except Exception as e:
+        print(f"Error in applyReactionCounterDeltas: {e}")
+        db.session.rollback()
+        return 0
+
+def reconcileReactionCounters(settle_seconds):
+    """Recompute videos.likes/dislikes from video_reactions and fix rows that drifted. Returns the count fixed.
+
+    Buffered counter deltas live in memory, so a crash loses them. Videos with a
+    reaction change in the last settle_seconds are skipped, because a worker may
+    still hold an unflushed delta for them.
+    """
+    reactions = VideoReaction.__table__
+    videos = Video.__table__
+    cutoff = datetime.utcnow() - timedelta(seconds=settle_seconds)
+    try:
+        counted = {
+            row.video_id: row for row in db.session.execute(
+                db.select(
+                    reactions.c.video_id,
+                    func.sum(db.case((reactions.c.value == 1, 1), else_=0)).label('likes'),
+                    func.sum(db.case((reactions.c.value == -1, 1), else_=0)).label('dislikes'),
+                    func.max(reactions.c.updated_at).label('changed'),
+                ).group_by(reactions.c.video_id)
+            )
+        }
+        stored = db.session.execute(
+            db.select(videos.c.id, videos.c.likes, videos.c.dislikes)
+            .where(db.or_(videos.c.likes != 0, videos.c.dislikes != 0,
+                          videos.c.id.in_(db.select(reactions.c.video_id))))
+        ).all()
+        db.session.rollback()
+        fixes = []
+        for video_id, likes, dislikes in stored:
+            row = counted.get(video_id)
+            if row is not None and row.changed and row.changed > cutoff:
+                continue
+            expected = (row.likes, row.dislikes) if row is not None else (0, 0)
+            if (likes or 0, dislikes or 0) != expected:
+                fixes.append({'vid': video_id, 'likes': expected[0], 'dislikes': expected[1],
+                              'old_likes': likes, 'old_dislikes': dislikes})
+        if not fixes:
+            return 0
+        def apply():
+            # A flush that landed since the read changes the stored values; that video waits for the next run
+            db.session.execute(db.text(
+                'UPDATE videos SET likes = :likes, dislikes = :dislikes '
+                'WHERE id = :vid AND likes IS :old_likes AND dislikes IS :old_dislikes'
+            ), fixes)
+            return len(fixes)
+        fixed = _runWrite(apply)
+        bumpEngagementVersion()
+        return fixed
+    except Exception as e:
+        print(f"Error in reconcileReactionCounters: {e}")
+        db.session.rollback()
+        return 0
+
+def getVideoCounters(video_id):
+    """Return (likes, dislikes, comment_count) as stored for the video."""
+    row = db.session.execute(
+        db.select(Video.likes, Video.dislikes, Video.comment_count).where(Video.id == video_id)
+    ).first()
+    return (row.likes or 0, row.dislikes or 0, row.comment_count or 0) if row else (0, 0, 0)
+
+def getVideoReactionCounts(video_id):
+    likes, dislikes, _ = getVideoCounters(video_id)
+    return likes, dislikes
+
 # Comment Database Functions
 def addComment(text, user_id, video_id):
-    try:
+    def apply():
         comment = Comment(text=text, user_id=user_id, video_id=video_id)
         db.session.add(comment)
-        db.session.commit()
+        Video.query.filter_by(id=video_id).update(
+            {Video.comment_count: func.coalesce(Video.comment_count, 0) + 1},
+            synchronize_session=False,
+        )
+        return comment
+    try:
+        comment = _runWrite(apply)
+        bumpEngagementVersion()
         return comment
     except Exception as e:
         print(f"Error adding comment: {e}")
@@ -229,22 +596,63 @@ def addComment(text, user_id, video_id):
 def getCommentsByVideo(video_id):
     return Comment.query.filter_by(video_id=video_id).order_by(Comment.created_at.desc()).all()
 
+def getCommentsWithAuthors(video_id, limit=50, before=None):
+    """One page of comments, newest first, with author username/photoUrl from a single join.
+
+    before is the (created_at, id) of the last comment on the previous page (keyset
+    pagination). Returns (rows, next_before) where next_before is None on the last page.
+    """
+    query = db.select(
+        Comment.id, Comment.text, Comment.user_id, Comment.video_id, Comment.created_at,
+        User.username, User.photoUrl,
+    ).join(User, User.id == Comment.user_id).where(Comment.video_id == video_id)
+    if before:
+        before_created, before_id = before
+        query = query.where(db.or_(
+            Comment.created_at < before_created,
+            db.and_(Comment.created_at == before_created, Comment.id < before_id),
+        ))
+    rows = db.session.execute(
+        query.order_by(Comment.created_at.desc(), Comment.id.desc()).limit(limit + 1)
+    ).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, (rows[-1].created_at, rows[-1].id)
+    return rows, None
+
 # User Database Functions
 def userLogin(email, password):
     try:
         user = User.query.filter_by(email=email).first()
-        # Verify using hashed password check
-        if user and check_password_hash(user.password, password):
+        # Verify on the password pool; a hash with outdated parameters comes back upgraded
+        ok, new_hash = verify_password(user.password, password) if user else (False, None)
+        if ok:
+            if new_hash:
+                _upgradePasswordHash(user.id, new_hash)
             return user
         # Optional debug output; avoid leaking hashes in production logs
         print(f"Wrong password for: {email}")
         return None
+    except PasswordServiceBusy:
+        raise
     except Exception as e:
         print(f"Error in userLogin: {e}")
         return None
 
-def userRegister(username, password, email=None):
+def _upgradePasswordHash(user_id, new_hash):
+    def apply():
+        user = db.session.get(User, user_id)
+        if user:
+            user.password = new_hash
     try:
+        _runWrite(apply)
+    except Exception as e:
+        # The login still succeeds; the upgrade is retried on the next one
+        print(f"Error upgrading password hash: {e}")
+        db.session.rollback()
+
+def userRegister(username, password, email=None):
+    def apply():
         # If username already exists, generate a unique variant by appending a numeric suffix
         base_username = (username or '').strip()
         if not base_username:
@@ -269,7 +677,6 @@ def userRegister(username, password, email=None):
                 return None
         
         # Create new user with hashed password
-        hashed_password = generate_password_hash(password)
         user = User(
             username=candidate,
             password=hashed_password,
@@ -277,8 +684,13 @@ def userRegister(username, password, email=None):
         )
         
         db.session.add(user)
-        db.session.commit()
         return user
+    try:
+        # Hash on the password pool so the shared writer only does database work
+        hashed_password = hash_password(password)
+        return _runWrite(apply)
+    except PasswordServiceBusy:
+        raise
     except Exception as e:
         print(f"Error in userRegister: {e}")
         db.session.rollback()
@@ -292,21 +704,31 @@ def userProfile(user_id):
         print(f"Error in userProfile: {e}")
         return None
 
-def updateUserTendency(user_id, tendency):
+# Bumped when a user's name or photo changes or users are deleted; drops cached auth principals in every worker
+USERS_VERSION = 'users'
+
+def bumpUsersVersion():
     try:
+        bump_version(USERS_VERSION)
+    except OSError as e:
+        print(f"Error bumping users version: {e}")
+
+def updateUserTendency(user_id, tendency):
+    def apply():
         user = User.query.get(user_id)
         if not user:
             return False
         user.tendency = tendency
-        db.session.commit()
         return True
+    try:
+        return _runWrite(apply)
     except Exception as e:
         print(f"Error in updateUserTendency: {e}")
         db.session.rollback()
         return False
 
 def updateUserProfile(user_id, username=None, photoUrl=None):
-    try:
+    def apply():
         user = User.query.get(user_id)
         if not user:
             return False, 'User not found'
@@ -319,39 +741,114 @@ def updateUserProfile(user_id, username=None, photoUrl=None):
             user.username = username
         if photoUrl is not None:
             user.photoUrl = photoUrl
-        db.session.commit()
         return True, None
+    try:
+        result = _runWrite(apply)
+        if result[0]:
+            bumpUsersVersion()
+        return result
     except Exception as e:
         print(f"Error in updateUserProfile: {e}")
         db.session.rollback()
         return False, str(e)
 
 def updateUserFocusLevel(user_id: int, focus_level: float):
-    try:
+    def apply():
         user = User.query.get(user_id)
         if not user:
             return False
         clamped = max(0.0, min(1.0, float(focus_level)))
         user.focus_level = clamped
-        db.session.commit()
         return True
+    try:
+        return _runWrite(apply)
     except Exception as e:
         print(f"Error in updateUserFocusLevel: {e}")
         db.session.rollback()
         return False
 
-def recordWatchHistory(user_id: int, video_id: int, progress: float = None, focus_sample: float = None):
+def _clampUnit(value):
+    return None if value is None else max(0.0, min(1.0, float(value)))
+
+def _watchProgressUpsert():
+    """INSERT ... ON CONFLICT for (user_id, video_id, session_id): keep max progress, latest focus."""
+    table = WatchHistory.__table__
+    stmt = sqlite_insert(table)
+    return stmt.on_conflict_do_update(
+        index_elements=['user_id', 'video_id', 'session_id'],
+        set_={
+            'progress': func.max(func.coalesce(table.c.progress, stmt.excluded.progress),
+                                 func.coalesce(stmt.excluded.progress, table.c.progress)),
+            'focus_sample': func.coalesce(stmt.excluded.focus_sample, table.c.focus_sample),
+            'watched_at': stmt.excluded.watched_at,
+        },
+    )
+
+def upsertWatchProgress(entries):
+    """Upsert many {user_id, video_id, session_id, progress, focus_sample, watched_at} rows in one statement."""
+    if not entries:
+        return 0
+    rows = [{
+        'user_id': e['user_id'],
+        'video_id': e['video_id'],
+        'session_id': e['session_id'],
+        'progress': _clampUnit(e.get('progress')),
+        'focus_sample': _clampUnit(e.get('focus_sample')),
+        'watched_at': e.get('watched_at') or datetime.utcnow(),
+    } for e in entries]
+    def apply():
+        db.session.execute(_watchProgressUpsert(), rows)
+        return len(rows)
     try:
-        prog = None if progress is None else max(0.0, min(1.0, float(progress)))
-        foc = None if focus_sample is None else max(0.0, min(1.0, float(focus_sample)))
+        return _runWrite(apply)
+    except Exception as e:
+        print(f"Error upserting watch progress: {e}")
+        db.session.rollback()
+        return 0
+
+def recordWatchHistory(user_id: int, video_id: int, progress: float = None, focus_sample: float = None, session_id: str = None):
+    def apply():
+        prog = _clampUnit(progress)
+        foc = _clampUnit(focus_sample)
+        if session_id:
+            db.session.execute(_watchProgressUpsert(), [{
+                'user_id': user_id, 'video_id': video_id, 'session_id': session_id,
+                'progress': prog, 'focus_sample': foc, 'watched_at': datetime.utcnow(),
+            }])
+            return WatchHistory.query.filter_by(user_id=user_id, video_id=video_id, session_id=session_id).first()
         wh = WatchHistory(user_id=user_id, video_id=video_id, progress=prog, focus_sample=foc)
         db.session.add(wh)
-        db.session.commit()
         return wh
+    try:
+        return _runWrite(apply)
     except Exception as e:
         print(f"Error recording watch history: {e}")
         db.session.rollback()
         return None
 
-def getUserWatchHistory(user_id: int):
-    return WatchHistory.query.filter_by(user_id=user_id).order_by(WatchHistory.watched_at.desc()).all()
+# Most recent entries read per call; history is bounded because /api/recommendations reads it on every request
+WATCH_HISTORY_LIMIT = 200
+
+def getUserWatchHistory(user_id: int, limit: int = WATCH_HISTORY_LIMIT):
+    """The `limit` most recent raw watch events and daily rollups of compacted ones, newest first."""
+    # Each side takes its own newest `limit` off its (user, time) index, so the merge never sees more than 2 * limit rows
+    raw = db.select(
+        WatchHistory.id, db.literal(0).label('rolled_up'), WatchHistory.watched_at.label('at')
+    ).where(WatchHistory.user_id == user_id).order_by(WatchHistory.watched_at.desc()).limit(limit).subquery()
+    rolled = db.select(
+        WatchHistoryRollup.id, db.literal(1).label('rolled_up'), func.datetime(WatchHistoryRollup.day).label('at')
+    ).where(WatchHistoryRollup.user_id == user_id).order_by(WatchHistoryRollup.day.desc()).limit(limit).subquery()
+    merged = db.union_all(
+        db.select(raw.c.id, raw.c.rolled_up, raw.c.at),
+        db.select(rolled.c.id, rolled.c.rolled_up, rolled.c.at),
+    ).order_by(db.desc('at')).limit(limit)
+    keys = [(bool(rolled_up), row_id) for row_id, rolled_up, _ in db.session.execute(merged)]
+
+    raw_ids = [row_id for rolled_up, row_id in keys if not rolled_up]
+    rollup_ids = [row_id for rolled_up, row_id in keys if rolled_up]
+    rows = {}
+    if raw_ids:
+        rows.update(((False, h.id), h) for h in WatchHistory.query.filter(WatchHistory.id.in_(raw_ids)))
+    if rollup_ids:
+        rows.update(((True, h.id), h) for h in WatchHistoryRollup.query.filter(WatchHistoryRollup.id.in_(rollup_ids)))
+    return [rows[key] for key in keys if key in rows]
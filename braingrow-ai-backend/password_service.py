@@ -0,0 +1,145 @@
+"""
+Password hashing on a small process pool.
+
+scrypt/pbkdf2 hashing is deliberately slow and holds the GIL on the request
+thread, so a login burst would stall every other request in the worker. Hashing
+and verification instead run on PASSWORD_WORKERS processes (default 2; 0 runs
+them inline). At most PASSWORD_MAX_PENDING jobs (default 32) may be queued or
+running per web process; beyond that hash_password/verify_password raise
+PasswordServiceBusy, which the endpoints turn into a 503 with Retry-After. A job
+that times out or a pool that breaks raises the same error, so the caller never
+mistakes a hashing failure for a wrong password.
+
+Pool processes need only this module, which imports nothing beyond
+werkzeug.security. Spawn also re-imports the parent's __main__ script in every
+child, so scripts that use the pool import main inside their
+`if __name__ == '__main__'` block (create_user.py, bench_login.py). The dev
+server (`python main.py`) hashes inline.
+
+verify_password accepts Werkzeug hashes only. It also reports when a stored hash
+should be upgraded: hashes made with older parameters (e.g. pbkdf2 from earlier
+Werkzeug defaults) are rehashed with PASSWORD_HASH_METHOD after a successful
+check. Legacy plaintext rows are hashed once by migration 11.
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import lru_cache
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt')
+WORKERS = _env_int('PASSWORD_WORKERS', 2)
+MAX_PENDING = _env_int('PASSWORD_MAX_PENDING', 32)
+TIMEOUT_SECONDS = _env_int('PASSWORD_TIMEOUT_SECONDS', 10)
+
+
+class PasswordServiceBusy(Exception):
+    """Raised when the hashing queue is full or the pool cannot answer; callers should answer 503."""
+
+
+@lru_cache(maxsize=None)
+def _current_prefix(method):
+    # e.g. "scrypt:32768:8:1": the method and cost parameters new hashes get
+    return generate_password_hash('', method=method).split('$', 1)[0]
+
+
+def is_password_hash(value):
+    """True for a Werkzeug "method$salt$hash" value (the same test check_password_hash applies)."""
+    return bool(value) and value.count('$') >= 2
+
+
+def _hash(password, method):
+    return generate_password_hash(password, method=method)
+
+
+def _verify(stored, password, method):
+    """(matches, upgraded hash or None). Runs in a pool process."""
+    if not check_password_hash(stored, password):
+        return False, None
+    if stored.split('$', 1)[0] != _current_prefix(method):
+        return True, _hash(password, method)
+    return True, None
+
+
+class PasswordService:
+    def __init__(self, workers=WORKERS, max_pending=MAX_PENDING, method=HASH_METHOD):
+        self.workers = workers
+        self.method = method
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _executor(self):
+        # Created lazily so each gunicorn worker gets its own pool after forking;
+        # spawn keeps the children from inheriting the web process's threads and sockets
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    def _run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            raise PasswordServiceBusy()
+        try:
+            future = self._executor().submit(fn, *args)
+        except BrokenExecutor as e:
+            self._slots.release()
+            self._reset_pool()
+            raise PasswordServiceBusy() from e
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=TIMEOUT_SECONDS)
+        except BrokenExecutor as e:
+            # A worker died; start a fresh pool for the next request
+            self._reset_pool()
+            raise PasswordServiceBusy() from e
+        except FutureTimeoutError as e:
+            raise PasswordServiceBusy() from e
+
+    def _reset_pool(self):
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def hash_password(self, password):
+        return self._run(_hash, password, self.method)
+
+    def verify_password(self, stored, password):
+        """Return (matches, new_hash); new_hash is set when the stored hash should be replaced."""
+        if not stored:
+            return False, None
+        return self._run(_verify, stored, password, self.method)
+
+    def hash_many(self, passwords, chunksize=16):
+        """Hash a batch for bulk imports (not bounded by the request queue)."""
+        if self.workers <= 0:
+            return [_hash(p, self.method) for p in passwords]
+        return list(self._executor().map(_hash, passwords, [self.method] * len(passwords), chunksize=chunksize))
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+password_service = PasswordService()
+hash_password = password_service.hash_password
+verify_password = password_service.verify_password
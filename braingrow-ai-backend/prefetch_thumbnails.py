@@ -0,0 +1,17 @@
+import argparse
+import time
+from main import app
+from thumbnails import prefetch_thumbnails, thumbnail_store, THUMB_WIDTHS, PREFETCH_THREADS
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fetch and resize thumbnails for every video in the catalog')
+    parser.add_argument('--widths', default=','.join(map(str, THUMB_WIDTHS)), help='Comma-separated widths to generate')
+    parser.add_argument('--threads', type=int, default=PREFETCH_THREADS, help='Concurrent downloads')
+    args = parser.parse_args()
+
+    widths = tuple(int(w) for w in args.widths.split(',') if w.strip())
+    with app.app_context():
+        start = time.perf_counter()
+        cached, failed = prefetch_thumbnails(thumbnail_store(), widths, args.threads)
+        print(f"Cached thumbnails for {cached} images ({failed} failed) in {time.perf_counter() - start:.1f}s "
+              f"under {thumbnail_store().root}")
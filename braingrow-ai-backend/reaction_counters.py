@@ -0,0 +1,100 @@
+"""
+In-memory like/dislike counter deltas, flushed to videos in batches.
+
+A reaction click writes only the user's video_reactions row; the change to the
+video's counters is accumulated here and applied every REACTION_FLUSH_SECONDS
+as one batched `UPDATE videos SET likes = likes + ?, dislikes = dislikes + ?`,
+so a popular video does not take a write on its row for every click. Readers add
+pending_deltas() to the stored counts to show this process's unflushed clicks.
+
+Deltas that never reach the database (a crash or a kill before the flush) would
+leave the counters out of step with video_reactions for good, so every process
+also reconciles the counters from video_reactions at startup and then every
+REACTION_RECONCILE_SECONDS (default 3600; 0 disables).
+"""
+
+import os
+import threading
+
+from background import PeriodicTask
+from models import applyReactionCounterDeltas, reconcileReactionCounters
+
+_counters = None
+
+
+def reaction_delta(previous, current):
+    """(likes, dislikes) change for a user's reaction going from previous to current."""
+    return (int(current == 1) - int(previous == 1), int(current == -1) - int(previous == -1))
+
+
+class ReactionCounterBuffer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._deltas = {}
+
+    def add(self, video_id, previous, current):
+        dl, dd = reaction_delta(previous, current)
+        if not dl and not dd:
+            return
+        with self._lock:
+            old_dl, old_dd = self._deltas.get(video_id, (0, 0))
+            self._deltas[video_id] = (old_dl + dl, old_dd + dd)
+
+    def pending(self, video_id):
+        with self._lock:
+            return self._deltas.get(video_id, (0, 0))
+
+    def flush(self):
+        with self._lock:
+            deltas, self._deltas = self._deltas, {}
+        if not deltas:
+            return 0
+        written = applyReactionCounterDeltas(deltas)
+        if not written:
+            # Keep the deltas for the next interval rather than dropping clicks
+            with self._lock:
+                for vid, (dl, dd) in deltas.items():
+                    old_dl, old_dd = self._deltas.get(vid, (0, 0))
+                    self._deltas[vid] = (old_dl + dl, old_dd + dd)
+        return written
+
+
+def start_reaction_counters(app):
+    global _counters
+    if _counters is not None:
+        return _counters
+    try:
+        interval = float(os.getenv('REACTION_FLUSH_SECONDS', '2'))
+    except ValueError:
+        interval = 2.0
+    _counters = ReactionCounterBuffer()
+    PeriodicTask(app, 'reaction-counter-flush', interval, _counters.flush).start()
+    start_reaction_reconcile(app, interval)
+    return _counters
+
+
+def start_reaction_reconcile(app, flush_interval):
+    try:
+        interval = float(os.getenv('REACTION_RECONCILE_SECONDS', '3600'))
+    except ValueError:
+        interval = 3600.0
+    if interval <= 0:
+        return None
+    # Leave videos alone while a worker may still hold an unflushed delta for them
+    settle = max(60.0, flush_interval * 10)
+    task = PeriodicTask(app, 'reaction-counter-reconcile', interval,
+                        lambda: reconcileReactionCounters(settle), run_at_exit=False).start()
+    threading.Thread(target=task.run_once, name='reaction-counter-reconcile-startup', daemon=True).start()
+    return task
+
+
+def pending_deltas(video_id):
+    return _counters.pending(video_id) if _counters is not None else (0, 0)
+
+
+def record_reaction_change(video_id, previous, current):
+    """Queue the counter change, or apply it immediately when no buffer is running."""
+    if _counters is not None:
+        _counters.add(video_id, previous, current)
+    else:
+        applyReactionCounterDeltas({video_id: reaction_delta(previous, current)})
@@ -0,0 +1,180 @@
+"""
+Pre-encoded JSON for video payloads.
+
+Each response shape (search results, list/recommendation items, the video
+detail page) has a fixed field list. A video's encoded fragment for a shape is
+cached under (shape, id) for the current catalog version, so list responses are
+assembled by joining cached bytes; only the per-request counters
+(commentCount, likes, dislikes) and LIVE_FIELDS such as thumbUrl, whose ?v=
+follows the cached image rather than the catalog, are encoded each time. List endpoints may ask
+for a subset of a shape's keys (?fields=), cached separately. orjson is used
+when it is installed, otherwise the stdlib encoder.
+"""
+
+import datetime
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from flask import Response
+
+from thumbnails import thumb_url
+from versions import current_version
+from video_cache import CATALOG_VERSION
+
+try:
+    import orjson
+except ImportError:  # optional: faster encoder
+    orjson = None
+
+
+def dumps(value):
+    """Encode value as compact UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _published_at(video):
+    # Videos have no publish date column; clients get the time the fragment was built
+    return datetime.datetime.now().isoformat()
+
+
+# shape -> [(json key, attribute name or function of the video)]
+SHAPES = {
+    'search': [
+        ('id', 'id'), ('title', 'title'), ('description', 'description'),
+        ('creator', lambda v: 'Unknown'), ('publishedAt', _published_at),
+        ('category', lambda v: 'General'), ('viewCount', lambda v: 0),
+        ('videoUrl', 'url'), ('imageUrl', 'imageUrl'),
+    ],
+    'list': [
+        ('id', 'id'), ('title', 'title'), ('description', 'description'), ('url', 'url'),
+        ('tags', 'tags'), ('board', 'board'), ('topic', 'topic'), ('imageUrl', 'imageUrl'),
+    ],
+    'detail': [
+        ('id', 'id'), ('title', 'title'), ('description', 'description'),
+        ('creator', lambda v: 'Unknown'), ('publishedAt', _published_at),
+        ('category', lambda v: 'General'), ('viewCount', lambda v: 0),
+        # The canonical YouTube URL, not a direct stream URL
+        ('url', 'url'), ('coverUrl', 'imageUrl'),
+        ('tags', 'tags'), ('board', 'board'), ('topic', 'topic'),
+    ],
+}
+
+# shape -> [(json key, function of the video)] encoded per request, after the cached fragment
+LIVE_FIELDS = {
+    'search': [('thumbUrl', lambda v: thumb_url(v.id, v.imageUrl))],
+    'list': [('thumbUrl', lambda v: thumb_url(v.id, v.imageUrl))],
+}
+
+# Columns read by computed keys
+DERIVED_COLUMNS = {'thumbUrl': 'imageUrl'}
+
+
+class FragmentCache:
+    def __init__(self, max_size=8192):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+        self._version = None
+
+    def get_many(self, prefix, videos, build):
+        """Fragments for videos in order, cached under (prefix, id); misses are built with build(video)."""
+        version = current_version(CATALOG_VERSION)
+        with self._lock:
+            if version != self._version:
+                self._items.clear()
+                self._version = version
+            fragments = [self._items.get((prefix, v.id)) for v in videos]
+        missing = {}
+        for i, fragment in enumerate(fragments):
+            if fragment is None:
+                fragments[i] = missing[(prefix, videos[i].id)] = build(videos[i])
+        with self._lock:
+            if self._version == version:
+                for key in missing:
+                    self._items[key] = missing[key]
+                for v in videos:
+                    if (prefix, v.id) in self._items:
+                        self._items.move_to_end((prefix, v.id))
+                while len(self._items) > self.max_size:
+                    self._items.popitem(last=False)
+        return fragments
+
+
+try:
+    _fragment_cache = FragmentCache(int(os.getenv('JSON_FRAGMENT_CACHE_SIZE', '8192')))
+except ValueError:
+    _fragment_cache = FragmentCache()
+
+
+def parse_fields(raw, shape):
+    """The JSON keys requested with ?fields=a,b for shape, or None for all of them.
+
+    'id' is always included. Raises ValueError for unknown keys.
+    """
+    if not raw:
+        return None
+    allowed = [key for key, _ in SHAPES[shape] + LIVE_FIELDS.get(shape, [])] + ['commentCount']
+    requested = {f.strip() for f in raw.split(',') if f.strip()}
+    unknown = requested.difference(allowed)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))} (allowed: {', '.join(allowed)})")
+    requested.add('id')
+    return tuple(key for key in allowed if key in requested)
+
+
+def shape_columns(shape, fields=None):
+    """Video attributes (VideoRow columns) needed to encode shape with the given fields."""
+    columns = {source for key, source in SHAPES[shape]
+               if isinstance(source, str) and (fields is None or key in fields)}
+    columns.update(column for key, column in DERIVED_COLUMNS.items()
+                   if (fields is None or key in fields) and key in dict(SHAPES[shape] + LIVE_FIELDS.get(shape, [])))
+    if fields is None or 'commentCount' in fields:
+        columns.add('comment_count')
+    return columns
+
+
+def _fragment_builder(shape, fields=None):
+    def build(video):
+        # The object without its closing brace, so per-request fields can be appended
+        parts = []
+        for key, source in SHAPES[shape]:
+            if fields is not None and key not in fields:
+                continue
+            value = getattr(video, source, None) if isinstance(source, str) else source(video)
+            parts.append(dumps(key) + b':' + dumps(value))
+        return b'{' + b','.join(parts)
+    return build
+
+
+def _live_tail(video, shape, fields=None):
+    return b''.join(b',' + dumps(key) + b':' + dumps(source(video))
+                    for key, source in LIVE_FIELDS.get(shape, ()) if fields is None or key in fields)
+
+
+def video_json(video, shape, **extra):
+    """Encoded JSON object for one video: the cached fragment plus the live and extra (per-request) fields."""
+    tail = _live_tail(video, shape) + b''.join(b',' + dumps(key) + b':' + dumps(value) for key, value in extra.items())
+    return _fragment_cache.get_many((shape, None), [video], _fragment_builder(shape))[0] + tail + b'}'
+
+
+def video_list_json(videos, shape, fields=None):
+    """Encoded JSON array of videos, each with its live fields and commentCount unless fields leaves them out."""
+    videos = list(videos)
+    fragments = _fragment_cache.get_many((shape, fields), videos, _fragment_builder(shape, fields))
+    with_count = fields is None or 'commentCount' in fields
+    return b'[' + b','.join(
+        fragment + _live_tail(v, shape, fields)
+        + (b',"commentCount":%d' % (getattr(v, 'comment_count', 0) or 0) if with_count else b'') + b'}'
+        for fragment, v in zip(fragments, videos)
+    ) + b']'
+
+
+def json_response(body, status=200):
+    """Response for already-encoded JSON bytes (or any value, encoded with dumps)."""
+    if not isinstance(body, (bytes, bytearray)):
+        body = dumps(body)
+    return Response(body, status=status, mimetype='application/json')
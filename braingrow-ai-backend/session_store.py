@@ -0,0 +1,146 @@
+"""
+Server-side Flask sessions stored in the `sessions` table.
+
+The cookie carries only a random session id. open_session() does one
+primary-key read. save_session() writes the row back only when the session was
+modified, or when a stored row is past half its lifetime and needs its expiry
+pushed out. Payloads use Flask's compact tagged JSON (the format of the default
+cookie sessions). Rows expire after PERMANENT_SESSION_LIFETIME, and a
+background sweeper deletes expired rows every SESSION_SWEEP_SECONDS (default
+600), which keeps the table bounded.
+
+Replaces the Flask-Session filesystem backend, which wrote one pickle file per
+session and never removed them.
+"""
+
+import os
+import secrets
+from datetime import datetime
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from werkzeug.datastructures import CallbackDict
+
+from background import PeriodicTask
+from models import db, UserSession
+
+SID_BYTES = 32
+SWEEP_CHUNK = 5000
+
+
+class StoredSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False, expires_at=None):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.expires_at = expires_at
+        self.modified = False
+
+
+class SqliteSessionInterface(SessionInterface):
+    serializer = TaggedJSONSerializer()
+    session_class = StoredSession
+
+    def _new_session(self):
+        return self.session_class(sid=secrets.token_urlsafe(SID_BYTES), new=True)
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if not sid or len(sid) > 64:
+            return self._new_session()
+        table = UserSession.__table__
+        try:
+            with db.engine.connect() as conn:
+                row = conn.execute(
+                    select(table.c.data, table.c.expires_at).where(table.c.sid == sid)
+                ).first()
+        except Exception as e:
+            print(f"Error loading session: {e}")
+            return self._new_session()
+        if row is None or row.expires_at <= datetime.utcnow():
+            return self._new_session()
+        try:
+            data = self.serializer.loads(row.data)
+        except Exception:
+            return self._new_session()
+        return self.session_class(data, sid=sid, expires_at=row.expires_at)
+
+    def _needs_refresh(self, app, session):
+        # Extend the stored expiry without a write on every request
+        if session.expires_at is None:
+            return False
+        remaining = session.expires_at - datetime.utcnow()
+        return remaining < app.permanent_session_lifetime / 2
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        table = UserSession.__table__
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if not session:
+            if session.modified and not session.new:
+                with db.engine.begin() as conn:
+                    conn.execute(delete(table).where(table.c.sid == session.sid))
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        refresh = self._needs_refresh(app, session)
+        if not (session.modified or session.new or refresh):
+            return
+
+        expires_at = datetime.utcnow() + app.permanent_session_lifetime
+        stmt = sqlite_insert(table).values(sid=session.sid, data=self.serializer.dumps(dict(session)),
+                                           expires_at=expires_at)
+        with db.engine.begin() as conn:
+            conn.execute(stmt.on_conflict_do_update(
+                index_elements=['sid'], set_={'data': stmt.excluded.data, 'expires_at': stmt.excluded.expires_at},
+            ))
+        session.expires_at = expires_at
+        session.new = False
+        session.modified = False
+
+        response.set_cookie(
+            name, session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain, path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+def sweep_expired_sessions(chunk_size=SWEEP_CHUNK):
+    """Delete expired session rows in chunks. Returns the number deleted."""
+    table = UserSession.__table__
+    total = 0
+    while True:
+        expired = select(table.c.sid).where(table.c.expires_at <= datetime.utcnow()).limit(chunk_size)
+        with db.engine.begin() as conn:
+            deleted = conn.execute(delete(table).where(table.c.sid.in_(expired))).rowcount
+        total += deleted
+        if deleted < chunk_size:
+            return total
+
+
+def init_session_store(app):
+    """Install the table-backed session interface."""
+    app.session_interface = SqliteSessionInterface()
+
+
+def start_session_sweeper(app):
+    """Delete expired sessions every SESSION_SWEEP_SECONDS (0 disables)."""
+    try:
+        interval = float(os.getenv('SESSION_SWEEP_SECONDS', '600'))
+    except ValueError:
+        interval = 600.0
+    if interval <= 0:
+        return None
+    return PeriodicTask(app, 'session-sweeper', interval, sweep_expired_sessions, run_at_exit=False).start()
@@ -0,0 +1,92 @@
+"""
+SQLite storage profile for production workers.
+
+configure_storage(app) must run before db.init_app(app): it picks the database
+URI and the engine pool options. install_sqlite_pragmas(engine) then applies the
+per-connection pragmas:
+
+- journal_mode=WAL: readers no longer block on a writer's commit
+- synchronous=NORMAL: fsync at checkpoints instead of on every commit (safe with WAL)
+- busy_timeout: wait for a lock instead of failing with "database is locked"
+- cache_size / mmap_size: keep hot pages in memory and read through the page cache
+
+Each setting can be overridden through environment variables; SQLITE_PROFILE=default
+turns the whole profile off (used by bench_sqlite.py for the "before" numbers).
+"""
+
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+DEFAULT_DATABASE_URI = 'sqlite:///site.db'
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def profile_enabled():
+    return os.getenv('SQLITE_PROFILE', 'production').lower() != 'default'
+
+
+def sqlite_pragmas():
+    """Pragmas applied to every new connection, in order (journal_mode first)."""
+    return [
+        ('journal_mode', 'WAL'),
+        ('synchronous', 'NORMAL'),
+        ('busy_timeout', _env_int('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+        # Negative cache_size is in KiB: 64 MiB of page cache per connection by default
+        ('cache_size', -_env_int('SQLITE_CACHE_SIZE_KB', 65536)),
+        ('mmap_size', _env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+        ('temp_store', 'MEMORY'),
+    ]
+
+
+def is_sqlite_file(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def engine_options(uri):
+    """SQLAlchemy create_engine options for the URI under the active profile."""
+    if not is_sqlite_file(uri) or not profile_enabled():
+        return {}
+    return {
+        # Threaded workers share one pool per process; connections may cross threads
+        'pool_size': _env_int('SQLITE_POOL_SIZE', 8),
+        'max_overflow': _env_int('SQLITE_POOL_OVERFLOW', 8),
+        'pool_timeout': _env_int('SQLITE_POOL_TIMEOUT', 30),
+        'connect_args': {
+            'check_same_thread': False,
+            'timeout': _env_int('SQLITE_BUSY_TIMEOUT_MS', 5000) / 1000.0,
+        },
+    }
+
+
+def configure_storage(app):
+    """Set the database URI and engine options on the Flask config (before db.init_app)."""
+    uri = os.getenv('DATABASE_URL') or app.config.get('SQLALCHEMY_DATABASE_URI') or DEFAULT_DATABASE_URI
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    options.update(engine_options(uri))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+
+def install_sqlite_pragmas(engine):
+    """Apply sqlite_pragmas() on every connection the engine opens."""
+    if engine.dialect.name != 'sqlite' or not profile_enabled():
+        return
+    pragmas = sqlite_pragmas()
+
+    @event.listens_for(engine, 'connect')
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas:
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
@@ -0,0 +1,454 @@
+"""
+Local thumbnail cache and resizer for Video.imageUrl.
+
+/api/thumb/<video_id>?w= serves a video's cover image at a standard width
+(THUMB_WIDTHS) instead of clients hot-linking the full 480x360 source. The
+source is fetched once through a pluggable fetcher and stored under its
+sha256 (a content-addressed original), so videos sharing an image share one
+file. WebP variants are generated from the original on first request. Files
+are written to a temp file and moved into place, so several workers can share
+the directory safely.
+
+    <root>/sources/<sha1 of url>           -> JSON: stored name, ETag, Last-Modified
+    <root>/originals/<ab>/<sha256><ext>
+    <root>/variants/<ab>/<sha256>-<width>.webp
+
+A source's image can change behind the same URL (YouTube replaces hqdefault.jpg
+when a creator updates the thumbnail). A source is therefore revalidated with a
+conditional request once its pointer is older than THUMB_SOURCE_TTL seconds
+(default 86400). thumb_url() carries ?v=, a short hash of the stored content, so
+a response is marked immutable only for the exact bytes it names.
+
+Sources that fail to fetch or decode are not retried for FAILURE_TTL seconds.
+The directory is capped at THUMB_MAX_MB (default 512): evict() removes the
+least recently served files first. Served files have their mtime refreshed at
+most once per TOUCH_INTERVAL.
+
+Resizing needs Pillow. Without it, the original is served at every width.
+Fetchers:
+- HttpFetcher (default) downloads http(s) URLs.
+- FixtureFetcher serves files from a local directory for tests and offline
+  development (THUMB_FETCHER=fixture:<dir>).
+
+prefetch_thumbnails() warms the cache for the whole catalog, from
+prefetch_thumbnails.py or periodically in the background
+(THUMB_PREFETCH_SECONDS). Eviction runs every THUMB_EVICT_SECONDS (default 600).
+"""
+
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from sqlalchemy import select
+
+from background import PeriodicTask, exclusive_job
+from models import db, Video
+
+try:
+    from PIL import Image
+except ImportError:  # optional: without Pillow the original is served at every width
+    Image = None
+
+
+def _env_float(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+THUMB_WIDTHS = (120, 240, 320, 480)
+DEFAULT_WIDTH = 320
+WEBP_QUALITY = 80
+MAX_SOURCE_BYTES = 5 * 1024 * 1024
+# A source that failed to fetch or decode is not retried for this long
+FAILURE_TTL = 300
+SOURCE_TTL = _env_float('THUMB_SOURCE_TTL', 86400)
+MAX_CACHE_BYTES = int(_env_float('THUMB_MAX_MB', 512) * 1024 * 1024)
+# Eviction stops once the cache is back under this share of the cap
+EVICT_TARGET = 0.9
+TOUCH_INTERVAL = 3600
+PREFETCH_THREADS = 8
+VERSION_LENGTH = 10
+
+Thumbnail = namedtuple('Thumbnail', ['path', 'mimetype', 'etag', 'version'])
+# What a fetcher returns; None from a conditional fetch means "not modified"
+Fetched = namedtuple('Fetched', ['data', 'content_type', 'etag', 'last_modified'])
+Source = namedtuple('Source', ['path', 'name', 'etag', 'last_modified', 'checked_at'])
+
+
+class ThumbnailUnavailable(Exception):
+    """The source image could not be fetched or decoded."""
+
+
+def snap_width(width):
+    """The smallest standard width >= width (the largest if none); DEFAULT_WIDTH for missing/invalid input."""
+    if not width or width <= 0:
+        return DEFAULT_WIDTH
+    for standard in THUMB_WIDTHS:
+        if standard >= width:
+            return standard
+    return THUMB_WIDTHS[-1]
+
+
+def content_version(name):
+    """The ?v= value for a stored original (a prefix of its sha256)."""
+    return name[:VERSION_LENGTH]
+
+
+def thumb_url(video_id, image_url, width=DEFAULT_WIDTH):
+    """/api/thumb URL for a video, with ?v= when the source is already cached."""
+    url = f"/api/thumb/{video_id}?w={width}"
+    version = _store.source_version(image_url) if _store is not None and image_url else None
+    return f"{url}&v={version}" if version else url
+
+
+class HttpFetcher:
+    def __init__(self, timeout=5.0, max_bytes=MAX_SOURCE_BYTES):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+
+    def __call__(self, url, etag=None, last_modified=None):
+        """Fetched for url, or None when the validators show it has not changed."""
+        if urllib.parse.urlparse(url).scheme not in ('http', 'https'):
+            raise ThumbnailUnavailable(f"Unsupported thumbnail URL: {url}")
+        headers = {"User-Agent": "Mozilla/5.0"}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        req = urllib.request.Request(url, headers=headers)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                data = resp.read(self.max_bytes + 1)
+                content_type = resp.headers.get_content_type()
+                new_etag, new_last_modified = resp.headers.get('ETag'), resp.headers.get('Last-Modified')
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return None
+            raise
+        if len(data) > self.max_bytes:
+            raise ThumbnailUnavailable(f"Thumbnail source too large: {url}")
+        return Fetched(data, content_type, new_etag, new_last_modified)
+
+
+class FixtureFetcher:
+    """Serves <directory>/<host>/<path> for a URL, else <directory>/default.jpg."""
+
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+
+    def __call__(self, url, etag=None, last_modified=None):
+        parsed = urllib.parse.urlparse(url)
+        candidate = os.path.normpath(os.path.join(self.directory, parsed.netloc, parsed.path.lstrip('/')))
+        if not candidate.startswith(self.directory + os.sep) or not os.path.isfile(candidate):
+            candidate = os.path.join(self.directory, 'default.jpg')
+        if not os.path.isfile(candidate):
+            raise ThumbnailUnavailable(f"No fixture for {url}")
+        with open(candidate, 'rb') as f:
+            data = f.read()
+        return Fetched(data, mimetypes.guess_type(candidate)[0] or 'application/octet-stream', None, None)
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _touch(path):
+    # mtime records when a file was last served; eviction removes the oldest first
+    try:
+        if time.time() - os.path.getmtime(path) > TOUCH_INTERVAL:
+            os.utime(path)
+    except OSError:
+        pass
+
+
+class ThumbnailStore:
+    def __init__(self, root, fetcher, source_ttl=SOURCE_TTL, max_bytes=MAX_CACHE_BYTES):
+        self.root = os.path.abspath(root)
+        self.fetcher = fetcher
+        self.source_ttl = source_ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._key_locks = {}  # key -> [lock, callers holding or waiting on it]
+        self._failures = {}  # source or original key -> retry after (monotonic)
+
+    @contextmanager
+    def _locked(self, key):
+        with self._lock:
+            slot = self._key_locks.get(key)
+            if slot is None:
+                slot = self._key_locks[key] = [threading.Lock(), 0]
+            slot[1] += 1
+        try:
+            with slot[0]:
+                yield
+        finally:
+            with self._lock:
+                slot[1] -= 1
+                if slot[1] == 0 and self._key_locks.get(key) is slot:
+                    del self._key_locks[key]
+
+    def _failed(self, key):
+        return self._failures.get(key, 0) > time.monotonic()
+
+    def _record_failure(self, key):
+        if len(self._failures) > 10000:
+            self._failures.clear()
+        self._failures[key] = time.monotonic() + FAILURE_TTL
+
+    def _source_pointer(self, image_url):
+        return os.path.join(self.root, 'sources', hashlib.sha1(image_url.encode('utf-8')).hexdigest())
+
+    def _original_path(self, name):
+        return os.path.join(self.root, 'originals', name[:2], name)
+
+    def _variant_path(self, digest, width):
+        return os.path.join(self.root, 'variants', digest[:2], f"{digest}-{width}.webp")
+
+    def _read_source(self, pointer):
+        """The Source a pointer names, or None when the pointer or its original is missing."""
+        try:
+            with open(pointer, 'r', encoding='utf-8') as f:
+                text = f.read().strip()
+            checked_at = os.path.getmtime(pointer)
+        except OSError:
+            return None
+        try:
+            info = json.loads(text) if text.startswith('{') else {'name': text}
+            name = info['name']
+        except (ValueError, KeyError):
+            return None
+        path = self._original_path(name)
+        if not os.path.isfile(path):
+            return None
+        return Source(path, name, info.get('etag'), info.get('last_modified'), checked_at)
+
+    def _is_fresh(self, source):
+        return time.time() - source.checked_at < self.source_ttl
+
+    def source_version(self, image_url):
+        """?v= for the cached source of image_url, or None if it has not been fetched yet."""
+        source = self._read_source(self._source_pointer(image_url))
+        return content_version(source.name) if source else None
+
+    def original(self, image_url):
+        """(path, stored name) of the source image, fetching or revalidating it as needed.
+
+        When revalidation fails, the stored copy keeps being served.
+        """
+        pointer = self._source_pointer(image_url)
+        source = self._read_source(pointer)
+        if source and self._is_fresh(source):
+            return source.path, source.name
+        key = os.path.basename(pointer)
+        if self._failed(key):
+            if source:
+                return source.path, source.name
+            raise ThumbnailUnavailable(f"Recently failed: {image_url}")
+        # One fetch per source; concurrent requests wait for it
+        with self._locked(key):
+            source = self._read_source(pointer)
+            if source and self._is_fresh(source):
+                return source.path, source.name
+            try:
+                if source:
+                    fetched = self.fetcher(image_url, source.etag, source.last_modified)
+                else:
+                    fetched = self.fetcher(image_url)
+            except Exception as e:
+                self._record_failure(key)
+                if source:
+                    print(f"Thumbnail source not revalidated, serving the stored copy: {image_url}: {e}")
+                    return source.path, source.name
+                raise ThumbnailUnavailable(f"Could not fetch {image_url}: {e}") from e
+            if fetched is None:
+                # Not modified: the stored copy is good for another source_ttl
+                os.utime(pointer)
+                return source.path, source.name
+            ext = mimetypes.guess_extension(fetched.content_type or '') or '.img'
+            name = hashlib.sha256(fetched.data).hexdigest() + ext
+            path = self._original_path(name)
+            if not os.path.isfile(path):
+                _write_atomic(path, fetched.data)
+            _write_atomic(pointer, json.dumps(
+                {'name': name, 'etag': fetched.etag, 'last_modified': fetched.last_modified}
+            ).encode('utf-8'))
+            return path, name
+
+    def thumbnail(self, image_url, width):
+        """A Thumbnail of image_url at a standard width (the original when Pillow is unavailable)."""
+        width = snap_width(width)
+        path, name = self.original(image_url)
+        digest = name.split('.', 1)[0]
+        version = content_version(name)
+        if Image is None:
+            _touch(path)
+            return Thumbnail(path, mimetypes.guess_type(path)[0] or 'application/octet-stream', digest[:20], version)
+        variant = self._variant_path(digest, width)
+        if not os.path.isfile(variant):
+            # A source that does not decode fails for every width; do not decode it again until FAILURE_TTL passes
+            if self._failed(digest):
+                raise ThumbnailUnavailable(f"Recently failed to decode {path}")
+            with self._locked(variant):
+                if not os.path.isfile(variant):
+                    try:
+                        data = self._resize(path, width)
+                    except ThumbnailUnavailable:
+                        self._record_failure(digest)
+                        raise
+                    _write_atomic(variant, data)
+        else:
+            _touch(variant)
+        return Thumbnail(variant, 'image/webp', f"{digest[:20]}-{width}", version)
+
+    def _resize(self, path, width):
+        try:
+            with Image.open(path) as img:
+                img = img.convert('RGBA' if img.mode in ('RGBA', 'LA', 'P') else 'RGB')
+                if img.width > width:
+                    img = img.resize((width, max(1, round(img.height * width / img.width))), Image.LANCZOS)
+                out = io.BytesIO()
+                img.save(out, 'WEBP', quality=WEBP_QUALITY, method=4)
+                return out.getvalue()
+        except Exception as e:
+            raise ThumbnailUnavailable(f"Could not resize {path}: {e}") from e
+
+    def is_cached(self, image_url, widths=THUMB_WIDTHS):
+        source = self._read_source(self._source_pointer(image_url))
+        if not source or not self._is_fresh(source):
+            return False
+        if Image is None:
+            return True
+        digest = source.name.split('.', 1)[0]
+        return all(os.path.isfile(self._variant_path(digest, w)) for w in widths)
+
+    def evict(self):
+        """Delete the least recently served originals and variants until the cache fits max_bytes.
+
+        Returns (files removed, bytes freed). A pointer whose original is gone
+        reads as missing, so that source is simply fetched again.
+        """
+        files = []
+        total = 0
+        for section in ('originals', 'variants'):
+            for dirpath, _, filenames in os.walk(os.path.join(self.root, section)):
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, path))
+                    total += stat.st_size
+        if total <= self.max_bytes:
+            return 0, 0
+        target = self.max_bytes * EVICT_TARGET
+        removed = freed = 0
+        for _, size, path in sorted(files):
+            if total - freed <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            removed += 1
+            freed += size
+        return removed, freed
+
+
+def fetcher_from_env():
+    spec = os.getenv('THUMB_FETCHER', 'http')
+    if spec.startswith('fixture:'):
+        return FixtureFetcher(spec[len('fixture:'):])
+    return HttpFetcher()
+
+
+_store = None
+
+
+def configure_thumbnails(root, fetcher=None):
+    """Set up the shared store under THUMB_DIR (or root) with fetcher (default from THUMB_FETCHER)."""
+    global _store
+    _store = ThumbnailStore(os.getenv('THUMB_DIR') or root, fetcher or fetcher_from_env())
+    return _store
+
+
+def thumbnail_store():
+    return _store
+
+
+def prefetch_thumbnails(store=None, widths=THUMB_WIDTHS, threads=PREFETCH_THREADS):
+    """Fetch and resize thumbnails for every catalog video not cached yet. Returns (cached, failed)."""
+    store = store or _store
+    table = Video.__table__
+    cached = failed = 0
+
+    def warm(image_url):
+        try:
+            for width in widths:
+                store.thumbnail(image_url, width)
+            return True
+        except ThumbnailUnavailable as e:
+            print(f"Thumbnail prefetch skipped: {e}")
+            return False
+
+    # Read the URL list up front so no read transaction stays open during downloads
+    with db.engine.connect() as conn:
+        urls = conn.execute(select(table.c.imageUrl).where(table.c.imageUrl != '').distinct()).scalars().all()
+    pending = (url for url in urls if not store.is_cached(url, widths))
+    with ThreadPoolExecutor(threads) as pool:
+        for ok in pool.map(warm, pending):
+            if ok:
+                cached += 1
+            else:
+                failed += 1
+    return cached, failed
+
+
+def _prefetch_locked():
+    # One worker prefetches at a time; the files are shared
+    with exclusive_job(os.path.join(_store.root, '.prefetch.lock')) as acquired:
+        if acquired:
+            prefetch_thumbnails()
+            _store.evict()
+
+
+def _evict_locked():
+    with exclusive_job(os.path.join(_store.root, '.evict.lock')) as acquired:
+        if acquired:
+            _store.evict()
+
+
+def start_thumbnail_tasks(app):
+    """Evict every THUMB_EVICT_SECONDS (default 600) and prefetch every THUMB_PREFETCH_SECONDS (default 0: disabled)."""
+    if _store is None:
+        return []
+    tasks = []
+    evict_interval = _env_float('THUMB_EVICT_SECONDS', 600)
+    if evict_interval > 0:
+        tasks.append(PeriodicTask(app, 'thumbnail-evict', evict_interval, _evict_locked, run_at_exit=False).start())
+    prefetch_interval = _env_float('THUMB_PREFETCH_SECONDS', 0)
+    if prefetch_interval > 0:
+        tasks.append(PeriodicTask(app, 'thumbnail-prefetch', prefetch_interval, _prefetch_locked, run_at_exit=False).start())
+    return tasks
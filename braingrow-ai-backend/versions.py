@@ -0,0 +1,78 @@
+"""
+Named version stamps shared by every worker process on the host.
+
+Writers call bump_version('catalog') after committing a change; readers compare
+current_version('catalog') with the version their cached data was built from.
+Each stamp is a tiny file replaced atomically (write + os.replace), so no
+database round trip or cross-process lock is needed. Readers re-read the file
+at most every VERSION_CHECK_SECONDS; a bump in the same process is visible
+immediately.
+"""
+
+import os
+import tempfile
+import threading
+import time
+
+_directory = None
+_lock = threading.Lock()
+_seen = {}  # name -> (version, monotonic time it was read)
+
+try:
+    CHECK_INTERVAL = float(os.getenv('VERSION_CHECK_SECONDS', '0.5'))
+except ValueError:
+    CHECK_INTERVAL = 0.5
+
+
+def configure_versions(directory):
+    """Use directory for the stamp files; falls back to the temp dir if it is not writable."""
+    global _directory
+    try:
+        os.makedirs(directory, exist_ok=True)
+        _directory = directory
+    except OSError:
+        _directory = os.path.join(tempfile.gettempdir(), 'braingrow-versions')
+        os.makedirs(_directory, exist_ok=True)
+    with _lock:
+        _seen.clear()
+    return _directory
+
+
+def _path(name):
+    if _directory is None:
+        configure_versions(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'versions'))
+    return os.path.join(_directory, f'{name}.version')
+
+
+def _read(name):
+    try:
+        with open(_path(name), 'r', encoding='ascii') as f:
+            return f.read().strip() or '0'
+    except FileNotFoundError:
+        return '0'
+
+
+def current_version(name, fresh=False):
+    """Return the stamp for name; fresh=True skips the per-process check interval."""
+    now = time.monotonic()
+    with _lock:
+        entry = _seen.get(name)
+        if not fresh and entry and now - entry[1] < CHECK_INTERVAL:
+            return entry[0]
+    version = _read(name)
+    with _lock:
+        _seen[name] = (version, now)
+    return version
+
+
+def bump_version(name):
+    """Publish a new version stamp for name and return it."""
+    version = f'{time.time_ns()}-{os.getpid()}'
+    path = _path(name)
+    tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp, 'w', encoding='ascii') as f:
+        f.write(version)
+    os.replace(tmp, path)
+    with _lock:
+        _seen[name] = (version, time.monotonic())
+    return version
@@ -0,0 +1,62 @@
+"""
+Read-through cache of immutable video records for getVideoById.
+
+Records hold the catalog fields of a video (not the like/dislike/comment
+counters, which change on every click and are read separately). The cache is an
+LRU bounded by VIDEO_CACHE_SIZE and is dropped whenever the 'catalog' version
+from versions.py changes, which every catalog writer bumps. A hit costs no
+database access.
+"""
+
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+from versions import current_version
+
+CATALOG_VERSION = 'catalog'
+
+VideoRecord = namedtuple('VideoRecord', [
+    'id', 'title', 'description', 'url', 'tags', 'imageUrl', 'board', 'topic', 'duration',
+])
+
+
+class VideoCache:
+    def __init__(self, max_size=2048):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+        self._version = None
+
+    def get(self, video_id, loader):
+        """Return the cached record for video_id, calling loader(video_id) on a miss."""
+        version = current_version(CATALOG_VERSION)
+        with self._lock:
+            if version != self._version:
+                self._items.clear()
+                self._version = version
+            record = self._items.get(video_id)
+            if record is not None:
+                self._items.move_to_end(video_id)
+                return record
+        record = loader(video_id)
+        if record is not None:
+            with self._lock:
+                # Skip the insert if the catalog changed while we were loading
+                if self._version == version:
+                    self._items[video_id] = record
+                    if len(self._items) > self.max_size:
+                        self._items.popitem(last=False)
+        return record
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+try:
+    _cache_size = int(os.getenv('VIDEO_CACHE_SIZE', '2048'))
+except ValueError:
+    _cache_size = 2048
+
+video_cache = VideoCache(_cache_size)
@@ -5,13 +5,18 @@ try:
   # google-api-core may not always be installed, so guard import
   from google.api_core.exceptions import PermissionDenied, Unauthenticated
 except Exception:  # pragma: no cover - optional import
-  PermissionDenied = type("PermissionDenied", (), {})
-  Unauthenticated = type("Unauthenticated", (), {})
+  PermissionDenied = type("PermissionDenied", (Exception,), {})
+  Unauthenticated = type("Unauthenticated", (Exception,), {})
 
 import os
 import re
+import json
 import time
+import itertools
 import mimetypes
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 
 class VertexAICredentialsError(RuntimeError):
     """Raised when Google credentials are missing or lack permissions."""
@@ -19,26 +24,212 @@ class VertexAICredentialsError(RuntimeError):
 class TranscriptUnavailableError(RuntimeError):
     """Raised when a YouTube transcript is unavailable for the video."""
 
-def ask_AI(video_url, question, history=None):
-  start_time = time.perf_counter()
-  print(f"[+{time.perf_counter() - start_time:.3f}s] Asking AI...")
+# Videos at least this long are sent at a reduced frame rate and media resolution
+LONG_VIDEO_SECONDS = int(os.getenv("AI_LONG_VIDEO_SECONDS", "1200"))
+LONG_VIDEO_FPS = float(os.getenv("AI_LONG_VIDEO_FPS", "0.25"))
+# Seconds of context kept around a single timestamp mentioned in a question
+CLIP_PADDING_SECONDS = int(os.getenv("AI_CLIP_PADDING_SECONDS", "30"))
 
-  client = genai.Client(
-      vertexai=True,
-      project=os.getenv("GOOGLE_CLOUD_PROJECT", "braingrowai"),
-      location="global",
-  )
-    
-  video1 = types.Part.from_uri(
+# Missing durations are probed from the YouTube watch page in the background (0 disables)
+DURATION_PROBE = os.getenv("AI_DURATION_PROBE", "1") != "0"
+
+# video_url -> duration in seconds (None while probing or when the probe failed); shared by all requests
+_video_durations = {}
+_video_durations_lock = threading.Lock()
+# One thread is plenty: each URL is probed at most once per process
+_duration_probes = ThreadPoolExecutor(max_workers=1, thread_name_prefix="duration-probe")
+
+_TIMESTAMP_RE = re.compile(r"\b(?:(\d{1,2}):)?(\d{1,2}):(\d{2})\b")
+_LENGTH_SECONDS_RE = re.compile(r'"lengthSeconds"\s*:\s*"(\d+)"')
+
+
+def parse_timestamp(value):
+  """Convert 90, "90", "90s", "1:30" or "01:01:30" into seconds; None when unparseable."""
+  if value is None or isinstance(value, bool):
+    return None
+  if isinstance(value, (int, float)):
+    return float(value) if value >= 0 else None
+  text = str(value).strip().lower()
+  if text.endswith("s"):
+    text = text[:-1]
+  if not text:
+    return None
+  try:
+    seconds = 0.0
+    for part in text.split(":"):
+      seconds = seconds * 60 + float(part)
+    return seconds if seconds >= 0 else None
+  except ValueError:
+    return None
+
+
+def infer_clip_from_question(question, padding=CLIP_PADDING_SECONDS):
+  """Find mm:ss / hh:mm:ss references in a question and return a (start, end) window.
+
+  Two or more timestamps span from the earliest to the latest; a single timestamp
+  is padded on both sides. Returns None when the question has no timestamps.
+  """
+  stamps = []
+  for hours, minutes, seconds in _TIMESTAMP_RE.findall(question or ""):
+    if int(seconds) >= 60 or (hours and int(minutes) >= 60):
+      continue
+    stamps.append(int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds))
+  if not stamps:
+    return None
+  if len(stamps) == 1:
+    return (max(0, stamps[0] - padding), stamps[0] + padding)
+  return (min(stamps), max(stamps))
+
+
+def infer_shared_clip(questions, padding=CLIP_PADDING_SECONDS):
+  """The window every question refers to, or None when any question lacks one or they differ.
+
+  A batch shares one video part, so a timestamp in one question must not narrow
+  the footage the other questions are answered from.
+  """
+  clips = {infer_clip_from_question(q, padding) for q in questions}
+  return clips.pop() if len(clips) == 1 else None
+
+
+def remember_video_duration(video_url, seconds):
+  with _video_durations_lock:
+    _video_durations[video_url] = seconds
+
+
+def get_video_duration(video_url):
+  """Return the duration this process knows for a video in seconds, or None. Never blocks on the network."""
+  with _video_durations_lock:
+    return _video_durations.get(video_url)
+
+
+def _fetch_duration(video_url, timeout):
+  if "youtube.com" not in (video_url or "") and "youtu.be" not in (video_url or ""):
+    return None
+  try:
+    req = urllib.request.Request(video_url, headers={"User-Agent": "Mozilla/5.0"})
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+      match = _LENGTH_SECONDS_RE.search(resp.read().decode("utf-8", "ignore"))
+    return int(match.group(1)) if match else None
+  except Exception as e:
+    print(f"Could not probe duration for {video_url}: {e}")
+    return None
+
+
+def _probe_duration(video_url, timeout, on_result):
+  seconds = _fetch_duration(video_url, timeout)
+  remember_video_duration(video_url, seconds)
+  if seconds and on_result:
+    try:
+      on_result(seconds)
+    except Exception as e:
+      print(f"Could not store duration for {video_url}: {e}")
+
+
+def probe_video_duration(video_url, on_result=None, timeout=3.0):
+  """Look up a video's duration off the request path, once per URL.
+
+  on_result(seconds) is called from the probe thread when a duration is found.
+  A failed probe is remembered as None, so the watch page is not fetched again
+  for every question. Callers use the default frame rate until a duration is known.
+  """
+  if not DURATION_PROBE or not video_url:
+    return
+  with _video_durations_lock:
+    if video_url in _video_durations:
+      return
+    _video_durations[video_url] = None
+  _duration_probes.submit(_probe_duration, video_url, timeout, on_result)
+
+
+def normalize_clip(clip, duration=None):
+  """Clamp a (start, end) pair to the video; None when it does not describe a usable range."""
+  if not clip:
+    return None
+  start, end = clip
+  start = max(0.0, float(start or 0))
+  if end is None:
+    end = duration
+  if end is None:
+    return None
+  end = float(end)
+  if duration:
+    end = min(end, float(duration))
+  if end <= start:
+    return None
+  return (start, end)
+
+
+def build_video_part(video_url, clip=None, duration=None):
+  """Build the video Part, scoped to a clip and down-sampled for long videos.
+
+  Returns (part, is_long) where is_long tells the caller to request a lower
+  media resolution for the whole generation.
+  """
+  part = types.Part.from_uri(
       file_uri=video_url,
       mime_type="video/*",
   )
-  
-  print(f"[+{time.perf_counter() - start_time:.3f}s] Client created")
-  model = "gemini-2.5-flash-lite"
-  contents = []
+  span = (clip[1] - clip[0]) if clip else duration
+  is_long = bool(span and span >= LONG_VIDEO_SECONDS)
+  metadata = {}
+  if clip:
+    metadata["start_offset"] = f"{int(clip[0])}s"
+    metadata["end_offset"] = f"{int(round(clip[1]))}s"
+  if is_long:
+    metadata["fps"] = LONG_VIDEO_FPS
+  if metadata:
+    part.video_metadata = types.VideoMetadata(**metadata)
+  return part, is_long
+
+
+def _format_clock(seconds):
+  seconds = int(seconds)
+  if seconds >= 3600:
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+  return f"{seconds // 60}:{seconds % 60:02d}"
+
+
+MODEL_NAME = "gemini-2.5-flash-lite"
+
+SYSTEM_PROMPT = (
+  "You are an AI assistant that helps people learn and understand educational videos. "
+  "You will be provided with a video, and then a question about the video. "
+  "Answer the question as best you can based on the content of the video. "
+)
+
+
+_CREDENTIAL_ERRORS = (DefaultCredentialsError, PermissionDenied, Unauthenticated)
+
 
-  # Replay history
+def _make_client():
+  try:
+    return genai.Client(
+        vertexai=True,
+        project=os.getenv("GOOGLE_CLOUD_PROJECT", "braingrowai"),
+        location="global",
+    )
+  except _CREDENTIAL_ERRORS as e:
+    raise VertexAICredentialsError(str(e)) from e
+
+
+def _open_stream(stream):
+  """Send the request and wait for the first chunk, so setup errors raise before any output.
+
+  generate_content_stream is lazy; without this a missing credential would only
+  surface mid-iteration, after a streaming response has already sent its status.
+  """
+  try:
+    first = next(stream)
+  except StopIteration:
+    return iter(())
+  except _CREDENTIAL_ERRORS as e:
+    raise VertexAICredentialsError(str(e)) from e
+  return itertools.chain([first], stream)
+
+
+def _history_contents(history):
+  """Replay stored {role, text} turns as Content objects."""
+  contents = []
   for turn in (history or []):
     try:
       role = turn.get("role", "user")
@@ -54,28 +245,40 @@ def ask_AI(video_url, question, history=None):
         parts=[types.Part.from_text(text=text)]
       )
     )
+  return contents
+
 
+def _build_contents(video_part, clip, history, prompt_parts):
+  """History, then the video (first ask or clip-scoped ask), then the prompt parts."""
+  contents = _history_contents(history)
   if not history:
     contents.append(
       types.Content(
         role="user",
-        parts=[video1,
-               types.Part.from_text(text=(
-                 "You are an AI assistant that helps people learn and understand educational videos. "
-                 "You will be provided with a video, and then a question about the video. "
-                 "Answer the question as best you can based on the content of the video. "
-               ))]
+        parts=[video_part, types.Part.from_text(text=SYSTEM_PROMPT)]
       )
     )
     print("First ask")
+  prompt_parts = list(prompt_parts)
+  if clip:
+    # Follow-up turns normally rely on history alone; a clip question needs its footage
+    if history:
+      prompt_parts.insert(0, video_part)
+    prompt_parts.insert(0, types.Part.from_text(text=(
+      f"The attached footage is the segment from {_format_clock(clip[0])} "
+      f"to {_format_clock(clip[1])} of the video."
+    )))
   contents.append(
     types.Content(
       role="user",
-      parts=[types.Part.from_text(text=question)]
+      parts=prompt_parts
     )
   )
+  return contents
+
 
-  generate_content_config = types.GenerateContentConfig(
+def _generation_config(is_long, **overrides):
+  return types.GenerateContentConfig(
     temperature = 1,
     top_p = 0.95,
     max_output_tokens = 65535,
@@ -95,13 +298,144 @@ def ask_AI(video_url, question, history=None):
     thinking_config=types.ThinkingConfig(
       thinking_budget=0,
     ),
+    media_resolution=types.MediaResolution.MEDIA_RESOLUTION_LOW if is_long else None,
+    **overrides,
   )
+
+
+def _prepare_video(video_url, clip, duration):
+  if duration is None:
+    duration = get_video_duration(video_url)
+  clip = normalize_clip(clip, duration)
+  video_part, is_long = build_video_part(video_url, clip=clip, duration=duration)
+  return video_part, clip, is_long
+
+
+def ask_AI(video_url, question, history=None, clip=None, duration=None):
+  """Ask Gemini a question about a video.
+
+  clip is an optional (start, end) range in seconds; when omitted it is inferred
+  from timestamps in the question. Only that clip is attached to the request.
+  duration (seconds) is looked up from the per-video cache when not supplied.
+  """
+  start_time = time.perf_counter()
+  print(f"[+{time.perf_counter() - start_time:.3f}s] Asking AI...")
+
+  client = _make_client()
+  if clip is None:
+    clip = infer_clip_from_question(question)
+  video1, clip, is_long = _prepare_video(video_url, clip, duration)
+
+  print(f"[+{time.perf_counter() - start_time:.3f}s] Client created")
+  contents = _build_contents(video1, clip, history, [types.Part.from_text(text=question)])
+  generate_content_config = _generation_config(is_long)
+
   response_text = ""
   print(f"[+{time.perf_counter() - start_time:.3f}s] config created")
-  for chunk in client.models.generate_content_stream(
-      model = model,
+  for chunk in _open_stream(client.models.generate_content_stream(
+      model = MODEL_NAME,
       contents = contents,
       config = generate_content_config,
-      ):
+      )):
       response_text += chunk.text or ""
-  return response_text
\ No newline at end of file
+  return response_text
+
+
+_BATCH_RESPONSE_SCHEMA = {
+  "type": "ARRAY",
+  "items": {
+    "type": "OBJECT",
+    "properties": {
+      "index": {"type": "INTEGER"},
+      "answer": {"type": "STRING"},
+    },
+    "required": ["index", "answer"],
+    "propertyOrdering": ["index", "answer"],
+  },
+}
+
+
+def _iter_json_array_items(text_chunks):
+  """Yield each element of a streamed top-level JSON array as soon as it is complete."""
+  decoder = json.JSONDecoder()
+  buffer = ""
+  pos = 0
+  started = False
+  for chunk in text_chunks:
+    buffer += chunk or ""
+    while True:
+      while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+        pos += 1
+      if pos >= len(buffer):
+        break
+      if not started:
+        if buffer[pos] != "[":
+          raise ValueError("Expected a JSON array from the model")
+        started = True
+        pos += 1
+        continue
+      if buffer[pos] == "]":
+        return
+      try:
+        item, end = decoder.raw_decode(buffer, pos)
+      except json.JSONDecodeError:
+        break  # element still incomplete; wait for more text
+      yield item
+      pos = end
+    # Drop consumed text so the buffer only holds the element in progress
+    buffer = buffer[pos:]
+    pos = 0
+
+
+def ask_AI_batch(video_url, questions, history=None, clip=None, duration=None):
+  """Answer several questions about one video in a single model request.
+
+  The video part and history are sent once. Without an explicit clip, the
+  footage is narrowed only when every question points at the same window;
+  otherwise the full video is attached. Returns an iterator of (index, answer)
+  pairs that yields as each answer completes in the streamed structured
+  output; indexes refer to positions in questions. The request is sent before
+  this returns, so credential and configuration errors raise here, not while
+  iterating.
+  """
+  start_time = time.perf_counter()
+  print(f"[+{time.perf_counter() - start_time:.3f}s] Asking AI (batch of {len(questions)})...")
+
+  client = _make_client()
+  if clip is None:
+    clip = infer_shared_clip(questions)
+  video1, clip, is_long = _prepare_video(video_url, clip, duration)
+
+  numbered = "\n".join(f"{i}. {q}" for i, q in enumerate(questions))
+  prompt = (
+    "Answer each of the following questions separately. Return a JSON array with one "
+    "object per question, in order, where index is the question number and answer is "
+    "the full answer text.\n\n" + numbered
+  )
+  contents = _build_contents(video1, clip, history, [types.Part.from_text(text=prompt)])
+  generate_content_config = _generation_config(
+    is_long,
+    response_mime_type="application/json",
+    response_schema=_BATCH_RESPONSE_SCHEMA,
+  )
+
+  print(f"[+{time.perf_counter() - start_time:.3f}s] config created")
+  stream = _open_stream(client.models.generate_content_stream(
+      model = MODEL_NAME,
+      contents = contents,
+      config = generate_content_config,
+  ))
+  return _iter_batch_answers(stream, len(questions))
+
+
+def _iter_batch_answers(stream, count):
+  seen = set()
+  for item in _iter_json_array_items(chunk.text for chunk in stream):
+    try:
+      index = int(item.get("index"))
+    except (AttributeError, TypeError, ValueError):
+      continue
+    if index in seen or not 0 <= index < count:
+      continue
+    seen.add(index)
+    yield index, item.get("answer") or ""
@@ -0,0 +1,80 @@
+"""
+Write-behind buffer for watch-progress heartbeats.
+
+The player reports progress many times per viewing. Instead of one INSERT and
+commit per heartbeat, the buffer keeps the latest sample per
+(user_id, video_id, session_id) in memory and a background task flushes them as
+one batched upsert every WATCH_FLUSH_SECONDS (and at shutdown). Each viewing
+session maps to a single watch_histories row; progress only moves forward.
+
+WATCH_BUFFER=0 disables buffering and writes each heartbeat straight through.
+"""
+
+import os
+import threading
+from datetime import datetime
+
+from background import PeriodicTask
+from models import upsertWatchProgress
+
+_buffer = None
+
+
+class WatchProgressBuffer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def record(self, user_id, video_id, session_id, progress=None, focus_sample=None):
+        key = (user_id, video_id, session_id)
+        now = datetime.utcnow()
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry is None:
+                self._pending[key] = {
+                    'user_id': user_id, 'video_id': video_id, 'session_id': session_id,
+                    'progress': progress, 'focus_sample': focus_sample, 'watched_at': now,
+                }
+                return
+            if progress is not None:
+                entry['progress'] = progress if entry['progress'] is None else max(entry['progress'], progress)
+            if focus_sample is not None:
+                entry['focus_sample'] = focus_sample
+            entry['watched_at'] = now
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """Upsert everything buffered so far; entries are re-queued if the write fails."""
+        with self._lock:
+            entries, self._pending = list(self._pending.values()), {}
+        if not entries:
+            return 0
+        written = upsertWatchProgress(entries)
+        if not written:
+            with self._lock:
+                for entry in entries:
+                    key = (entry['user_id'], entry['video_id'], entry['session_id'])
+                    # Newer heartbeats recorded during the flush win
+                    self._pending.setdefault(key, entry)
+        return written
+
+
+def start_watch_buffer(app):
+    """Create the per-process buffer and its flush task unless WATCH_BUFFER=0."""
+    global _buffer
+    if os.getenv('WATCH_BUFFER', '1') == '0' or _buffer is not None:
+        return _buffer
+    try:
+        interval = float(os.getenv('WATCH_FLUSH_SECONDS', '5'))
+    except ValueError:
+        interval = 5.0
+    _buffer = WatchProgressBuffer()
+    PeriodicTask(app, 'watch-progress-flush', interval, _buffer.flush).start()
+    return _buffer
+
+
+def get_watch_buffer():
+    return _buffer
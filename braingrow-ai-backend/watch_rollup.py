@@ -0,0 +1,107 @@
+"""
+Watch-history retention: roll raw events older than N days into daily aggregates.
+
+compact_watch_history() works through old watch_histories rows in id order, one
+chunk per transaction: it deletes the chunk and merges it into
+watch_history_rollups (max progress, focus sum/count, event count per
+user/video/day). getUserWatchHistory merges rollups with the remaining raw rows
+in SQL, so readers see one entry per day for old activity.
+
+Run it from `python compact_history.py`, or set WATCH_ROLLUP_INTERVAL_HOURS to
+run it in the background of each app process.
+"""
+
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from background import PeriodicTask
+from models import db, WatchHistory, WatchHistoryRollup
+
+DEFAULT_RETENTION_DAYS = 30
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def _rollup_upsert():
+    table = WatchHistoryRollup.__table__
+    stmt = sqlite_insert(table)
+    return stmt.on_conflict_do_update(
+        index_elements=['user_id', 'video_id', 'day'],
+        set_={
+            'max_progress': func.max(func.coalesce(table.c.max_progress, stmt.excluded.max_progress),
+                                     func.coalesce(stmt.excluded.max_progress, table.c.max_progress)),
+            'focus_sum': table.c.focus_sum + stmt.excluded.focus_sum,
+            'focus_count': table.c.focus_count + stmt.excluded.focus_count,
+            'event_count': table.c.event_count + stmt.excluded.event_count,
+        },
+    )
+
+
+def _aggregate(rows):
+    groups = {}
+    for row in rows:
+        key = (row.user_id, row.video_id, row.watched_at.date())
+        g = groups.setdefault(key, {
+            'user_id': key[0], 'video_id': key[1], 'day': key[2],
+            'max_progress': None, 'focus_sum': 0.0, 'focus_count': 0, 'event_count': 0,
+        })
+        if row.progress is not None:
+            g['max_progress'] = row.progress if g['max_progress'] is None else max(g['max_progress'], row.progress)
+        if row.focus_sample is not None:
+            g['focus_sum'] += row.focus_sample
+            g['focus_count'] += 1
+        g['event_count'] += 1
+    return list(groups.values())
+
+
+def compact_watch_history(older_than_days=DEFAULT_RETENTION_DAYS, chunk_size=DEFAULT_CHUNK_SIZE, max_chunks=None):
+    """Roll raw events older than the cutoff into daily rollups. Returns (events, rollup rows) written."""
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    table = WatchHistory.__table__
+    total_events = total_groups = chunks = 0
+    last_id = 0
+    while max_chunks is None or chunks < max_chunks:
+        rows = db.session.execute(
+            db.select(table.c.id, table.c.user_id, table.c.video_id, table.c.watched_at,
+                      table.c.progress, table.c.focus_sample)
+            .where(table.c.watched_at < cutoff, table.c.id > last_id)
+            .order_by(table.c.id)
+            .limit(chunk_size)
+        ).all()
+        if not rows:
+            break
+        ids = [r.id for r in rows]
+        last_id = ids[-1]
+        try:
+            # Delete first: if another process compacted these rows already, the
+            # rowcount differs and the chunk is skipped instead of counted twice.
+            deleted = db.session.execute(table.delete().where(table.c.id.in_(ids))).rowcount
+            if deleted != len(ids):
+                db.session.rollback()
+                continue
+            groups = _aggregate(rows)
+            db.session.execute(_rollup_upsert(), groups)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error compacting watch history chunk ending at id {last_id}: {e}")
+            raise
+        total_events += len(ids)
+        total_groups += len(groups)
+        chunks += 1
+    return total_events, total_groups
+
+
+def start_watch_rollup(app):
+    """Run compaction periodically when WATCH_ROLLUP_INTERVAL_HOURS is set."""
+    try:
+        hours = float(os.getenv('WATCH_ROLLUP_INTERVAL_HOURS', '0'))
+        days = int(os.getenv('WATCH_RETENTION_DAYS', DEFAULT_RETENTION_DAYS))
+    except ValueError:
+        return None
+    if hours <= 0:
+        return None
+    return PeriodicTask(app, 'watch-history-rollup', hours * 3600,
+                        lambda: compact_watch_history(days), run_at_exit=False).start()
@@ -0,0 +1,130 @@
+"""
+Optional single-writer executor for SQLite writes.
+
+With DB_WRITE_EXECUTOR=1 each process runs one writer thread. Write helpers in
+models.py submit an "apply" function (session changes, no commit); the writer
+collects whatever arrives within a short window, runs the whole group in one
+transaction with a single commit, and resolves each caller's Future. If the
+group fails, every job is retried in its own transaction so one bad write only
+fails its own request.
+
+Returned ORM objects are flushed and expunged before the commit, so callers can
+read their attributes (including generated ids) from the request thread.
+"""
+
+import atexit
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from models import db
+
+_executor = None
+
+
+class WriteExecutor:
+    def __init__(self, app, batch_window_ms=5, max_batch=200, result_timeout=30.0):
+        self.app = app
+        self.batch_window = batch_window_ms / 1000.0
+        self.max_batch = max_batch
+        self.result_timeout = result_timeout
+        self._queue = queue.Queue()
+        self._thread = None
+        self._stopping = False
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='sqlite-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+        return self
+
+    def stop(self, timeout=5.0):
+        if self._thread is None or self._stopping:
+            return
+        self._stopping = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def submit(self, fn, *args, **kwargs):
+        if self._stopping:
+            raise RuntimeError('Write executor is stopped')
+        future = Future()
+        self._queue.put((fn, args, kwargs, future))
+        return future
+
+    def run(self, fn, *args, **kwargs):
+        """Submit and block until the write is committed; returns fn's result."""
+        return self.submit(fn, *args, **kwargs).result(timeout=self.result_timeout)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            batch = [job]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    job = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if job is None:
+                    self._apply_batch(batch)
+                    return
+                batch.append(job)
+            self._apply_batch(batch)
+
+    def _apply_batch(self, batch):
+        with self.app.app_context():
+            try:
+                results = [self._apply(fn, args, kwargs) for fn, args, kwargs, _ in batch]
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                results = None
+                if len(batch) > 1:
+                    print(f"Write batch of {len(batch)} failed; retrying individually")
+            if results is not None:
+                for (_, _, _, future), result in zip(batch, results):
+                    future.set_result(result)
+                return
+            for fn, args, kwargs, future in batch:
+                try:
+                    result = self._apply(fn, args, kwargs)
+                    db.session.commit()
+                    future.set_result(result)
+                except Exception as e:
+                    db.session.rollback()
+                    future.set_exception(e)
+
+    @staticmethod
+    def _apply(fn, args, kwargs):
+        result = fn(*args, **kwargs)
+        db.session.flush()
+        # Detach returned rows so their loaded state survives the commit
+        if isinstance(result, db.Model) and result in db.session:
+            db.session.expunge(result)
+        return result
+
+
+def start_write_executor(app):
+    """Start the per-process writer when DB_WRITE_EXECUTOR=1; returns it or None."""
+    global _executor
+    if os.getenv('DB_WRITE_EXECUTOR') != '1' or _executor is not None:
+        return _executor
+    try:
+        window = float(os.getenv('DB_WRITE_BATCH_MS', '5'))
+    except ValueError:
+        window = 5.0
+    _executor = WriteExecutor(app, batch_window_ms=window).start()
+    return _executor
+
+
+def get_write_executor():
+    return _executor
@@ -169,7 +169,7 @@ export const getRecommandVideo = async(maxVideo: number = 10): Promise<video[]>
     category: item.category,
     views: item.viewCount,
     url: item.videoUrl,
-    coverUrl: new URL(item.imageUrl, ABS_BASE).href
+    coverUrl: item.thumbUrl ? toBackendAbsoluteUrl(item.thumbUrl) : new URL(item.imageUrl, ABS_BASE).href
   }));
 }
 
@@ -188,7 +188,7 @@ export const search = async (query: string, maxVideo: number = 10): Promise<vide
     category: item.category,
     views: item.viewCount,
     url: item.url,
-    coverUrl: new URL(item.imageUrl, ABS_BASE).href
+    coverUrl: item.thumbUrl ? toBackendAbsoluteUrl(item.thumbUrl) : new URL(item.imageUrl, ABS_BASE).href
   }));
 };
 